@@ -0,0 +1,500 @@
+"""Benchmarks for v2.py without a Docker host or a Discord token.
+
+Builds a synthetic registry, serves a fake Docker Engine API with
+configurable latencies on a unix socket, and drives the command handlers
+with mock interactions. Reports p50/p99 per scenario and dataset size.
+
+    python3 bench.py                                  # 10, 1000 and 10000 VPSes
+    python3 bench.py --sizes 10,100000 --max-seconds 60
+    python3 bench.py --latency stats=0.02,create=0.5
+    python3 bench.py --save-baseline bench_baseline.json
+    python3 bench.py --compare bench_baseline.json    # exits 1 on a regression
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import urllib.parse
+from datetime import datetime, timezone
+
+DEFAULT_SIZES = (10, 1000, 10000)
+DEFAULT_LATENCIES = {  # seconds the fake engine waits before answering, per operation
+    "default": 0.001,
+    "list": 0.005,
+    "stats": 0.01,
+    "create": 0.05,
+    "start": 0.05,
+    "stop": 0.05,
+    "remove": 0.02,
+    "exec": 0.005
+}
+RUNNING_RATIO = 0.8  # share of synthetic containers that are running
+SERVERS_PER_USER = 3
+FAKE_SSH = "ssh bench@nyc1.tmate.io"
+
+# v2 writes its state files (audit log, registry) to the working directory,
+# so move into a scratch directory first
+WORKDIR = tempfile.mkdtemp(prefix="dp-vps-bench-")
+REPO = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, REPO)
+os.chdir(WORKDIR)
+import v2  # noqa: E402
+
+# Fake Docker Engine
+class FakeDockerEngine:
+    def __init__(self, latencies):
+        self.latencies = latencies
+        self.containers = {}  # name -> {"Id", "State", "Labels"}
+        self.execs = {}
+        self.requests = 0
+
+    def add(self, name, state="running", labels=None):
+        self.containers[name] = {"Id": f"{len(self.containers):064x}", "State": state, "Labels": labels or {}}
+
+    async def serve(self, socket_path):
+        return await asyncio.start_unix_server(self.handle, socket_path, limit=2 ** 20)
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+                    return
+                request_line, *header_lines = head.decode("latin-1").split("\r\n")
+                method, url, _ = request_line.split(" ", 2)
+                headers = {}
+                for line in header_lines:
+                    if ":" in line:
+                        key, value = line.split(":", 1)
+                        headers[key.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", 0))
+                body = json.loads(await reader.readexactly(length)) if length else None
+                parsed = urllib.parse.urlsplit(url)
+                path = [urllib.parse.unquote(p) for p in parsed.path.split("/")[2:]]
+                query = dict(urllib.parse.parse_qsl(parsed.query))
+                self.requests += 1
+                if not await self.dispatch(method, path, query, body, reader, writer):
+                    return
+        finally:
+            writer.close()
+
+    def send(self, writer, status, payload=None):
+        data = b"" if payload is None else json.dumps(payload).encode()
+        writer.write(f"HTTP/1.1 {status} X\r\nContent-Type: application/json\r\n"
+                     f"Content-Length: {len(data)}\r\n\r\n".encode() + data)
+
+    async def delay(self, op):
+        await asyncio.sleep(self.latencies.get(op, self.latencies["default"]))
+
+    async def dispatch(self, method, path, query, body, reader, writer):
+        """Answer one request; returns False once the connection has been taken over"""
+        if path == ["_ping"]:
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nOK")
+        elif path == ["info"]:
+            await self.delay("default")
+            self.send(writer, 200, {"MemTotal": 512 * 2 ** 30, "NCPU": 64})
+        elif path == ["events"]:
+            # Hold the stream open without events until the client goes away
+            writer.write(b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n")
+            await writer.drain()
+            while await reader.read(4096):
+                pass
+            return False
+        elif path == ["containers", "json"]:
+            await self.delay("list")
+            filters = json.loads(query.get("filters", "{}"))
+            names = filters.get("name", [])
+            self.send(writer, 200, [
+                {"Id": c["Id"], "Names": [f"/{name}"], "State": c["State"], "Labels": c["Labels"]}
+                for name, c in self.containers.items()
+                if all(n in name for n in names)
+            ])
+        elif path == ["containers", "create"]:
+            await self.delay("create")
+            self.add(query["name"], state="created", labels=(body or {}).get("Labels"))
+            self.send(writer, 201, {"Id": self.containers[query["name"]]["Id"]})
+        elif path[0] == "containers" and len(path) >= 2:
+            return await self.container_op(method, path[1], path[2:], query, body, writer)
+        elif path[0] == "exec" and len(path) == 3 and path[2] == "start":
+            await self.delay("exec")
+            output = self.execs.pop(path[1], b"")
+            writer.write(b"HTTP/1.1 101 UPGRADED\r\nContent-Type: application/vnd.docker.multiplexed-stream\r\n"
+                         b"Connection: Upgrade\r\nUpgrade: tcp\r\n\r\n")
+            if output:
+                writer.write(bytes([1, 0, 0, 0]) + len(output).to_bytes(4, "big") + output)
+            await writer.drain()
+            return False
+        elif path[0] == "exec" and len(path) == 3 and path[2] == "json":
+            self.send(writer, 200, {"ExitCode": 0, "Running": False, "Pid": 0})
+        elif path[0] == "images" and path[-1] == "json":
+            # Every catalogued VPS image is already built
+            self.send(writer, 200, {"Id": "sha256:" + "0" * 64})
+        else:
+            self.send(writer, 404, {"message": f"page not found: {'/'.join(path)}"})
+        await writer.drain()
+        return True
+
+    async def container_op(self, method, name, action, query, body, writer):
+        container = self.containers.get(name) or next(
+            (c for c in self.containers.values() if c["Id"] == name), None)
+        if container is None:
+            self.send(writer, 404, {"message": f"No such container: {name}"})
+        elif method == "DELETE":
+            await self.delay("remove")
+            del self.containers[name]
+            self.send(writer, 204)
+        elif action == ["json"]:
+            await self.delay("default")
+            self.send(writer, 200, {"Id": container["Id"], "Name": f"/{name}",
+                                    "State": {"Status": container["State"], "Running": container["State"] == "running"}})
+        elif action == ["stats"]:
+            await self.delay("stats")
+            self.send(writer, 200, {
+                "memory_stats": {"usage": random.randint(50, 900) * 2 ** 20, "limit": 2 * 2 ** 30,
+                                 "stats": {"inactive_file": 10 * 2 ** 20}},
+                "cpu_stats": {"cpu_usage": {"total_usage": int(time.monotonic() * 1e7)},
+                              "system_cpu_usage": int(time.monotonic() * 1e9), "online_cpus": 4}
+            })
+        elif action in (["start"], ["restart"], ["unpause"]):
+            await self.delay("start")
+            container["State"] = "running"
+            self.send(writer, 204)
+        elif action == ["stop"]:
+            await self.delay("stop")
+            container["State"] = "exited"
+            self.send(writer, 204)
+        elif action == ["update"]:
+            await self.delay("default")
+            self.send(writer, 200, {"Warnings": []})
+        elif action == ["rename"]:
+            await self.delay("default")
+            self.containers[query["name"]] = self.containers.pop(name)
+            self.send(writer, 204)
+        elif action == ["exec"]:
+            await self.delay("exec")
+            exec_id = f"{random.getrandbits(128):032x}"
+            command = body.get("Cmd", [])
+            if command[:2] == ["sh", "-c"] and command[3:4] == ["sh"]:
+                command = command[5:]  # v2 wraps execs to record their PID in a pidfile
+            if "display" in command:
+                self.execs[exec_id] = FAKE_SSH.encode() + b"\n"
+            elif command[:2] == ["systemctl", "is-system-running"]:
+                self.execs[exec_id] = b"running\n"
+            self.send(writer, 201, {"Id": exec_id})
+        else:
+            self.send(writer, 404, {"message": f"page not found: {'/'.join(action)}"})
+        await writer.drain()
+        return True
+
+# Mock Discord objects
+class MockUser:
+    def __init__(self, user_id, name="bench"):
+        self.id = user_id
+        self.name = name
+        self.display_name = name
+        self.mention = f"<@{user_id}>"
+        self.avatar = None
+
+    def __str__(self):
+        return self.name
+
+    async def send(self, *args, **kwargs):
+        return MockMessage()
+
+class MockMessage:
+    async def edit(self, *args, **kwargs):
+        return self
+
+class MockResponse:
+    def __init__(self):
+        self.done = False
+
+    def is_done(self):
+        return self.done
+
+    async def defer(self, *args, **kwargs):
+        self.done = True
+
+    async def send_message(self, *args, **kwargs):
+        self.done = True
+
+    async def edit_message(self, *args, **kwargs):
+        self.done = True
+
+    async def send_modal(self, *args, **kwargs):
+        self.done = True
+
+class MockFollowup:
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, *args, **kwargs):
+        self.sent.append(kwargs)
+        return MockMessage()
+
+class MockInteraction:
+    def __init__(self, user):
+        self.user = user
+        self.response = MockResponse()
+        self.followup = MockFollowup()
+        self.data = {}
+        self.created_at = datetime.now(timezone.utc)
+
+    async def edit_original_response(self, *args, **kwargs):
+        return MockMessage()
+
+def callback(command):
+    """The coroutine behind an app command"""
+    return getattr(command, "callback", command)
+
+# Synthetic datasets
+def synthetic_records(count):
+    os_types = ["Ubuntu 22.04", "Debian 12"]
+    records = []
+    for i in range(count):
+        records.append({
+            "user": str(10 ** 17 + i // SERVERS_PER_USER),
+            "container_name": f"VPS_bench{i // SERVERS_PER_USER}_{i:08x}",
+            "ssh_command": FAKE_SSH,
+            "ram": str(random.choice([1, 2, 4, 8])),
+            "cpu": str(random.choice([1, 2, 4])),
+            "creator": "bench",
+            "os_type": os_types[i % len(os_types)],
+            "expiry": None,
+            "node": v2.DEFAULT_NODE,
+            "http_routes": "{}",
+            "hibernation": "",
+            "expired": "",
+            "abuse_stopped": ""
+        })
+    return records
+
+def write_legacy_database(path, records):
+    with open(path, "w") as f:
+        for record in records:
+            f.write(v2.format_database_line(record) + "\n")
+
+# Timing
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered) + 0.5)) - 1))]
+
+async def measure(func, iterations, max_seconds):
+    """Run func until `iterations` samples or `max_seconds` have passed (at least 3 samples)"""
+    samples = []
+    deadline = time.perf_counter() + max_seconds
+    while len(samples) < iterations and (len(samples) < 3 or time.perf_counter() < deadline):
+        started = time.perf_counter()
+        result = func()
+        if asyncio.iscoroutine(result):
+            await result
+        samples.append(time.perf_counter() - started)
+    return {
+        "runs": len(samples),
+        "p50_ms": round(percentile(samples, 0.50) * 1000, 3),
+        "p99_ms": round(percentile(samples, 0.99) * 1000, 3),
+        "mean_ms": round(sum(samples) / len(samples) * 1000, 3)
+    }
+
+class Bench:
+    def __init__(self, size, latencies, iterations, max_seconds):
+        self.size = size
+        self.iterations = iterations
+        self.max_seconds = max_seconds
+        self.engine = FakeDockerEngine(latencies)
+        self.records = synthetic_records(size)
+        self.admin = MockUser(v2.ADMIN_IDS[0], "admin")
+        self.counter = 0
+
+    async def setup(self):
+        directory = tempfile.mkdtemp(dir=WORKDIR)
+        legacy_file = os.path.join(directory, "database.txt")
+        write_legacy_database(legacy_file, self.records)
+
+        # Import the synthetic database.txt into a fresh registry and wire the bot to it
+        started = time.perf_counter()
+        registry = v2.VPSRegistry(os.path.join(directory, "vps.db"), legacy_file=legacy_file)
+        self.import_ms = round((time.perf_counter() - started) * 1000, 3)
+        v2.init(registry)
+
+        for i, record in enumerate(self.records):
+            self.engine.add(record["container_name"], "running" if i < self.size * RUNNING_RATIO else "exited")
+        socket_path = os.path.join(directory, "docker.sock")
+        self.server = await self.engine.serve(socket_path)
+        for node in v2.runtime.nodes.values():
+            node.engine.socket_path = socket_path
+            node.engine.host = None
+            await node.engine.close()
+
+        # Deploys below are cold starts unless a scenario stocks the pool itself
+        v2.warm_pool.sizes = {os_type: 0 for os_type in v2.warm_pool.sizes}
+        v2.placement.node_info.clear()
+        v2.stats_cache.updated_at = None
+        v2.cpu_samples.clear()
+        for task in v2.container_tracker.tasks.values():
+            task.cancel()
+        v2.container_tracker.tasks.clear()
+        v2.container_tracker.start()
+        while not v2.container_tracker.is_following(v2.DEFAULT_NODE):
+            await asyncio.sleep(0.01)
+        await v2.image_catalog.check_all()
+
+    async def teardown(self):
+        tasks = list(v2.container_tracker.tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for node in v2.runtime.nodes.values():
+            await node.engine.close()
+        self.server.close()
+        v2.registry.conn.close()
+
+    def owner(self):
+        return random.choice(self.records)["user"]
+
+    def next_name(self):
+        self.counter += 1
+        return f"VPS_benchdeploy_{self.size}_{self.counter}"
+
+    async def node_stats(self, cached):
+        if not cached:
+            v2.stats_cache.updated_at = None
+        await callback(v2.node_stats)(MockInteraction(self.admin))
+
+    async def myvps(self):
+        owner = self.owner()
+        await callback(v2.myvps)(MockInteraction(MockUser(int(owner))))
+
+    async def nodedmin(self):
+        await callback(v2.nodedmin)(MockInteraction(self.admin))
+
+    async def deploy(self):
+        name = self.next_name()
+        interaction = MockInteraction(self.admin)
+        await v2.deploy_with_os(interaction, "ubuntu", 2, 1, str(self.admin.id), str(self.admin.id), name, None)
+        if name not in v2.registry:
+            raise RuntimeError(f"deploy of {name} failed: {interaction.followup.sent[-1:]}")
+
+    async def deploy_warm(self):
+        pool = v2.warm_pool.ready[(v2.DEFAULT_NODE, "ubuntu")]
+        warm_name = f"{v2.WARM_POOL_PREFIX}ubuntu_{self.counter}"
+        self.engine.add(warm_name, labels={v2.WARM_POOL_LABEL: "ubuntu"})
+        pool.append(warm_name)
+        await self.deploy()
+
+    async def delete(self):
+        name = self.next_name()
+        self.engine.add(name)
+        v2.add_to_database(str(self.admin.id), name, FAKE_SSH, 2, 1, "bench", None, "Ubuntu 22.04", v2.DEFAULT_NODE)
+        view = v2.ConfirmView(name, name)
+        await type(view).confirm_button(view, MockInteraction(self.admin), None)
+        if name in v2.registry:
+            raise RuntimeError(f"delete of {name} failed")
+
+    def scenarios(self):
+        some_container = self.records[0]["container_name"]
+        return {
+            "get_user_servers": lambda: v2.get_user_servers(self.owner()),
+            "get_container_stats": lambda: v2.get_container_stats(some_container),
+            "node_stats": lambda: self.node_stats(cached=False),
+            "node_stats_cached": lambda: self.node_stats(cached=True),
+            "nodedmin": self.nodedmin,
+            "myvps": self.myvps,
+            "deploy_cold": self.deploy,
+            "deploy_warm": self.deploy_warm,
+            "delete": self.delete
+        }
+
+    async def run(self, only=None):
+        await self.setup()
+        results = {"registry_import": {"runs": 1, "p50_ms": self.import_ms, "p99_ms": self.import_ms,
+                                       "mean_ms": self.import_ms}}
+        try:
+            for name, func in self.scenarios().items():
+                if only and name not in only:
+                    continue
+                results[name] = await measure(func, self.iterations, self.max_seconds)
+                print(f"  {name:<22} p50 {results[name]['p50_ms']:>10.3f}ms  p99 {results[name]['p99_ms']:>10.3f}ms"
+                      f"  ({results[name]['runs']} runs)")
+        finally:
+            await self.teardown()
+        return results
+
+def repo_path(path):
+    """Paths on the command line are relative to the repository, not the scratch directory"""
+    return path if os.path.isabs(path) else os.path.join(REPO, path)
+
+def parse_latencies(text):
+    latencies = dict(DEFAULT_LATENCIES)
+    for item in filter(None, (text or "").split(",")):
+        op, _, seconds = item.partition("=")
+        if op not in DEFAULT_LATENCIES:
+            raise SystemExit(f"Unknown latency '{op}', expected one of {', '.join(DEFAULT_LATENCIES)}")
+        latencies[op] = float(seconds)
+    return latencies
+
+def compare(results, baseline, tolerance):
+    """Print p50/p99 against the baseline; returns the regressions beyond tolerance"""
+    regressions = []
+    print(f"\nCompared with baseline (tolerance {tolerance:.0%}):")
+    for key in sorted(results):
+        if key not in baseline:
+            print(f"  {key:<32} new")
+            continue
+        for stat in ("p50_ms", "p99_ms"):
+            old, new = baseline[key][stat], results[key][stat]
+            change = (new - old) / old if old else 0.0
+            flag = ""
+            if change > tolerance:
+                flag = "  REGRESSION"
+                regressions.append((key, stat, old, new))
+            print(f"  {key:<32} {stat} {old:>10.3f} -> {new:>10.3f}ms ({change:+.0%}){flag}")
+    return regressions
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                        help="comma separated registry sizes (10 to 100000)")
+    parser.add_argument("--iterations", type=int, default=50, help="samples per scenario")
+    parser.add_argument("--max-seconds", type=float, default=30, help="time budget per scenario")
+    parser.add_argument("--latency", help="fake engine latencies, e.g. stats=0.02,create=0.5")
+    parser.add_argument("--only", help="comma separated scenarios to run")
+    parser.add_argument("--save-baseline", metavar="PATH", help="write the results as the new baseline")
+    parser.add_argument("--compare", metavar="PATH", help="compare against a saved baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown before a regression")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    latencies = parse_latencies(args.latency)
+    only = set(args.only.split(",")) if args.only else None
+    v2.bot.fetch_user = lambda user_id: asyncio.sleep(0, MockUser(user_id))
+    # Client.user is read from the connection state, which is only filled in on login
+    v2.bot._connection.user = MockUser(0, "SaturnNode")
+
+    results = {}
+    for size in (int(s) for s in args.sizes.split(",")):
+        print(f"{size} VPS rows:")
+        for name, stats in (await Bench(size, latencies, args.iterations, args.max_seconds).run(only)).items():
+            results[f"{name}@{size}"] = stats
+
+    if args.save_baseline:
+        with open(repo_path(args.save_baseline), "w") as f:
+            json.dump({"latencies": latencies, "results": results}, f, indent=2, sort_keys=True)
+        print(f"\nBaseline written to {args.save_baseline}")
+    if args.compare:
+        with open(repo_path(args.compare)) as f:
+            baseline = json.load(f)
+        if baseline.get("latencies") != latencies:
+            print("Warning: the baseline was recorded with different fake engine latencies")
+        if compare(results, baseline["results"], args.tolerance):
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
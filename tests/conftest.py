@@ -0,0 +1,16 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import v2
+
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch):
+    """A fresh registry in a scratch directory, wired up like the bot's"""
+    # v2 writes its state files (audit log, registry) to the working directory
+    monkeypatch.chdir(tmp_path)
+    return v2.init(v2.VPSRegistry(str(tmp_path / "vps.db")))
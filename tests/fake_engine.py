@@ -0,0 +1,60 @@
+import asyncio
+import json
+
+
+# Scripted Docker Engine API on a unix socket: each handler gets the request
+# (method, path, body) and returns the raw response bytes to send back
+class FakeEngine:
+    def __init__(self, socket_path):
+        self.socket_path = socket_path
+        self.handlers = {}  # (method, path without the API version) -> handler
+        self.connections = 0
+        self.requests = []  # (method, path) of every request served
+        self.drop_reused = False  # close a kept-alive connection when its next request arrives
+        self.server = None
+        self.writers = set()
+
+    async def start(self):
+        self.server = await asyncio.start_unix_server(self.handle, self.socket_path)
+
+    async def stop(self):
+        """Stop listening and drop every open connection, like a daemon that went down"""
+        self.server.close()
+        for writer in list(self.writers):
+            writer.close()
+        await self.server.wait_closed()
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        self.writers.add(writer)
+        served = 0
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except asyncio.IncompleteReadError:
+                    return
+                if served and self.drop_reused:
+                    return
+                request_line, *header_lines = head.decode().split("\r\n")
+                method, url = request_line.split(" ")[:2]
+                length = next((int(line.split(":", 1)[1]) for line in header_lines
+                               if line.lower().startswith("content-length:")), 0)
+                body = await reader.readexactly(length)
+                path = "/" + url.split("?")[0].split("/", 2)[2]
+                self.requests.append((method, path))
+                response = self.handlers[method, path](method, path, body)
+                writer.write(response)
+                await writer.drain()
+                if response.startswith(b"HTTP/1.1 101"):
+                    # An upgraded exec stream ends when the process exits
+                    return
+                served += 1
+        finally:
+            self.writers.discard(writer)
+            writer.close()
+
+
+def json_response(status, payload):
+    body = json.dumps(payload).encode()
+    return f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n".encode() + body
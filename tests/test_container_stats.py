@@ -0,0 +1,63 @@
+import asyncio
+
+import v2
+from fake_engine import FakeEngine, json_response
+
+
+def write_cgroup(path, usage_usec):
+    path.mkdir(parents=True, exist_ok=True)
+    (path / "cpu.stat").write_text(f"usage_usec {usage_usec}\nuser_usec 0\n")
+    (path / "memory.current").write_text(str(300 * 2 ** 20))
+    (path / "memory.max").write_text(str(2 ** 30))
+    (path / "memory.stat").write_text(f"anon {200 * 2 ** 20}\ninactive_file {100 * 2 ** 20}\n")
+
+
+def test_local_containers_are_sampled_from_cgroups(registry, tmp_path, monkeypatch):
+    nodes = {"local": {"socket": str(tmp_path / "docker.sock"), "max_vps": None}}
+    router = v2.NodeRouter(nodes)
+    monkeypatch.setattr(v2, "NODES", nodes)
+    monkeypatch.setattr(v2, "runtime", router)
+    cgroups = tmp_path / "cgroup"
+    (cgroups / "system.slice").mkdir(parents=True)
+    (cgroups / "cgroup.controllers").write_text("cpu memory\n")
+    scope = cgroups / "system.slice" / "docker-id1.scope"
+    write_cgroup(scope, 1_000_000)
+    monkeypatch.setattr(v2.abuse_monitor, "cgroup_root", str(cgroups))
+    monkeypatch.setattr(v2.abuse_monitor, "cgroups", {})
+
+    engine = FakeEngine(nodes["local"]["socket"])
+    containers = [{"Id": f"id{i}", "Names": [f"/vps{i}"], "State": "running"} for i in (1, 2)]
+    engine.handlers["GET", "/containers/json"] = lambda method, path, body: json_response("200 OK", containers)
+    for container in containers:
+        name = container["Names"][0]
+        engine.handlers["GET", f"/containers{name}/json"] = \
+            lambda method, path, body, container=container: json_response("200 OK", {"Id": container["Id"]})
+    # vps2 has no cgroup on this host, so it falls back to the engine
+    engine.handlers["GET", "/containers/vps2/stats"] = lambda method, path, body: json_response("200 OK", {
+        "memory_stats": {"usage": 50 * 2 ** 20, "limit": 2 ** 30, "stats": {"inactive_file": 0}},
+        "cpu_stats": {"cpu_usage": {"total_usage": 10 ** 9}, "system_cpu_usage": 10 ** 12, "online_cpus": 4}
+    })
+
+    async def run():
+        await engine.start()
+        for name in ("vps1", "vps2"):
+            v2.add_to_database("user", name, "ssh", ram_limit="1", cpu_limit="1", node="local")
+        try:
+            first = await v2.collect_container_stats()
+            # A quarter of a core used since the first sample
+            started = v2.time.monotonic()
+            await asyncio.sleep(0.2)
+            write_cgroup(scope, 1_000_000 + int((v2.time.monotonic() - started) * 250_000))
+            second = await v2.collect_container_stats(["vps1"])
+            return first, second
+        finally:
+            await router.nodes["local"].engine.close()
+            await engine.stop()
+
+    first, second = asyncio.run(run())
+    assert first["vps1"]["memory"] == "200MiB / 1GB"
+    assert first["vps2"]["memory"] == "50MiB / 1GB"
+    assert first["vps1"]["status"] == first["vps2"]["status"] == "🟢 Running"
+    assert 10 <= float(second["vps1"]["cpu"].rstrip("%")) <= 25
+    assert ("GET", "/containers/vps1/stats") not in engine.requests
+    assert engine.requests.count(("GET", "/containers/vps2/stats")) == 1
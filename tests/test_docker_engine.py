@@ -0,0 +1,109 @@
+import asyncio
+import json
+
+import pytest
+
+import v2
+from fake_engine import FakeEngine, json_response
+
+
+def frame(stream_type, data):
+    return bytes([stream_type, 0, 0, 0]) + len(data).to_bytes(4, "big") + data
+
+
+def run_engine(tmp_path, scenario):
+    async def run():
+        engine = FakeEngine(str(tmp_path / "docker.sock"))
+        await engine.start()
+        client = v2.DockerEngineClient(socket_path=engine.socket_path)
+        try:
+            return await scenario(engine, client)
+        finally:
+            await client.close()
+            await engine.stop()
+
+    return asyncio.run(run())
+
+
+def test_chunked_body_is_decoded_and_connection_reused(tmp_path):
+    payload = json.dumps({"Id": "abc", "Names": ["/vps"]}).encode()
+
+    def chunked(method, path, body):
+        return (b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nTransfer-Encoding: chunked\r\n\r\n"
+                + b"%x;ext=1\r\n%s\r\n" % (5, payload[:5])
+                + b"%x\r\n%s\r\n" % (len(payload) - 5, payload[5:])
+                + b"0\r\n\r\n")
+
+    async def scenario(engine, client):
+        engine.handlers["GET", "/containers/vps/json"] = chunked
+        first = await client.inspect("vps")
+        second = await client.inspect("vps")
+        return first, second, engine.connections
+
+    first, second, connections = run_engine(tmp_path, scenario)
+    assert first == second == {"Id": "abc", "Names": ["/vps"]}
+    assert connections == 1
+
+
+def test_exec_stream_demultiplexes_frames(tmp_path):
+    output = frame(1, b"hel") + frame(2, b"oops\n") + frame(1, b"lo\nwor") + frame(1, b"ld")
+
+    def start(method, path, body):
+        assert json.loads(body) == {"Detach": False, "Tty": False}
+        return (b"HTTP/1.1 101 UPGRADED\r\nContent-Type: application/vnd.docker.multiplexed-stream\r\n"
+                b"Connection: Upgrade\r\nUpgrade: tcp\r\n\r\n" + output)
+
+    async def scenario(engine, client):
+        engine.handlers["POST", "/exec/e1/start"] = start
+        stream = await client.exec_start("e1")
+        lines = [await stream.readline(), await stream.readline(), await stream.readline()]
+        stream.close()
+        stream = await client.exec_start("e1")
+        everything = await stream.read_all()
+        stream.close()
+        return lines, everything
+
+    lines, everything = run_engine(tmp_path, scenario)
+    # stderr frames are left out of readline() but kept by read_all()
+    assert lines == [b"hello\n", b"world", b""]
+    assert everything == b"heloops\nlo\nworld"
+
+
+def test_request_reconnects_when_pooled_connections_were_closed(tmp_path):
+    async def scenario(engine, client):
+        engine.handlers["GET", "/_ping"] = lambda method, path, body: b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nOK"
+        # Two concurrent requests leave two kept-alive connections in the pool
+        await asyncio.gather(client.ping(), client.ping())
+        assert len(client.idle) == 2
+        # The daemon drops them both; the request must not be retried on the second one
+        engine.drop_reused = True
+        await client.ping()
+        return engine.connections
+
+    assert run_engine(tmp_path, scenario) == 3
+
+
+@pytest.mark.parametrize("response, status, message", [
+    (json_response("404 Not Found", {"message": "No such container: vps"}), 404, "No such container: vps"),
+    (b"HTTP/1.1 500 Internal Server Error\r\nContent-Length: 6\r\n\r\nboom\r\n", 500, "boom"),
+    (b"HTTP/1.1 409 Conflict\r\nContent-Length: 0\r\n\r\n", 409, "Docker API returned HTTP 409"),
+])
+def test_error_status_raises_container_runtime_error(tmp_path, response, status, message):
+    async def scenario(engine, client):
+        engine.handlers["GET", "/containers/vps/json"] = lambda method, path, body: response
+        with pytest.raises(v2.ContainerRuntimeError) as raised:
+            await v2.ContainerRuntime(client).inspect("vps")
+        return raised.value
+
+    error = run_engine(tmp_path, scenario)
+    assert isinstance(error, v2.DockerAPIError)
+    assert (error.status, str(error)) == (status, message)
+
+
+def test_unreachable_socket_raises_container_runtime_error(tmp_path):
+    async def scenario():
+        client = v2.DockerEngineClient(socket_path=str(tmp_path / "missing.sock"))
+        with pytest.raises(v2.ContainerRuntimeError, match="Cannot reach Docker"):
+            await v2.ContainerRuntime(client).inspect("vps")
+
+    asyncio.run(scenario())
@@ -0,0 +1,87 @@
+import asyncio
+
+import v2
+
+
+class StaleWriter:
+    """Writer of a pooled connection the container closed while it sat idle"""
+
+    def __init__(self):
+        self.closed = False
+
+    def write(self, data):
+        raise ConnectionResetError("connection reset by peer")
+
+    def is_closing(self):
+        return False
+
+    def close(self):
+        self.closed = True
+
+
+async def serve_upstream():
+    async def handle(reader, writer):
+        await reader.readuntil(b"\r\n\r\n")
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok")
+        await writer.drain()
+        writer.close()
+
+    return await asyncio.start_server(handle, "127.0.0.1", 0)
+
+
+async def resume(container_name, restore=True):
+    return False
+
+
+async def resolve(container_name, refresh=False):
+    return "127.0.0.1"
+
+
+async def proxy_get(proxy, route):
+    proxy.routes["app.test"] = route
+    stale = [StaleWriter(), StaleWriter()]
+    proxy.pools[route] = v2.collections.deque((asyncio.StreamReader(), writer, v2.time.monotonic()) for writer in stale)
+
+    server = await asyncio.start_server(proxy.handle, "127.0.0.1", 0)
+    try:
+        reader, writer = await asyncio.open_connection(*server.sockets[0].getsockname()[:2])
+        writer.write(b"GET / HTTP/1.1\r\nHost: app.test\r\nConnection: close\r\n\r\n")
+        response = await asyncio.wait_for(reader.read(), 5)
+        writer.close()
+    finally:
+        server.close()
+    return response, stale
+
+
+def test_retry_skips_every_stale_pooled_connection(registry, monkeypatch):
+    monkeypatch.setattr(v2.hibernator, "resume", resume)
+    monkeypatch.setattr(v2.tcp_forwarder, "resolve", resolve)
+
+    async def run():
+        upstream = await serve_upstream()
+        try:
+            port = upstream.sockets[0].getsockname()[1]
+            return await proxy_get(v2.http_proxy, ("vps1", port))
+        finally:
+            upstream.close()
+
+    response, stale = asyncio.run(run())
+    assert response.startswith(b"HTTP/1.1 200 OK\r\n")
+    assert response.endswith(b"ok")
+    # The retry opens a new connection instead of taking the next stale one
+    assert stale[1].closed and not stale[0].closed
+
+
+def test_retry_answers_bad_gateway_when_upstream_is_down(registry, monkeypatch):
+    monkeypatch.setattr(v2.hibernator, "resume", resume)
+    monkeypatch.setattr(v2.tcp_forwarder, "resolve", resolve)
+
+    async def run():
+        upstream = await serve_upstream()
+        port = upstream.sockets[0].getsockname()[1]
+        upstream.close()
+        await upstream.wait_closed()
+        return await proxy_get(v2.http_proxy, ("vps1", port))
+
+    response, stale = asyncio.run(run())
+    assert response.startswith(b"HTTP/1.1 502 Bad Gateway\r\n")
@@ -0,0 +1,90 @@
+import asyncio
+
+import pytest
+
+import v2
+from fake_engine import FakeEngine, json_response
+
+
+def serve_node(engine, node):
+    engine.handlers["GET", "/info"] = lambda method, path, body: json_response("200 OK", {"MemTotal": 16 * 2 ** 30, "NCPU": 8})
+    engine.handlers["POST", "/containers/create"] = lambda method, path, body: json_response("201 Created", {"Id": f"{node}-vps"})
+    engine.handlers["POST", f"/containers/{node}-vps/start"] = lambda method, path, body: b"HTTP/1.1 204 No Content\r\n\r\n"
+
+
+def run_nodes(tmp_path, monkeypatch, scenario, policy="best-fit"):
+    """Run a scenario against nodes "a" and "b", each a fake engine on its own socket"""
+    nodes = {node: {"socket": str(tmp_path / f"{node}.sock"), "max_vps": None} for node in ("a", "b")}
+    router = v2.NodeRouter(nodes)
+    monkeypatch.setattr(v2, "NODES", nodes)
+    monkeypatch.setattr(v2, "runtime", router)
+    monkeypatch.setattr(v2, "placement", v2.PlacementScheduler(router, policy))
+    monkeypatch.setattr(v2.image_catalog, "router", router)
+    for node in nodes:
+        v2.image_catalog.status[(node, "ubuntu")] = "ready"
+        v2.image_catalog.digests[(node, "ubuntu")] = f"sha256:{node}"
+
+    async def admit(node):
+        return True
+
+    monkeypatch.setattr(v2.memory_balancer, "admit", admit)
+
+    async def run():
+        engines = {node: FakeEngine(config["socket"]) for node, config in nodes.items()}
+        for node, engine in engines.items():
+            serve_node(engine, node)
+            await engine.start()
+        # Two VPSes already run on node "a"
+        for name in ("vps1", "vps2"):
+            v2.add_to_database("user", name, "ssh", ram_limit="2", cpu_limit="1", node="a")
+        try:
+            return await scenario(engines)
+        finally:
+            for engine in engines.values():
+                if engine.server.is_serving():
+                    await engine.stop()
+            for runtime in router.nodes.values():
+                await runtime.engine.close()
+
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize("policy, node", [("spread", "b"), ("best-fit", "a")])
+def test_policy_picks_node(registry, tmp_path, monkeypatch, policy, node):
+    async def scenario(engines):
+        return await v2.placement.choose("2", "1")
+
+    assert run_nodes(tmp_path, monkeypatch, scenario, policy) == node
+
+
+def test_deploy_fails_over_when_node_goes_down(registry, tmp_path, monkeypatch):
+    async def scenario(engines):
+        # Node "a" is known to be up, then goes down before the container is created
+        assert await v2.placement.choose("2", "1") == "a"
+        await engines["a"].stop()
+        placed = await v2.place_vps("ubuntu", "vps3", "2", "1")
+        return placed, v2.runtime.node_of("vps3"), await v2.placement.node_loads()
+
+    placed, node, loads = run_nodes(tmp_path, monkeypatch, scenario)
+    assert placed == ("b", False)
+    assert node == "b"
+    assert [load["node"] for load in loads] == ["b"]
+
+
+def test_deploy_fails_when_every_node_is_down(registry, tmp_path, monkeypatch):
+    async def scenario(engines):
+        assert await v2.placement.choose("2", "1") == "a"
+        for engine in engines.values():
+            await engine.stop()
+        with pytest.raises(v2.ContainerRuntimeError, match="No reachable Docker node"):
+            await v2.place_vps("ubuntu", "vps3", "2", "1")
+
+    run_nodes(tmp_path, monkeypatch, scenario)
+
+
+def test_remote_node_requires_tls():
+    with pytest.raises(ValueError, match="tls"):
+        v2.node_ssl_context("node2", {"host": "10.0.0.2", "port": 2376})
+    with pytest.raises(ValueError, match="tls"):
+        v2.NodeRouter({"node2": {"host": "10.0.0.2", "port": 2376}})
+    assert v2.node_ssl_context("local", {"socket": "/var/run/docker.sock"}) is None
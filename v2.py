@@ -1,14 +1,25 @@
 import random
 import logging
-import subprocess
 import sys
 import os
 import re
+import socket
+import ssl
+import errno
 import time
+import sqlite3
+import threading
+import collections
+import contextlib
 import concurrent.futures
+import functools
+import heapq
+import json
+import io
+import tarfile
+import urllib.parse
 import discord
 from discord.ext import commands, tasks
-import docker
 import asyncio
 from discord import app_commands
 from discord.ui import Button, View, Select
@@ -19,8 +30,112 @@ from typing import Optional, Literal
 TOKEN = 'bot_token'
 RAM_LIMIT = '6g'
 SERVER_LIMIT = 1
-database_file = 'database.txt'
+database_file = 'database.txt'  # legacy flat file, imported into the registry once
+registry_file = 'vps.db'
 PUBLIC_IP = '138.68.79.95'
+STATS_SAMPLE_INTERVAL = 15  # seconds between background stats samples
+STATS_CACHE_TTL = 60  # commands re-sample inline only if the snapshot is older than this
+DOCKER_MAX_CONCURRENCY = 8  # Docker operations allowed in flight at once
+DOCKER_OP_TIMEOUT = 30  # seconds before a Docker operation is abandoned
+DOCKER_STOP_GRACE = 10  # seconds a container gets to shut down before it is killed
+DOCKER_SOCKET = '/var/run/docker.sock'
+DOCKER_API_VERSION = 'v1.41'
+EXEC_PIDFILE_DIR = '/run'  # where execs record their PID inside the container, for kill_exec
+# Docker nodes VPSes can be placed on. Local daemons use "socket"; remote ones
+# use "host"/"port" of a daemon API reachable from the bot, which must be
+# protected with TLS client certificates ("tls": CA, client cert and key files).
+NODES = {
+    "local": {"socket": DOCKER_SOCKET, "public_ip": PUBLIC_IP, "max_vps": None},
+    # "node2": {"host": "10.0.0.2", "port": 2376, "public_ip": "203.0.113.2", "max_vps": 100,
+    #           "tls": {"ca": "certs/node2/ca.pem", "cert": "certs/node2/cert.pem", "key": "certs/node2/key.pem"}},
+}
+DEFAULT_NODE = next(iter(NODES))
+PLACEMENT_POLICY = 'best-fit'  # 'best-fit' packs nodes tightly, 'spread' balances VPSes across nodes
+NODE_INFO_TTL = 300  # seconds node memory/CPU totals are cached for placement
+TEARDOWN_WORKERS = 8  # containers removed in parallel by /delete-all and /cleanup
+TEARDOWN_PROGRESS_INTERVAL = 2  # seconds between progress embed edits
+IMAGE_CATALOG = {  # VPS images offered by /deploy, keyed by OS type; all are built from IMAGE_DOCKERFILE
+    "ubuntu": {"name": "Ubuntu 22.04", "description": "Latest LTS Ubuntu release", "image": "ubuntu-22.04-with-tmate", "base": "ubuntu:22.04"},
+    "debian": {"name": "Debian 12", "description": "Stable Debian release", "image": "debian-with-tmate", "base": "debian:12"},
+}
+IMAGE_DOCKERFILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Dockerfile')
+IMAGE_LABEL = 'dp-vps.os'  # label recording which catalog entry an image was built for
+IMAGE_BUILD_TIMEOUT = 1800  # seconds an image build may take
+IMAGE_FAST_BOOT = False  # build and deploy the Dockerfile's 'fastboot' target (trimmed systemd units), tagged <image>-fastboot
+BOOT_PROBE = 'systemctl'  # 'systemctl' waits on `systemctl is-system-running --wait`; 'marker' waits for BOOT_MARKER (images built from the current Dockerfile)
+BOOT_MARKER = '/run/dp-vps-booted'  # written by the image's dp-vps-booted.service once multi-user.target is up
+BOOT_READY_TIMEOUT = 60  # seconds a started container gets to finish booting before tmate is started anyway
+WARM_POOL_SIZES = {"ubuntu": 2, "debian": 1}  # booted, unassigned containers kept ready per OS
+WARM_POOL_PREFIX = 'POOL_'
+WARM_POOL_LABEL = 'dp-vps.pool'
+WARM_POOL_BOOT_TIMEOUT = 120  # seconds a warm container gets to finish booting
+TMATE_SOCKET = '/tmp/dp-vps-tmate.sock'  # named tmate socket inside each container
+TMATE_READY_TIMEOUT = 30  # seconds tmate gets to connect and publish an SSH session
+TMATE_COMMAND_TIMEOUT = 10  # seconds for short tmate control commands
+EXPIRY_FORMAT = '%Y-%m-%d %H:%M:%S'
+EXPIRY_GRACE_PERIOD = 86400  # seconds an expired VPS stays stopped before deletion (0 deletes immediately)
+PRESENCE_DEBOUNCE = 3  # seconds to let a burst of adds/removes settle before updating the status
+PRESENCE_MIN_INTERVAL = 15  # minimum seconds between presence updates (Discord allows ~5 per minute)
+NODEDMIN_PAGE_SIZE = 10  # VPSes per /nodedmin page (embeds cap at 25 fields and 6000 characters)
+NODEDMIN_PAGE_CACHE_SIZE = 8  # recently viewed /nodedmin pages whose stats are kept
+NODEDMIN_PAGE_TTL = 60  # seconds a cached /nodedmin page's stats stay valid
+OOM_NOTIFY_COOLDOWN = 600  # seconds between out-of-memory DMs for the same VPS
+METRICS_HOST = '127.0.0.1'  # interface the Prometheus metrics endpoint listens on
+METRICS_PORT = 9464  # port for GET /metrics (0 disables the endpoint)
+PORT_RANGES = [(20000, 29999)]  # inclusive public port ranges handed out by /port-add
+PORTS_PER_VPS = 10  # forwarded ports a single VPS may hold
+PORT_BIND_RETRIES = 5  # other free ports /port-add tries when the chosen one is held by another host process
+PORT_FORWARD_MODE = 'proxy'  # 'proxy' relays ports from this host; 'serveo' uses SSH tunnels through serveo.net
+PORT_FORWARD_BIND = '0.0.0.0'  # address the forwarded public ports listen on
+FORWARD_MAX_CONNECTIONS = 64  # concurrent connections per forwarded port
+FORWARD_IDLE_TIMEOUT = 600  # seconds without traffic before a forwarded connection is closed
+FORWARD_CONNECT_TIMEOUT = 5  # seconds to connect to the container
+FORWARD_ADDRESS_TTL = 30  # seconds a container's IP is cached
+FORWARD_BUFFER = 65536  # bytes moved per splice/recv
+HTTP_PROXY_HOST = '0.0.0.0'  # interface the /port-http reverse proxy listens on
+HTTP_PROXY_PORT = 80  # port for /port-http traffic (0 disables the proxy)
+HTTP_PROXY_DOMAIN = f'{PUBLIC_IP}.nip.io'  # /port-http subdomains are served under this wildcard domain
+HTTP_ROUTES_PER_VPS = 5  # hostnames a single VPS may route with /port-http
+HTTP_RESERVED_LABELS = frozenset({  # subdomains of HTTP_PROXY_DOMAIN /port-http never hands out
+    "www", "api", "admin", "mail", "smtp", "imap", "ftp", "ns1", "ns2", "mx", "status", "metrics", "localhost"
+})
+HTTP_POOL_SIZE = 8  # idle keep-alive upstream connections kept per container port
+HTTP_POOL_IDLE = 30  # seconds an idle upstream connection is kept for reuse
+HTTP_HEADER_TIMEOUT = 30  # seconds a client gets to send request headers
+HTTP_UPSTREAM_TIMEOUT = 60  # seconds the container gets to start its response, and the idle limit while streaming
+HTTP_MAX_HEADER = 65536  # bytes allowed in a request or response head
+SUPERVISOR_MAX_PER_VPS = 16  # long-lived processes (tunnels) the bot runs per VPS
+SUPERVISOR_BACKOFF_BASE = 2  # seconds before restarting a process that exited, doubling on each restart
+SUPERVISOR_BACKOFF_MAX = 300  # cap on the restart delay
+SUPERVISOR_STABLE_AFTER = 60  # seconds a process must run before its restart delay resets
+SUPERVISOR_LOG_LINES = 20  # recent output lines kept per process; older output is discarded
+TUNNEL_READY_TIMEOUT = 30  # seconds serveo.net gets to hand out an HTTP forwarding URL
+CGROUP_ROOT = '/sys/fs/cgroup'  # cgroup v2 mount read by the abuse monitor
+ABUSE_CHECK_INTERVAL = 10  # seconds between abuse monitor samples
+ABUSE_CPU_THRESHOLD = 90  # percent of a VPS's CPU allocation (or throttled limit) counted as abuse
+ABUSE_SUSTAIN = 300  # seconds usage must stay above the threshold before the next action
+ABUSE_THROTTLE_FRACTION = 0.5  # share of the allocation a throttled VPS keeps
+ABUSE_PAUSE_DURATION = 900  # seconds a VPS stays paused before it gets another chance
+ABUSE_COOLDOWN = 1800  # seconds of normal usage before a throttled VPS gets its full allocation back
+ABUSE_AUDIT_LOG = 'abuse-audit.jsonl'  # one JSON object per abuse monitor action
+ABUSE_STOP_COOLDOWN = 3600  # seconds a VPS stopped for abuse stays stopped; it then restarts throttled
+HIBERNATE_IDLE_AFTER = 21600  # seconds a VPS must stay idle before it is hibernated; 0 disables hibernation
+HIBERNATE_MODE = 'pause'  # 'pause' freezes the processes in memory, 'checkpoint' saves them to disk (CRIU) and stops the container
+HIBERNATE_CHECK_INTERVAL = 60  # seconds between idle samples
+HIBERNATE_CPU_PERCENT = 2  # CPU use (percent of one core) below which a VPS counts as idle
+HIBERNATE_NET_RATE = 1024  # network bytes per second (in + out) below which a VPS counts as idle
+HIBERNATE_CHECKPOINT = 'dp-vps-hibernate'  # checkpoint name used in 'checkpoint' mode
+PROC_ROOT = '/proc'  # host procfs, read for host metrics, memory pressure and per-container network counters
+MEMORY_BALANCE_INTERVAL = 30  # seconds between memory rebalancing passes; 0 disables rebalancing
+MEMORY_HOST_RESERVE = 2  # GB of host memory left out of the budget VPS reservations share
+MEMORY_MIN_RESERVATION = 0.25  # GB every running VPS keeps reserved
+MEMORY_HEADROOM = 1.25  # reservation granted per byte of a VPS's working set
+MEMORY_BUSY_PSI = 5  # memory pressure of a VPS (some avg10, %) at which it is granted its whole plan
+MEMORY_RECLAIM_PSI = 10  # host memory pressure (some avg10, %) at which idle VPSes are squeezed down to their working set
+MEMORY_ADMISSION_PSI = 20  # host memory pressure (some avg10, %) above which new VPSes are held back
+MEMORY_ADMISSION_WAIT = 60  # seconds a held-back deploy waits for pressure to drop before it is refused
+MEMORY_UPDATE_STEP = 0.05  # share of the plan a reservation must move by before it is re-applied
+METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)  # latency histogram bounds in seconds
 
 # Admin user IDs - add your admin user IDs here
 ADMIN_IDS = [1244619465040203850]  # Replace with actual admin IDs
@@ -30,7 +145,905 @@ intents.messages = False
 intents.message_content = False
 
 bot = commands.Bot(command_prefix='/', intents=intents)
-client = docker.from_env()
+
+# In-process metrics, served in the Prometheus text format by MetricsServer
+class MetricsRegistry:
+    def __init__(self, buckets=METRICS_BUCKETS):
+        self.buckets = buckets
+        self.meta = {}  # name -> (type, help)
+        self.values = {}  # (name, labels) -> value, for counters and gauges
+        self.histograms = {}  # (name, labels) -> [bucket counts, sum, count]
+        self.collectors = []
+
+    def describe(self, name, kind, text):
+        self.meta[name] = (kind, text)
+
+    def add_collector(self, callback):
+        """Call callback() before every scrape, e.g. to set gauges computed on demand"""
+        self.collectors.append(callback)
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        self.values[key] = self.values.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        self.values[self._key(name, labels)] = value
+
+    def remove(self, name, **labels):
+        self.values.pop(self._key(name, labels), None)
+
+    def observe(self, name, value, **labels):
+        key = self._key(name, labels)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = [[0] * len(self.buckets), 0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                histogram[0][i] += 1
+        histogram[1] += value
+        histogram[2] += 1
+
+    @contextlib.contextmanager
+    def timer(self, prefix, **labels):
+        """Record <prefix>_seconds, <prefix>_errors_total and <prefix>_in_flight around a block"""
+        self.inc(f"{prefix}_in_flight", 1, **labels)
+        started = time.perf_counter()
+        try:
+            yield
+        except BaseException as e:
+            # Cancellation is not a failure of the operation being timed
+            if not isinstance(e, asyncio.CancelledError):
+                self.inc(f"{prefix}_errors_total", 1, **labels)
+            raise
+        finally:
+            self.observe(f"{prefix}_seconds", time.perf_counter() - started, **labels)
+            self.inc(f"{prefix}_in_flight", -1, **labels)
+
+    @staticmethod
+    def _labels(labels, extra=()):
+        labels = tuple(labels) + tuple(extra)
+        if not labels:
+            return ""
+        escaped = []
+        for key, value in labels:
+            value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+            escaped.append(f'{key}="{value}"')
+        return "{" + ",".join(escaped) + "}"
+
+    def render(self):
+        for callback in self.collectors:
+            try:
+                callback()
+            except Exception as e:
+                print(f"Metrics collector failed: {e}")
+        # name -> [(labels, lines)], so each histogram keeps its bucket order
+        series = collections.defaultdict(list)
+        for (name, labels), value in self.values.items():
+            series[name].append((labels, [f"{name}{self._labels(labels)} {value}"]))
+        for (name, labels), (counts, total, count) in self.histograms.items():
+            block = [f"{name}_bucket{self._labels(labels, [('le', bound)])} {bucket_count}"
+                     for bound, bucket_count in zip(self.buckets, counts)]
+            block.append(f"{name}_bucket{self._labels(labels, [('le', '+Inf')])} {count}")
+            block.append(f"{name}_sum{self._labels(labels)} {total}")
+            block.append(f"{name}_count{self._labels(labels)} {count}")
+            series[name].append((labels, block))
+        lines = []
+        for name in sorted(series):
+            if name in self.meta:
+                kind, text = self.meta[name]
+                lines.append(f"# HELP {name} {text}")
+                lines.append(f"# TYPE {name} {kind}")
+            for labels, block in sorted(series[name]):
+                lines.extend(block)
+        return "\n".join(lines) + "\n"
+
+metrics = MetricsRegistry()
+for prefix, subject in (("dp_vps_command", "Slash command handlers"), ("dp_vps_docker", "Docker Engine API calls"),
+                        ("dp_vps_tmate", "tmate control commands"), ("dp_vps_db", "Registry database access")):
+    metrics.describe(f"{prefix}_seconds", "histogram", f"{subject}: latency in seconds")
+    metrics.describe(f"{prefix}_errors_total", "counter", f"{subject}: calls that raised")
+    metrics.describe(f"{prefix}_in_flight", "gauge", f"{subject}: calls currently running")
+metrics.describe("dp_vps_container_memory_bytes", "gauge", "Memory used by a running VPS, excluding inactive page cache")
+metrics.describe("dp_vps_container_memory_limit_bytes", "gauge", "Memory limit of a running VPS")
+metrics.describe("dp_vps_container_cpu_percent", "gauge", "CPU usage of a running VPS between the last two samples")
+metrics.describe("dp_vps_instances", "gauge", "VPS instances in the registry")
+
+def instrument_command(func):
+    """Time a slash command handler; goes directly under @bot.tree.command"""
+    @functools.wraps(func)
+    async def wrapper(interaction, *args, **kwargs):
+        with metrics.timer("dp_vps_command", command=func.__name__):
+            return await func(interaction, *args, **kwargs)
+    return wrapper
+
+# Minimal HTTP server exposing GET /metrics
+class MetricsServer:
+    def __init__(self, registry, host=METRICS_HOST, port=METRICS_PORT):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self.server = None
+
+    async def start(self):
+        if self.server or not self.port:
+            return
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        print(f"Metrics available at http://{self.host}:{self.port}/metrics")
+
+    async def handle(self, reader, writer):
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), 10)
+            method, path = head.split(b" ", 2)[:2]
+            if method == b"GET" and path.split(b"?")[0] == b"/metrics":
+                status, content_type, body = "200 OK", "text/plain; version=0.0.4", self.registry.render().encode()
+            else:
+                status, content_type, body = "404 Not Found", "text/plain", b"Not Found\n"
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+metrics_server = MetricsServer(metrics)
+class ContainerRuntimeError(Exception):
+    pass
+
+class DockerAPIError(ContainerRuntimeError):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+class NodeUnreachableError(ContainerRuntimeError):
+    pass
+
+# Minimal asyncio client for the Docker Engine HTTP API. Connections to the
+# socket are kept alive and reused, so no operation forks the docker CLI.
+class DockerEngineClient:
+    def __init__(self, socket_path=DOCKER_SOCKET, host=None, port=2376, api_version=DOCKER_API_VERSION,
+                 max_idle=DOCKER_MAX_CONCURRENCY, ssl_context=None):
+        self.socket_path = socket_path
+        self.host = host
+        self.port = port
+        self.ssl_context = ssl_context
+        self.api_version = api_version
+        self.max_idle = max_idle
+        self.idle = []
+
+    def _url(self, path, params=None):
+        url = f"/{self.api_version}{path}"
+        if params:
+            query = {}
+            for key, value in params.items():
+                if value is None:
+                    continue
+                if isinstance(value, bool):
+                    value = "1" if value else "0"
+                elif isinstance(value, (dict, list)):
+                    value = json.dumps(value)
+                query[key] = value
+            if query:
+                url += "?" + urllib.parse.urlencode(query)
+        return url
+
+    async def _connect(self):
+        if self.host:
+            return await asyncio.open_connection(self.host, self.port, ssl=self.ssl_context, limit=2 ** 20)
+        return await asyncio.open_unix_connection(self.socket_path, limit=2 ** 20)
+
+    async def _acquire(self, fresh=False):
+        while self.idle and not fresh:
+            reader, writer = self.idle.pop()
+            if writer.is_closing() or reader.at_eof():
+                writer.close()
+                continue
+            return reader, writer, True
+        reader, writer = await self._connect()
+        return reader, writer, False
+
+    def _release(self, reader, writer):
+        if len(self.idle) < self.max_idle and not writer.is_closing():
+            self.idle.append((reader, writer))
+        else:
+            writer.close()
+
+    async def _send(self, writer, method, url, body=None, headers=None):
+        payload = b""
+        lines = [f"{method} {url} HTTP/1.1", "Host: docker", "User-Agent: dp-vps"]
+        if isinstance(body, bytes):
+            # Raw payloads (build contexts) bring their own Content-Type header
+            payload = body
+        elif body is not None:
+            payload = json.dumps(body).encode()
+            lines.append("Content-Type: application/json")
+        lines.append(f"Content-Length: {len(payload)}")
+        for key, value in (headers or {}).items():
+            lines.append(f"{key}: {value}")
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode() + payload)
+        await writer.drain()
+
+    async def _read_head(self, reader):
+        head = await reader.readuntil(b"\r\n\r\n")
+        status_line, *header_lines = head.decode("latin-1").split("\r\n")
+        status = int(status_line.split(" ", 2)[1])
+        headers = {}
+        for line in header_lines:
+            if ":" in line:
+                key, value = line.split(":", 1)
+                headers[key.strip().lower()] = value.strip()
+        return status, headers
+
+    async def _read_body(self, reader, status, headers):
+        """Read a response body; returns (body, connection_reusable)"""
+        reusable = headers.get("connection", "").lower() != "close"
+        if status in (101, 204, 304) or 100 <= status < 200:
+            return b"", reusable and status != 101
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            chunks = [chunk async for chunk in self._iter_chunks(reader)]
+            return b"".join(chunks), reusable
+        if "content-length" in headers:
+            return await reader.readexactly(int(headers["content-length"])), reusable
+        return await reader.read(), False
+
+    async def _iter_chunks(self, reader):
+        while True:
+            size_line = await reader.readuntil(b"\r\n")
+            size = int(size_line.split(b";", 1)[0].strip(), 16)
+            if size == 0:
+                await reader.readuntil(b"\r\n")
+                return
+            chunk = await reader.readexactly(size)
+            await reader.readexactly(2)
+            yield chunk
+
+    def _raise_for_status(self, status, body):
+        if status < 400:
+            return
+        try:
+            message = json.loads(body).get("message", "")
+        except (ValueError, AttributeError):
+            message = body.decode(errors="replace").strip()
+        raise DockerAPIError(status, message or f"Docker API returned HTTP {status}")
+
+    async def request(self, method, path, params=None, body=None):
+        """Send one API request over a pooled connection; returns (status, body)"""
+        url = self._url(path, params)
+        for attempt in range(2):
+            reader, writer, reused = await self._acquire(fresh=attempt > 0)
+            done = False
+            try:
+                try:
+                    await self._send(writer, method, url, body)
+                    status, headers = await self._read_head(reader)
+                except (ConnectionError, asyncio.IncompleteReadError) as e:
+                    # The daemon may have dropped an idle pooled connection; retry once on a fresh one
+                    if reused and attempt == 0:
+                        continue
+                    raise DockerAPIError(0, f"Docker socket error: {e}")
+                payload, reusable = await self._read_body(reader, status, headers)
+                if reusable:
+                    self._release(reader, writer)
+                    done = True
+            finally:
+                if not done:
+                    writer.close()
+            self._raise_for_status(status, payload)
+            return status, payload
+        raise DockerAPIError(0, "Docker socket error: connection closed")
+
+    async def request_json(self, method, path, params=None, body=None):
+        status, payload = await self.request(method, path, params, body)
+        return json.loads(payload) if payload else None
+
+    async def open_stream(self, method, path, params=None, body=None, headers=None):
+        """Open a dedicated connection for a streaming endpoint; returns (status, headers, reader, writer)"""
+        reader, writer = await self._connect()
+        try:
+            await self._send(writer, method, self._url(path, params), body, headers)
+            status, response_headers = await self._read_head(reader)
+            if status >= 400:
+                payload, _ = await self._read_body(reader, status, response_headers)
+                self._raise_for_status(status, payload)
+        except BaseException:
+            writer.close()
+            raise
+        return status, response_headers, reader, writer
+
+    async def close(self):
+        while self.idle:
+            reader, writer = self.idle.pop()
+            writer.close()
+
+    # Containers
+    async def ping(self):
+        status, payload = await self.request("GET", "/_ping")
+        return payload == b"OK"
+
+    async def info(self):
+        return await self.request_json("GET", "/info")
+
+    async def list_containers(self, all=True, filters=None):
+        return await self.request_json("GET", "/containers/json", {"all": all, "filters": filters})
+
+    async def inspect(self, name):
+        return await self.request_json("GET", f"/containers/{urllib.parse.quote(name)}/json")
+
+    async def create(self, name, config):
+        result = await self.request_json("POST", "/containers/create", {"name": name}, config)
+        return result["Id"]
+
+    async def start(self, name, checkpoint=None):
+        await self.request("POST", f"/containers/{urllib.parse.quote(name)}/start", {"checkpoint": checkpoint})
+
+    async def stop(self, name, grace=DOCKER_STOP_GRACE):
+        await self.request("POST", f"/containers/{urllib.parse.quote(name)}/stop", {"t": grace})
+
+    async def restart(self, name, grace=DOCKER_STOP_GRACE):
+        await self.request("POST", f"/containers/{urllib.parse.quote(name)}/restart", {"t": grace})
+
+    async def remove(self, name, force=False):
+        await self.request("DELETE", f"/containers/{urllib.parse.quote(name)}", {"force": force, "v": True})
+
+    async def update(self, name, resources):
+        await self.request("POST", f"/containers/{urllib.parse.quote(name)}/update", body=resources)
+
+    async def pause(self, name):
+        await self.request("POST", f"/containers/{urllib.parse.quote(name)}/pause")
+
+    async def unpause(self, name):
+        await self.request("POST", f"/containers/{urllib.parse.quote(name)}/unpause")
+
+    async def checkpoint_create(self, name, checkpoint):
+        """Checkpoint the container's processes and stop it (needs an experimental daemon with CRIU)"""
+        await self.request("POST", f"/containers/{urllib.parse.quote(name)}/checkpoints",
+                           body={"CheckpointID": checkpoint, "Exit": True})
+
+    async def checkpoint_delete(self, name, checkpoint):
+        await self.request("DELETE", f"/containers/{urllib.parse.quote(name)}/checkpoints/{urllib.parse.quote(checkpoint)}")
+
+    async def rename(self, name, new_name):
+        await self.request("POST", f"/containers/{urllib.parse.quote(name)}/rename", {"name": new_name})
+
+    async def stats(self, name):
+        """Single stats sample without waiting for a second read (no precpu data)"""
+        return await self.request_json("GET", f"/containers/{urllib.parse.quote(name)}/stats",
+                                       {"stream": False, "one-shot": True})
+
+    # Exec
+    async def exec_create(self, name, command, tty=False):
+        result = await self.request_json("POST", f"/containers/{urllib.parse.quote(name)}/exec", body={
+            "AttachStdout": True,
+            "AttachStderr": True,
+            "Tty": tty,
+            "Cmd": list(command)
+        })
+        return result["Id"]
+
+    async def exec_start(self, exec_id, tty=False):
+        """Start an exec and return an ExecStream attached to its output"""
+        status, headers, reader, writer = await self.open_stream(
+            "POST", f"/exec/{exec_id}/start", body={"Detach": False, "Tty": tty},
+            headers={"Connection": "Upgrade", "Upgrade": "tcp"}
+        )
+        return ExecStream(exec_id, reader, writer, multiplexed=not tty)
+
+    async def exec_inspect(self, exec_id):
+        return await self.request_json("GET", f"/exec/{exec_id}/json")
+
+    # Images
+    async def image_inspect(self, name):
+        return await self.request_json("GET", f"/images/{urllib.parse.quote(name)}/json")
+
+    async def build(self, context, tag, buildargs=None, labels=None, target=None):
+        """Build an image from a tar context; returns the new image ID"""
+        status, headers, reader, writer = await self.open_stream(
+            "POST", "/build", {"t": tag, "buildargs": buildargs, "labels": labels, "target": target, "rm": True, "forcerm": True},
+            context, headers={"Content-Type": "application/x-tar"}
+        )
+        image_id = None
+        try:
+            async for message in self._iter_json(reader, headers):
+                if message.get("error"):
+                    raise DockerAPIError(0, message["error"].strip())
+                image_id = (message.get("aux") or {}).get("ID", image_id)
+        finally:
+            writer.close()
+        if not image_id:
+            image_id = (await self.image_inspect(tag))["Id"]
+        return image_id
+
+    # Events
+    async def events(self, since=None, filters=None):
+        """Yield decoded events from the daemon until the stream ends"""
+        status, headers, reader, writer = await self.open_stream("GET", "/events", {"since": since, "filters": filters})
+        try:
+            async for event in self._iter_json(reader, headers):
+                yield event
+        finally:
+            writer.close()
+
+    async def _iter_json(self, reader, headers):
+        """Decode a stream of newline-delimited JSON messages"""
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            chunks = self._iter_chunks(reader)
+        else:
+            chunks = self._iter_reads(reader)
+        buffer = b""
+        async for chunk in chunks:
+            buffer += chunk
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                if line.strip():
+                    yield json.loads(line)
+
+    async def _iter_reads(self, reader):
+        while True:
+            chunk = await reader.read(65536)
+            if not chunk:
+                return
+            yield chunk
+
+# Output of a running exec. Without a TTY Docker multiplexes stdout and
+# stderr into frames with an 8-byte header (stream type, 3 pad bytes, size).
+class ExecStream:
+    def __init__(self, exec_id, reader, writer, multiplexed=True):
+        self.exec_id = exec_id
+        self.reader = reader
+        self.writer = writer
+        self.multiplexed = multiplexed
+        self.buffer = b""
+
+    async def read_frame(self):
+        """Next (stream_type, data) chunk of output, or (None, b"") at EOF"""
+        try:
+            if not self.multiplexed:
+                data = await self.reader.read(65536)
+                return (1 if data else None), data
+            header = await self.reader.readexactly(8)
+            size = int.from_bytes(header[4:8], "big")
+            return header[0], await self.reader.readexactly(size)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            return None, b""
+
+    async def readline(self):
+        """Next line of stdout, or b"" at EOF"""
+        while b"\n" not in self.buffer:
+            stream_type, data = await self.read_frame()
+            if stream_type is None:
+                line, self.buffer = self.buffer, b""
+                return line
+            if stream_type == 1:
+                self.buffer += data
+        line, self.buffer = self.buffer.split(b"\n", 1)
+        return line + b"\n"
+
+    async def read_all(self):
+        output = []
+        while True:
+            stream_type, data = await self.read_frame()
+            if stream_type is None:
+                return b"".join(output)
+            output.append(data)
+
+    def close(self):
+        self.writer.close()
+
+def resource_limits(ram=None, cpu=None):
+    """Engine API HostConfig limits matching `docker run --memory=<ram>g --cpus=<cpu>`"""
+    limits = {}
+    if ram:
+        limits["Memory"] = int(float(ram) * 1024 ** 3)
+        limits["MemorySwap"] = limits["Memory"] * 2
+    if cpu:
+        limits["NanoCpus"] = int(float(cpu) * 1e9)
+    return limits
+
+# Every container operation goes through this layer, which caps how many
+# Docker calls are in flight and gives each one a timeout
+class ContainerRuntime:
+    def __init__(self, engine, max_concurrency=DOCKER_MAX_CONCURRENCY, timeout=DOCKER_OP_TIMEOUT, node=DEFAULT_NODE):
+        self.engine = engine
+        self.node = node
+        self.timeout = timeout
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.exec_pidfiles = {}  # exec ID -> (container name, pidfile) while the exec may be running
+
+    async def _call(self, func, *args, timeout=None):
+        timeout = timeout or self.timeout
+        async with self.semaphore:
+            try:
+                with metrics.timer("dp_vps_docker", node=self.node, op=func.__name__):
+                    return await asyncio.wait_for(func(*args), timeout)
+            except asyncio.TimeoutError:
+                raise ContainerRuntimeError(f"{func.__name__} timed out after {timeout}s")
+            except OSError as e:
+                raise NodeUnreachableError(f"Cannot reach Docker: {e}")
+
+    async def start(self, name, checkpoint=None):
+        await self._call(self.engine.start, name, checkpoint)
+
+    async def stop(self, name, grace=DOCKER_STOP_GRACE):
+        await self._call(self.engine.stop, name, grace, timeout=self.timeout + grace)
+
+    async def restart(self, name, grace=DOCKER_STOP_GRACE):
+        await self._call(self.engine.restart, name, grace, timeout=self.timeout + grace)
+
+    async def remove(self, name, force=False):
+        await self._call(self.engine.remove, name, force)
+
+    async def pause(self, name):
+        await self._call(self.engine.pause, name)
+
+    async def unpause(self, name):
+        await self._call(self.engine.unpause, name)
+
+    async def checkpoint_create(self, name, checkpoint):
+        await self._call(self.engine.checkpoint_create, name, checkpoint)
+
+    async def checkpoint_delete(self, name, checkpoint):
+        await self._call(self.engine.checkpoint_delete, name, checkpoint)
+
+    async def inspect(self, name):
+        return await self._call(self.engine.inspect, name)
+
+    async def stats(self, name):
+        return await self._call(self.engine.stats, name)
+
+    async def list_containers(self, filters=None):
+        return await self._call(self.engine.list_containers, True, filters)
+
+    async def list_names(self):
+        return [c["Names"][0].lstrip("/") for c in await self.list_containers() if c.get("Names")]
+
+    async def run(self, image, name, ram=None, cpu=None, labels=None):
+        """Create and start a VPS container, returning its ID"""
+        config = {
+            "Image": image,
+            "Tty": True,
+            "OpenStdin": True,
+            "Labels": labels or {},
+            "HostConfig": {
+                "Privileged": True,
+                "CapAdd": ["ALL"],
+                **resource_limits(ram, cpu)
+            }
+        }
+        container_id = await self._call(self.engine.create, name, config)
+        await self._call(self.engine.start, container_id)
+        return container_id
+
+    async def update_resources(self, name, ram=None, cpu=None):
+        await self._call(self.engine.update, name, resource_limits(ram, cpu))
+
+    async def update_reservation(self, name, reservation):
+        """Soft memory limit in bytes (`docker update --memory-reservation`, memory.low on cgroup v2)"""
+        await self._call(self.engine.update, name, {"MemoryReservation": int(reservation)})
+
+    async def rename(self, name, new_name):
+        await self._call(self.engine.rename, name, new_name)
+
+    async def info(self):
+        return await self._call(self.engine.info)
+
+    async def image_inspect(self, name):
+        return await self._call(self.engine.image_inspect, name)
+
+    async def build(self, context, tag, buildargs=None, labels=None, target=None):
+        return await self._call(self.engine.build, context, tag, buildargs, labels, target, timeout=IMAGE_BUILD_TIMEOUT)
+
+    async def exec_create(self, name, *command):
+        # The PID the daemon reports lives in the Docker host's PID namespace, which
+        # the bot does not share, so the exec records its PID inside the container
+        pidfile = f"{EXEC_PIDFILE_DIR}/dp-vps-exec-{generate_random_string(12)}.pid"
+        command = ("sh", "-c", 'echo $$ > "$1"; shift; exec "$@"', "sh", pidfile, *command)
+        exec_id = await self._call(self.engine.exec_create, name, command)
+        self.exec_pidfiles[exec_id] = (name, pidfile)
+        return exec_id
+
+    async def exec_start(self, exec_id):
+        """Start a created exec and return its output stream"""
+        return await self._call(self.engine.exec_start, exec_id)
+
+    async def exec_attach(self, name, *command):
+        """Start a command in the container and return its output stream"""
+        exec_id = await self.exec_create(name, *command)
+        return await self.exec_start(exec_id)
+
+    async def exec_inspect(self, exec_id):
+        result = await self._call(self.engine.exec_inspect, exec_id)
+        if not result.get("Running"):
+            self.exec_pidfiles.pop(exec_id, None)
+        return result
+
+    async def exec_wait(self, exec_id, timeout=None):
+        """Start a created exec and collect its output; returns (exit_code, output).
+
+        An exec that outlives its timeout is killed rather than left running.
+        """
+        timeout = timeout or self.timeout
+        stream = await self._call(self.engine.exec_start, exec_id)
+        try:
+            output = await asyncio.wait_for(stream.read_all(), timeout)
+        except asyncio.TimeoutError:
+            await self.kill_exec(exec_id)
+            raise ContainerRuntimeError(f"exec timed out after {timeout}s")
+        finally:
+            stream.close()
+        result = await self.exec_inspect(exec_id)
+        return result.get("ExitCode"), output.decode(errors="replace")
+
+    async def exec_run(self, name, *command, timeout=None):
+        """Run a command in the container to completion; returns (exit_code, output)"""
+        exec_id = await self.exec_create(name, *command)
+        return await self.exec_wait(exec_id, timeout)
+
+    async def kill_exec(self, exec_id):
+        """Kill an exec's process; the Engine API has no endpoint for this, so the
+        PID it recorded in its pidfile is killed from inside the container"""
+        target = self.exec_pidfiles.pop(exec_id, None)
+        if not target:
+            return
+        name, pidfile = target
+        try:
+            result = await self._call(self.engine.exec_inspect, exec_id)
+            if not result.get("Running"):
+                return
+            # Created directly so a hung kill does not get a pidfile (and a kill) of its own
+            kill_id = await self._call(self.engine.exec_create, name,
+                                       ("sh", "-c", 'kill -9 "$(cat "$1")"; rm -f "$1"', "sh", pidfile))
+            await self.exec_wait(kill_id, timeout=10)
+        except ContainerRuntimeError:
+            pass
+
+# Container events followed by ContainerStateTracker, mapped to the state they leave the container in
+CONTAINER_EVENTS = {
+    "create": "created",
+    "start": "running",
+    "unpause": "running",
+    "pause": "paused",
+    "die": "exited",
+    "stop": "exited",
+    "destroy": None,
+    "oom": None,
+    "rename": None
+}
+
+def node_ssl_context(node, config):
+    """Client TLS context for a remote node; None for a local socket"""
+    if not config.get("host"):
+        return None
+    tls = config.get("tls")
+    if not tls:
+        raise ValueError(f"Node {node} has no \"tls\" client certificates; refusing to use an unauthenticated Docker API")
+    context = ssl.create_default_context(cafile=tls["ca"])
+    context.load_cert_chain(tls["cert"], tls["key"])
+    return context
+
+# Routes every container operation to the Docker node hosting the container.
+# Exposes the same interface as ContainerRuntime.
+class NodeRouter:
+    def __init__(self, nodes):
+        self.nodes = {}
+        for node, config in nodes.items():
+            engine = DockerEngineClient(socket_path=config.get("socket", DOCKER_SOCKET),
+                                        host=config.get("host"), port=config.get("port", 2376),
+                                        ssl_context=node_ssl_context(node, config))
+            self.nodes[node] = ContainerRuntime(engine, node=node)
+        self.default_node = next(iter(self.nodes))
+        self.placements = {}
+        self.exec_nodes = {}
+
+    def node_of(self, container_name):
+        """Node hosting a container: the registry's record, then containers not registered yet"""
+        record = registry.get(container_name)
+        if record and record.get("node") in self.nodes:
+            return record["node"]
+        return self.placements.get(container_name, self.default_node)
+
+    def assign(self, container_name, node):
+        """Pin a container that is not in the registry (yet) to a node"""
+        self.placements[container_name] = node
+
+    def release(self, container_name):
+        self.placements.pop(container_name, None)
+
+    def _for(self, container_name):
+        return self.nodes[self.node_of(container_name)]
+
+    async def start(self, name, checkpoint=None):
+        await self._for(name).start(name, checkpoint)
+
+    async def stop(self, name, grace=DOCKER_STOP_GRACE):
+        await self._for(name).stop(name, grace)
+
+    async def restart(self, name, grace=DOCKER_STOP_GRACE):
+        await self._for(name).restart(name, grace)
+
+    async def remove(self, name, force=False):
+        await self._for(name).remove(name, force)
+
+    async def pause(self, name):
+        await self._for(name).pause(name)
+
+    async def unpause(self, name):
+        await self._for(name).unpause(name)
+
+    async def checkpoint_create(self, name, checkpoint):
+        await self._for(name).checkpoint_create(name, checkpoint)
+
+    async def checkpoint_delete(self, name, checkpoint):
+        await self._for(name).checkpoint_delete(name, checkpoint)
+
+    async def inspect(self, name):
+        return await self._for(name).inspect(name)
+
+    async def stats(self, name):
+        return await self._for(name).stats(name)
+
+    async def update_resources(self, name, ram=None, cpu=None):
+        await self._for(name).update_resources(name, ram, cpu)
+
+    async def update_reservation(self, name, reservation):
+        await self._for(name).update_reservation(name, reservation)
+
+    async def rename(self, name, new_name):
+        node = self.node_of(name)
+        await self.nodes[node].rename(name, new_name)
+        self.release(name)
+        self.assign(new_name, node)
+
+    async def run(self, image, name, ram=None, cpu=None, labels=None, node=None):
+        node = node or self.node_of(name)
+        self.assign(name, node)
+        return await self.nodes[node].run(image, name, ram, cpu, labels)
+
+    async def exec_create(self, name, *command):
+        node = self.node_of(name)
+        exec_id = await self.nodes[node].exec_create(name, *command)
+        self.exec_nodes[exec_id] = node
+        return exec_id
+
+    async def exec_wait(self, exec_id, timeout=None):
+        try:
+            return await self.nodes[self.exec_nodes.get(exec_id, self.default_node)].exec_wait(exec_id, timeout)
+        finally:
+            self.exec_nodes.pop(exec_id, None)
+
+    async def exec_run(self, name, *command, timeout=None):
+        exec_id = await self.exec_create(name, *command)
+        return await self.exec_wait(exec_id, timeout)
+
+    async def exec_start(self, exec_id):
+        return await self.nodes[self.exec_nodes.get(exec_id, self.default_node)].exec_start(exec_id)
+
+    async def exec_attach(self, name, *command):
+        exec_id = await self.exec_create(name, *command)
+        return await self.exec_start(exec_id)
+
+    async def exec_inspect(self, exec_id):
+        """Inspect an exec; once it has exited its node is forgotten"""
+        result = await self.nodes[self.exec_nodes.get(exec_id, self.default_node)].exec_inspect(exec_id)
+        if not result.get("Running"):
+            self.exec_nodes.pop(exec_id, None)
+        return result
+
+    async def kill_exec(self, exec_id):
+        await self.nodes[self.exec_nodes.pop(exec_id, self.default_node)].kill_exec(exec_id)
+
+    async def list_containers(self, filters=None, node=None):
+        """Containers on one node, or on every reachable node; each entry is tagged with its "Node\""""
+        nodes = [node] if node else list(self.nodes)
+        results = await asyncio.gather(*(self.nodes[n].list_containers(filters) for n in nodes), return_exceptions=True)
+        containers = []
+        for node_name, result in zip(nodes, results):
+            if isinstance(result, Exception):
+                if node:
+                    raise result
+                print(f"Failed to list containers on node {node_name}: {result}")
+                continue
+            for container in result:
+                container["Node"] = node_name
+                containers.append(container)
+        return containers
+
+    async def list_names(self, node=None):
+        return [c["Names"][0].lstrip("/") for c in await self.list_containers(node=node) if c.get("Names")]
+
+    async def info(self, node):
+        return await self.nodes[node].info()
+
+runtime = NodeRouter(NODES)
+
+# Picks the node for a new VPS from each node's capacity (Docker /info) and
+# what the registry has already allocated there
+class PlacementScheduler:
+    def __init__(self, router, policy=PLACEMENT_POLICY):
+        self.router = router
+        self.policy = policy
+        self.node_info = {}
+
+    async def capacity(self, node):
+        """(memory in GB, CPU count) of a node, cached for NODE_INFO_TTL"""
+        cached = self.node_info.get(node)
+        if cached and time.monotonic() - cached[0] < NODE_INFO_TTL:
+            return cached[1], cached[2]
+        info = await self.router.info(node)
+        self.node_info[node] = (time.monotonic(), info.get("MemTotal", 0) / 1024 ** 3, info.get("NCPU", 0))
+        return self.node_info[node][1], self.node_info[node][2]
+
+    def forget(self, node):
+        """Drop a node's cached capacity, so the next placement checks it is reachable again"""
+        self.node_info.pop(node, None)
+
+    def allocated(self, node):
+        """(RAM in GB, CPUs, VPS count) allocated on a node by the registry"""
+        ram = cpu = count = 0
+        for record in registry.all():
+            if record.get("node") != node:
+                continue
+            count += 1
+            try:
+                ram += float(record["ram"])
+                cpu += float(record["cpu"])
+            except (TypeError, ValueError):
+                pass
+        return ram, cpu, count
+
+    async def node_loads(self):
+        """Capacity and allocation of every reachable node"""
+        loads = []
+        for node in self.router.nodes:
+            try:
+                mem_total, ncpu = await self.capacity(node)
+            except ContainerRuntimeError as e:
+                print(f"Node {node} is unreachable: {e}")
+                continue
+            ram, cpu, count = self.allocated(node)
+            loads.append({
+                "node": node,
+                "mem_total": mem_total,
+                "ncpu": ncpu,
+                "free_mem": mem_total - ram,
+                "free_cpu": ncpu - cpu,
+                "count": count,
+                "max_vps": NODES[node].get("max_vps")
+            })
+        return loads
+
+    async def choose(self, ram, cpu, nodes=None):
+        """Node for a new VPS with the given plan, optionally limited to some nodes"""
+        ram, cpu = float(ram), float(cpu)
+        loads = [l for l in await self.node_loads()
+                 if (not l["max_vps"] or l["count"] < l["max_vps"]) and (nodes is None or l["node"] in nodes)]
+        if not loads:
+            raise ContainerRuntimeError("No reachable Docker node has room for another VPS")
+        fitting = [l for l in loads if l["free_mem"] >= ram and l["free_cpu"] >= cpu]
+        if not fitting:
+            # Everything is overcommitted; use whichever node has the most headroom
+            return max(loads, key=lambda l: (l["free_mem"], -l["count"]))["node"]
+        if self.policy == "spread":
+            best = max(fitting, key=lambda l: (l["free_mem"] / max(l["mem_total"], 1), -l["count"]))
+        else:
+            best = min(fitting, key=lambda l: (l["free_mem"] - ram, l["free_cpu"] - cpu, l["count"]))
+        return best["node"]
+
+    async def summary(self):
+        lines = []
+        for l in await self.node_loads():
+            lines.append(
+                f"**{l['node']}**: `{l['count']}` VPS | RAM `{l['mem_total'] - l['free_mem']:.0f}/{l['mem_total']:.0f}GB`"
+                f" | CPU `{l['ncpu'] - l['free_cpu']:.0f}/{l['ncpu']}`"
+            )
+        return "\n".join(lines) or "No reachable nodes"
+
+placement = PlacementScheduler(runtime)
 
 # Helper functions
 def is_admin(user_id):
@@ -39,9 +1052,6 @@ def is_admin(user_id):
 def generate_random_string(length=8):
     return ''.join(random.choices(string.ascii_letters + string.digits, k=length))
 
-def generate_random_port(): 
-    return random.randint(1025, 65535)
-
 def parse_time_to_seconds(time_str):
     """Convert time string like '1d', '2h', '30m', '45s', '1y', '3M' to seconds"""
     if not time_str:
@@ -69,134 +1079,654 @@ def format_expiry_date(seconds_from_now):
         return None
     
     expiry_date = datetime.now() + timedelta(seconds=seconds_from_now)
-    return expiry_date.strftime("%Y-%m-%d %H:%M:%S")
+    return expiry_date.strftime(EXPIRY_FORMAT)
+
+def parse_expiry(expiry):
+    """Convert a stored expiry date to a Unix timestamp (None if it never expires)"""
+    if not expiry or expiry == 'None':
+        return None
+    try:
+        return datetime.strptime(expiry, EXPIRY_FORMAT).timestamp()
+    except ValueError:
+        return None
+
+def is_expired(record):
+    """Whether the VPS was stopped for its current expiry and waits for deletion (renewing clears this)"""
+    return bool(record and record.get("expired")) and record["expired"] == record["expiry"]
+
+# VPS registry: SQLite (WAL) on disk, mirrored in memory so reads never touch the disk
+REGISTRY_FIELDS = ("user", "container_name", "ssh_command", "ram", "cpu", "creator", "os_type", "expiry", "node", "http_routes", "hibernation", "expired", "abuse_stopped")
+# Columns added after the original schema, applied to existing databases on start-up
+REGISTRY_MIGRATIONS = {
+    "node": f"TEXT NOT NULL DEFAULT '{DEFAULT_NODE}'",
+    "http_routes": "TEXT NOT NULL DEFAULT '{}'",  # JSON object: hostname -> container port, served by /port-http
+    "hibernation": "TEXT NOT NULL DEFAULT ''",  # '', 'paused' or 'checkpointed'; set by the idle hibernator
+    "expired": "TEXT NOT NULL DEFAULT ''",  # expiry value the scheduler already stopped the VPS for
+    "abuse_stopped": "TEXT NOT NULL DEFAULT ''",  # Unix time the abuse monitor stopped the VPS, until it behaves again
+}
+
+class VPSRegistry:
+    def __init__(self, path, legacy_file=None):
+        self.path = path
+        self.lock = threading.Lock()
+        self.by_name = {}
+        self.by_owner = {}
+        self.listeners = []
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS vps (
+                container_name TEXT PRIMARY KEY,
+                user TEXT NOT NULL,
+                ssh_command TEXT,
+                ram TEXT,
+                cpu TEXT,
+                creator TEXT,
+                os_type TEXT,
+                expiry TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_vps_user ON vps(user);
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+        """)
+        self.migrate()
+        if legacy_file:
+            self.import_legacy(legacy_file)
+        self.load()
+
+    def migrate(self):
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(vps)")}
+        for column, definition in REGISTRY_MIGRATIONS.items():
+            if column not in columns:
+                self.conn.execute(f"ALTER TABLE vps ADD COLUMN {column} {definition}")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_vps_node ON vps(node)")
+
+    def load(self):
+        """Rebuild the in-memory mirror from disk"""
+        self.by_name.clear()
+        self.by_owner.clear()
+        with metrics.timer("dp_vps_db", op="load"):
+            cursor = self.conn.execute(f"SELECT {', '.join(REGISTRY_FIELDS)} FROM vps ORDER BY rowid")
+            for row in cursor:
+                self._index(dict(zip(REGISTRY_FIELDS, row)))
+
+    def _index(self, record):
+        self.by_name[record["container_name"]] = record
+        self.by_owner.setdefault(record["user"], {})[record["container_name"]] = record
+
+    def _unindex(self, container_name):
+        record = self.by_name.pop(container_name, None)
+        if record:
+            owned = self.by_owner.get(record["user"], {})
+            owned.pop(container_name, None)
+            if not owned:
+                self.by_owner.pop(record["user"], None)
+        return record
+
+    def import_legacy(self, legacy_file):
+        """One-time import of the old pipe-delimited database.txt"""
+        if self.conn.execute("SELECT 1 FROM meta WHERE key = 'legacy_imported'").fetchone():
+            return
+        records = []
+        if os.path.exists(legacy_file):
+            with open(legacy_file, 'r') as f:
+                for line in f:
+                    record = parse_database_line(line)
+                    if record:
+                        records.append(record)
+        with self.lock, metrics.timer("dp_vps_db", op="import_legacy"):
+            self.conn.execute("BEGIN")
+            try:
+                self.conn.executemany(
+                    f"INSERT OR REPLACE INTO vps ({', '.join(REGISTRY_FIELDS)}) VALUES ({', '.join('?' * len(REGISTRY_FIELDS))})",
+                    [tuple(r[k] for k in REGISTRY_FIELDS) for r in records]
+                )
+                self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('legacy_imported', ?)", (str(len(records)),))
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        if records:
+            print(f"Imported {len(records)} VPS entries from {legacy_file}")
+
+    def add(self, record):
+        with self.lock, metrics.timer("dp_vps_db", op="add"):
+            self.conn.execute(
+                f"INSERT OR REPLACE INTO vps ({', '.join(REGISTRY_FIELDS)}) VALUES ({', '.join('?' * len(REGISTRY_FIELDS))})",
+                tuple(record[k] for k in REGISTRY_FIELDS)
+            )
+            self._unindex(record["container_name"])
+            self._index(record)
+        self._notify("add", record, REGISTRY_FIELDS)
+
+    def update(self, container_name, **fields):
+        fields = {k: v for k, v in fields.items() if k in REGISTRY_FIELDS and k != "container_name"}
+        record = self.by_name.get(container_name)
+        if not record or not fields:
+            return False
+        with self.lock, metrics.timer("dp_vps_db", op="update"):
+            self.conn.execute(
+                f"UPDATE vps SET {', '.join(f'{k} = ?' for k in fields)} WHERE container_name = ?",
+                (*fields.values(), container_name)
+            )
+            if "user" in fields:
+                self._unindex(container_name)
+                record = {**record, **fields}
+                self._index(record)
+            else:
+                record.update(fields)
+        self._notify("update", record, tuple(fields))
+        return True
+
+    def remove(self, container_name):
+        return self.remove_many([container_name])
+
+    def remove_many(self, container_names):
+        names = [n for n in container_names if n in self.by_name]
+        if not names:
+            return 0
+        with self.lock, metrics.timer("dp_vps_db", op="remove"):
+            self.conn.execute("BEGIN")
+            try:
+                self.conn.executemany("DELETE FROM vps WHERE container_name = ?", [(n,) for n in names])
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+            removed = [self._unindex(name) for name in names]
+        for record in removed:
+            self._notify("remove", record, ())
+        return len(names)
+
+    def add_listener(self, callback):
+        """Call callback(event, record, changed_fields) after every add, update or remove"""
+        self.listeners.append(callback)
+
+    def _notify(self, event, record, changed):
+        for callback in self.listeners:
+            try:
+                callback(event, record, changed)
+            except Exception as e:
+                print(f"Registry listener failed: {e}")
+
+    def clear(self):
+        return self.remove_many(list(self.by_name))
+
+    def get(self, container_name):
+        return self.by_name.get(container_name)
+
+    def all(self):
+        return list(self.by_name.values())
+
+    def for_owner(self, user):
+        return list(self.by_owner.get(str(user), {}).values())
+
+    def __len__(self):
+        return len(self.by_name)
 
-def add_to_database(user, container_name, ssh_command, ram_limit=None, cpu_limit=None, creator=None, expiry=None, os_type="Ubuntu 22.04"):
-    with open(database_file, 'a') as f:
-        f.write(f"{user}|{container_name}|{ssh_command}|{ram_limit or '2048'}|{cpu_limit or '1'}|{creator or user}|{os_type}|{expiry or 'None'}\n")
+    def __contains__(self, container_name):
+        return container_name in self.by_name
+
+def parse_database_line(line):
+    """Parse a legacy database.txt line into a registry record"""
+    parts = line.strip().split('|')
+    if len(parts) < 2 or not parts[0] or not parts[1]:
+        return None
+    defaults = [None, None, "", "2048", "1", parts[0], "Ubuntu 22.04", "None", DEFAULT_NODE, "{}", "", "", ""]
+    parts = parts[:len(REGISTRY_FIELDS)] + defaults[len(parts):]
+    return dict(zip(REGISTRY_FIELDS, parts))
+
+def format_database_line(record):
+    """Render a registry record in the legacy pipe-delimited format"""
+    return '|'.join(str(record[k]) for k in REGISTRY_FIELDS)
+
+registry = None  # opened by init()
+metrics.add_collector(lambda: metrics.set("dp_vps_instances", len(registry)))
+
+def add_to_database(user, container_name, ssh_command, ram_limit=None, cpu_limit=None, creator=None, expiry=None, os_type="Ubuntu 22.04", node=None):
+    registry.add({
+        "user": str(user),
+        "container_name": container_name,
+        "ssh_command": ssh_command,
+        "ram": str(ram_limit or '2048'),
+        "cpu": str(cpu_limit or '1'),
+        "creator": str(creator or user),
+        "os_type": os_type,
+        "expiry": expiry or 'None',
+        "node": node or runtime.node_of(container_name),
+        "http_routes": "{}",
+        "hibernation": "",
+        "expired": "",
+        "abuse_stopped": ""
+    })
+    runtime.release(container_name)
 
 def remove_from_database(container_id):
-    if not os.path.exists(database_file):
-        return
-    with open(database_file, 'r') as f:
-        lines = f.readlines()
-    with open(database_file, 'w') as f:
-        for line in lines:
-            if container_id not in line:
-                f.write(line)
+    registry.remove(container_id)
+
+def update_ssh_command_in_database(container_id, ssh_command):
+    registry.update(container_id, ssh_command=ssh_command)
 
 def get_all_containers():
-    if not os.path.exists(database_file):
-        return []
-    with open(database_file, 'r') as f:
-        return [line.strip() for line in f.readlines()]
+    return [format_database_line(r) for r in registry.all()]
 
-def get_container_stats(container_id):
-    try:
-        # Get container status and basic info in one command
+def get_memory_limit_display(container_id):
+    """Get the configured RAM for a container from the registry"""
+    record = registry.get(container_id)
+    if record:
         try:
-            inspect_output = subprocess.check_output(["docker", "inspect", "--format", "{{.State.Status}}", container_id], 
-                                                   stderr=subprocess.DEVNULL, timeout=2).decode().strip()
-            status = inspect_output if inspect_output else "unknown"
-        except:
-            status = "unknown"
-        
-        # Get memory limit from database instead of Docker inspect
-        mem_limit_str = "Unknown"
+            return f"{int(record['ram'])}GB"
+        except (TypeError, ValueError):
+            pass
+    return "Unknown"
+
+def format_container_stats(container_id, status, mem_stats="0B / 0B", cpu_stats="0.00%"):
+    """Build the memory/CPU/status display for one container"""
+    mem_limit_str = get_memory_limit_display(container_id)
+
+    # Process memory usage
+    memory_display = f"0MB / {mem_limit_str}"
+
+    if mem_stats and mem_stats != "0B / 0B" and mem_stats != "0B":
+        # Parse the memory usage from docker stats (format: "45.2MiB / 2GiB")
+        if " / " in mem_stats:
+            used_mem, total_mem = mem_stats.split(" / ", 1)
+            memory_display = f"{used_mem} / {mem_limit_str}"
+        else:
+            memory_display = f"{mem_stats} / {mem_limit_str}"
+    elif status == "running":
+        # Quick fallback: show a small default value for running containers
+        memory_display = f"5MB / {mem_limit_str}"
+
+    # Process CPU usage
+    cpu_display = "0.00%"
+    if status == "running":
+        if cpu_stats and cpu_stats != "0.00%" and cpu_stats != "0%":
+            cpu_display = cpu_stats
+        else:
+            cpu_display = "0.10%"
+
+    return {
+        "memory": memory_display,
+        "cpu": cpu_display,
+        "status": "🟢 Running" if status == "running" else "🔴 Stopped"
+    }
+
+# Previous CPU counters per container; one-shot stats carry no precpu data,
+# so CPU % is computed against the last sample we took ourselves
+cpu_samples = {}
+
+def forget_container_usage(container_name):
+    """Drop the CPU baseline and exported gauges of a container that is no longer running"""
+    cpu_samples.pop(container_name, None)
+    for gauge in ("dp_vps_container_memory_bytes", "dp_vps_container_memory_limit_bytes", "dp_vps_container_cpu_percent"):
+        metrics.remove(gauge, container=container_name)
+
+def on_registry_change_usage(event, record, changed):
+    if event == "remove":
+        forget_container_usage(record["container_name"])
+
+
+def format_binary_size(num_bytes):
+    """Format a byte count the way `docker stats` does (e.g. 45.2MiB)"""
+    value = float(num_bytes)
+    for unit in ("B", "KiB", "MiB", "GiB", "TiB"):
+        if value < 1024 or unit == "TiB":
+            return f"{value:.4g}{unit}"
+        value /= 1024
+
+def parse_engine_stats(container_name, sample):
+    """Turn an Engine API stats sample into (mem_stats, cpu_stats) display strings"""
+    memory = sample.get("memory_stats") or {}
+    detail = memory.get("stats") or {}
+    used = memory.get("usage", 0) - detail.get("inactive_file", detail.get("total_inactive_file", 0))
+    mem_stats = f"{format_binary_size(max(used, 0))} / {format_binary_size(memory.get('limit', 0))}"
+    metrics.set("dp_vps_container_memory_bytes", max(used, 0), container=container_name)
+    metrics.set("dp_vps_container_memory_limit_bytes", memory.get("limit", 0), container=container_name)
+
+    cpu = sample.get("cpu_stats") or {}
+    total = (cpu.get("cpu_usage") or {}).get("total_usage", 0)
+    system = cpu.get("system_cpu_usage", 0)
+    online = cpu.get("online_cpus") or len((cpu.get("cpu_usage") or {}).get("percpu_usage") or []) or 1
+    cpu_percent = 0.0
+    previous = cpu_samples.get(container_name)
+    if previous:
+        cpu_delta = total - previous[0]
+        system_delta = system - previous[1]
+        if cpu_delta > 0 and system_delta > 0:
+            cpu_percent = cpu_delta / system_delta * online * 100
+    cpu_samples[container_name] = (total, system)
+    metrics.set("dp_vps_container_cpu_percent", round(cpu_percent, 3), container=container_name)
+    return mem_stats, f"{cpu_percent:.2f}%"
+
+def read_cgroup_stats(paths):
+    """Engine API style stats samples of local containers, read from their cgroup v2 files.
+
+    A monotonic clock stands in for the engine's system CPU counter with one
+    CPU online, so parse_engine_stats gives the same CPU % (share of one core).
+    """
+    host_memory = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    samples = {}
+    for name, path in paths.items():
         try:
-            if os.path.exists(database_file):
-                with open(database_file, 'r') as f:
-                    for line in f:
-                        parts = line.strip().split('|')
-                        if len(parts) >= 2 and container_id in parts[1]:
-                            # Check if we have RAM limit in the database
-                            if len(parts) >= 4 and parts[3]:
-                                try:
-                                    ram_limit = int(parts[3])
-                                    mem_limit_str = f"{ram_limit}GB"
-                                except:
-                                    mem_limit_str = "Unknown"
-                            break
-        except:
-            mem_limit_str = "Unknown"
-        
-        # Get memory and CPU usage in one command
+            usage, memory, limit = AbuseMonitor.read_cgroup(path)
+            with open(os.path.join(path, "memory.stat")) as f:
+                inactive_file = next((int(line.split()[1]) for line in f if line.startswith("inactive_file ")), 0)
+        except (OSError, ValueError, StopIteration):
+            continue
+        samples[name] = {
+            "memory_stats": {"usage": memory, "limit": limit or host_memory, "stats": {"inactive_file": inactive_file}},
+            "cpu_stats": {"cpu_usage": {"total_usage": usage * 1000}, "system_cpu_usage": time.monotonic_ns(), "online_cpus": 1}
+        }
+    return samples
+
+async def sample_cgroups(container_names):
+    """Stats samples of the running containers on this host, read in bulk off the event loop"""
+    local = abuse_monitor.local_nodes()
+    names = [name for name in container_names if runtime.node_of(name) in local]
+    if not names or not await asyncio.to_thread(os.path.exists, os.path.join(abuse_monitor.cgroup_root, "cgroup.controllers")):
+        return {}
+    paths = await asyncio.gather(*(abuse_monitor.cgroup_for(name) for name in names))
+    return await asyncio.to_thread(read_cgroup_stats, {name: path for name, path in zip(names, paths) if path})
+
+# Live state of every VPS container, kept from the Docker events stream.
+# Each node is listed once per (re)connect and then only follows events.
+class ContainerStateTracker:
+    def __init__(self, router, prefix="VPS_"):
+        self.router = router
+        self.prefix = prefix
+        self.states = {}  # (node, name) -> {"id": ..., "state": ...}
+        self.names = {}  # (node, container ID) -> name
+        self.synced = set()
+        self.tasks = {}
+        self.oom_notified = {}
+
+    def start(self):
+        for node in self.router.nodes:
+            task = self.tasks.get(node)
+            if task is None or task.done():
+                self.tasks[node] = asyncio.create_task(self.follow(node))
+
+    def is_following(self, node):
+        return node in self.synced
+
+    def state_of(self, container_name):
+        """Engine state of a container on its node, or None if it does not exist there"""
+        entry = self.states.get((self.router.node_of(container_name), container_name))
+        return entry["state"] if entry else None
+
+    def _set(self, node, name, container_id, state):
+        self.states[(node, name)] = {"id": container_id, "state": state}
+        self.names[(node, container_id)] = name
+
+    def _drop(self, node, name):
+        entry = self.states.pop((node, name), None)
+        if entry:
+            self.names.pop((node, entry["id"]), None)
+        return entry
+
+    async def resync(self, node):
+        """Replace everything known about a node with a fresh listing"""
+        containers = await self.router.list_containers(filters={"name": [self.prefix]}, node=node)
+        for key in [key for key in self.states if key[0] == node]:
+            self._drop(*key)
+        for container in containers:
+            name = container["Names"][0].lstrip("/") if container.get("Names") else ""
+            if name.startswith(self.prefix):
+                self._set(node, name, container["Id"], container.get("State") or "unknown")
+
+    async def inspect_state(self, node, name):
         try:
-            stats_output = subprocess.check_output(["docker", "stats", container_id, "--no-stream", "--format", "{{.MemUsage}}|{{.CPUPerc}}"], 
-                                                 stderr=subprocess.DEVNULL, timeout=2).decode().strip()
-            if "|" in stats_output:
-                mem_stats, cpu_stats = stats_output.split("|")
-            else:
-                mem_stats = "0B / 0B"
-                cpu_stats = "0.00%"
-        except:
-            mem_stats = "0B / 0B"
-            cpu_stats = "0.00%"
-        
-        # Process memory usage
-        memory_display = f"0MB / {mem_limit_str}"
-        
-        if mem_stats and mem_stats != "0B / 0B" and mem_stats != "0B":
-            # Parse the memory usage from docker stats (format: "45.2MiB / 2GiB")
+            details = await self.router.nodes[node].inspect(name)
+        except ContainerRuntimeError:
+            return
+        entry = self.states.get((node, name))
+        if entry and entry["state"] == "unknown":
+            entry["state"] = details.get("State", {}).get("Status") or "unknown"
+
+    async def follow(self, node):
+        engine = self.router.nodes[node].engine
+        delay = 1
+        while True:
+            # Subscribing from just before the listing replays anything that
+            # changes while it runs, so no event falls between the two
+            since = int(time.time()) - 1
             try:
-                if " / " in mem_stats:
-                    used_mem, total_mem = mem_stats.split(" / ")
-                    memory_display = f"{used_mem} / {mem_limit_str}"
-                else:
-                    memory_display = f"{mem_stats} / {mem_limit_str}"
-            except:
-                memory_display = f"0MB / {mem_limit_str}"
+                events = engine.events(since=since, filters={"type": ["container"], "event": list(CONTAINER_EVENTS)})
+                await self.resync(node)
+                self.synced.add(node)
+                delay = 1
+                async for event in events:
+                    self.apply(node, event)
+                print(f"Docker event stream for node {node} closed, resyncing")
+            except Exception as e:
+                print(f"Docker event stream for node {node} failed: {e}")
+            finally:
+                self.synced.discard(node)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30)
+
+    def apply(self, node, event):
+        action = event.get("Action") or event.get("status", "")
+        actor = event.get("Actor", {})
+        container_id = actor.get("ID") or event.get("id")
+        attributes = actor.get("Attributes", {})
+        name = attributes.get("name") or self.names.get((node, container_id), "")
+
+        if action == "rename":
+            old_name = attributes.get("oldName", "").lstrip("/")
+            entry = self._drop(node, old_name)
+            if name.startswith(self.prefix):
+                self._set(node, name, container_id, entry["state"] if entry else "unknown")
+                if not entry:
+                    # Renamed into the VPS namespace (e.g. a claimed warm pool container)
+                    asyncio.create_task(self.inspect_state(node, name))
+            return
+        if not name.startswith(self.prefix):
+            return
+        if action == "destroy":
+            self._drop(node, name)
+        elif action == "oom":
+            self.on_oom(node, name)
+        elif action in CONTAINER_EVENTS:
+            self._set(node, name, container_id, CONTAINER_EVENTS[action])
+
+    def on_oom(self, node, name):
+        record = registry.get(name)
+        if not record or record["node"] != node:
+            return
+        print(f"Container {name} hit its memory limit")
+        now = time.monotonic()
+        if now - self.oom_notified.get(name, -OOM_NOTIFY_COOLDOWN) < OOM_NOTIFY_COOLDOWN:
+            return
+        self.oom_notified[name] = now
+        embed = discord.Embed(
+            title="⚠️ VPS Out of Memory",
+            description=(
+                f"A process in your VPS `{name}` was killed because it used all of its "
+                f"`{record['ram']}GB` of memory. Check `dmesg` or your service logs inside the VPS."
+            ),
+            color=0x2400ff
+        )
+        asyncio.create_task(send_owner_dm(record, embed))
+
+container_tracker = ContainerStateTracker(runtime)
+
+async def container_states(container_names):
+    """Engine state ("running", "exited", ...) of each named container.
+
+    Containers on nodes followed by container_tracker are answered from its
+    table; the rest come from one container listing.
+    """
+    states = {}
+    wanted = set()
+    for name in container_names:
+        if container_tracker.is_following(runtime.node_of(name)):
+            state = container_tracker.state_of(name)
+            if state:
+                states[name] = state
         else:
-            # Quick fallback: show a small default value for running containers
-            if status == "running":
-                memory_display = f"5MB / {mem_limit_str}"
-            else:
-                memory_display = f"0MB / {mem_limit_str}"
-        
-        # Process CPU usage
-        cpu_display = "0.00%"
-        if status == "running":
-            if cpu_stats and cpu_stats != "0.00%" and cpu_stats != "0%":
-                cpu_display = cpu_stats
-            else:
-                cpu_display = "0.10%"
-        
+            wanted.add(name)
+    if not wanted:
+        return states
+    try:
+        for container in await runtime.list_containers():
+            for name in container.get("Names", []):
+                name = name.lstrip("/")
+                # Only trust the node the VPS is placed on
+                if name in wanted and container["Node"] == runtime.node_of(name):
+                    states[name] = container.get("State") or "unknown"
+    except ContainerRuntimeError:
+        pass
+    return states
+
+async def collect_container_stats(container_names=None):
+    """Collect status, memory and CPU for many containers in one pass.
+
+    One container listing gives every status. Memory and CPU of the running
+    containers on this host are read from their cgroups in one batch; only
+    containers on remote nodes (or without a readable cgroup) cost an engine
+    stats request each, sent concurrently over the pooled connections.
+    Returns a dict keyed by container name and defaults to every container
+    in the registry.
+    """
+    if container_names is None:
+        container_names = [r["container_name"] for r in registry.all()]
+    wanted = set(container_names)
+    if not wanted:
+        return {}
+
+    states = await container_states(wanted)
+
+    # Memory and CPU of every running container
+    running = [name for name in container_names if states.get(name) == "running"]
+    samples = await sample_cgroups(running)
+    unsampled = [name for name in running if name not in samples]
+    results = await asyncio.gather(*(runtime.stats(name) for name in unsampled), return_exceptions=True)
+    samples.update((name, sample) for name, sample in zip(unsampled, results) if isinstance(sample, dict))
+    usage = {name: parse_engine_stats(name, sample) for name, sample in samples.items()}
+    for name in list(cpu_samples):
+        if name in wanted and name not in usage:
+            forget_container_usage(name)
+
+    stats = {}
+    for name in container_names:
+        try:
+            mem_stats, cpu_stats = usage.get(name, ("0B / 0B", "0.00%"))
+            stats[name] = format_container_stats(name, states.get(name, "unknown"), mem_stats, cpu_stats)
+        except Exception:
+            # Ultimate fallback - return safe defaults
+            stats[name] = {"memory": "N/A", "cpu": "N/A", "status": "🔴 Stopped"}
+    return stats
+
+async def get_container_stats(container_id):
+    return (await collect_container_stats([container_id])).get(
+        container_id, {"memory": "N/A", "cpu": "N/A", "status": "🔴 Stopped"}
+    )
+
+# Host metrics read straight from procfs and statvfs
+def parse_pressure(text):
+    """PSI file contents as {"some": {"avg10": 0.5, ...}, "full": {...}}"""
+    pressure = {}
+    for line in text.splitlines():
+        kind, *fields = line.split()
+        pressure[kind] = {k: float(v) for k, v in (field.split("=") for field in fields)}
+    return pressure
+
+class HostMetrics:
+    def __init__(self, proc_root=PROC_ROOT, disk_path="/"):
+        self.proc_root = proc_root
+        self.disk_path = disk_path
+        self.previous_cpu = self.read_cpu_times()
+
+    def _read(self, name):
+        with open(os.path.join(self.proc_root, name), 'r') as f:
+            return f.read()
+
+    def read_meminfo(self):
+        """/proc/meminfo values in bytes"""
+        meminfo = {}
+        for line in self._read("meminfo").splitlines():
+            key, _, value = line.partition(":")
+            parts = value.split()
+            if parts:
+                meminfo[key] = int(parts[0]) * (1024 if len(parts) > 1 and parts[1] == "kB" else 1)
+        return meminfo
+
+    def read_cpu_times(self):
+        """(busy, total) jiffies per CPU line of /proc/stat ("cpu" is the aggregate)"""
+        times = {}
+        for line in self._read("stat").splitlines():
+            if not line.startswith("cpu"):
+                break
+            name, *values = line.split()
+            # user nice system idle iowait irq softirq steal (guest time is already in user)
+            values = [int(v) for v in values[:8]]
+            idle = values[3] + values[4]
+            times[name] = (sum(values) - idle, sum(values))
+        return times
+
+    def cpu_utilisation(self):
+        """CPU busy % per CPU line since the previous call"""
+        current = self.read_cpu_times()
+        usage = {}
+        for name, (busy, total) in current.items():
+            previous_busy, previous_total = self.previous_cpu.get(name, (0, 0))
+            delta_total = total - previous_total
+            usage[name] = 100.0 * (busy - previous_busy) / delta_total if delta_total > 0 else 0.0
+        self.previous_cpu = current
+        return usage
+
+    def read_loadavg(self):
+        return tuple(float(v) for v in self._read("loadavg").split()[:3])
+
+    def read_pressure(self, resource):
+        """PSI averages for cpu/memory/io, e.g. {"some": {"avg10": 0.5, ...}}; None without PSI support"""
+        try:
+            return parse_pressure(self._read(os.path.join("pressure", resource)))
+        except OSError:
+            return None
+
+    def read_disk(self):
+        """(total, used, free) bytes of the filesystem holding disk_path"""
+        st = os.statvfs(self.disk_path)
+        total = st.f_blocks * st.f_frsize
+        free = st.f_bavail * st.f_frsize
+        return total, total - st.f_bfree * st.f_frsize, free
+
+    def sample(self):
+        meminfo = self.read_meminfo()
+        usage = self.cpu_utilisation()
+        disk_total, disk_used, disk_free = self.read_disk()
         return {
-            "memory": memory_display,
-            "cpu": cpu_display,
-            "status": "🟢 Running" if status == "running" else "🔴 Stopped"
+            "mem_total": meminfo.get("MemTotal", 0),
+            "mem_available": meminfo.get("MemAvailable", meminfo.get("MemFree", 0)),
+            "mem_used": meminfo.get("MemTotal", 0) - meminfo.get("MemAvailable", meminfo.get("MemFree", 0)),
+            "swap_total": meminfo.get("SwapTotal", 0),
+            "swap_used": meminfo.get("SwapTotal", 0) - meminfo.get("SwapFree", 0),
+            "cpu_percent": usage.pop("cpu", 0.0),
+            "per_core_percent": [usage[name] for name in sorted(usage, key=lambda n: int(n[3:]))],
+            "loadavg": self.read_loadavg(),
+            "pressure": {resource: self.read_pressure(resource) for resource in ("cpu", "memory", "io")},
+            "disk_total": disk_total,
+            "disk_used": disk_used,
+            "disk_free": disk_free
         }
-    except Exception as e:
-        # Ultimate fallback - return safe defaults
-        return {"memory": "N/A", "cpu": "N/A", "status": "🔴 Stopped"}
+
+host_metrics = HostMetrics()
+
+def format_gb(num_bytes):
+    return f"{num_bytes / 1024 ** 3:.1f}GB"
 
 def get_system_stats():
     try:
-        # Get total memory usage
-        total_mem = subprocess.check_output(["free", "-m"]).decode().strip()
-        mem_lines = total_mem.split('\n')
-        if len(mem_lines) >= 2:
-            mem_values = mem_lines[1].split()
-            total_mem_mb = int(mem_values[1])
-            used_mem_mb = int(mem_values[2])
-            
-            # Convert to GB
-            total_mem_gb = total_mem_mb // 1024
-            used_mem_gb = used_mem_mb // 1024
-            
-        # Get disk usage
-        disk_usage = subprocess.check_output(["df", "-h", "/"]).decode().strip()
-        disk_lines = disk_usage.split('\n')
-        if len(disk_lines) >= 2:
-            disk_values = disk_lines[1].split()
-            total_disk = disk_values[1]
-            used_disk = disk_values[2]
-            
+        sample = host_metrics.sample()
         return {
-            "total_memory": f"{total_mem_gb}GB",
-            "used_memory": f"{used_mem_gb}GB",
-            "total_disk": total_disk,
-            "used_disk": used_disk
+            "total_memory": format_gb(sample["mem_total"]),
+            "used_memory": format_gb(sample["mem_used"]),
+            "total_disk": format_gb(sample["disk_total"]),
+            "used_disk": format_gb(sample["disk_used"]),
+            "metrics": sample
         }
     except Exception as e:
         return {
@@ -204,84 +1734,1345 @@ def get_system_stats():
             "used_memory": "N/A",
             "total_disk": "N/A",
             "used_disk": "N/A",
+            "metrics": None,
             "error": str(e)
         }
 
-async def capture_ssh_session_line(process):
-    while True:
-        output = await process.stdout.readline()
-        if not output:
-            break
-        output = output.decode('utf-8').strip()
-        if "ssh session:" in output:
-            return output.split("ssh session:")[1].strip()
-    return None
+def format_cpu_summary(sample):
+    """CPU utilisation, load average and per-core utilisation lines for the /node embed"""
+    load1, load5, load15 = sample["loadavg"]
+    cores = sample["per_core_percent"]
+    if len(cores) <= 16:
+        per_core = " ".join(f"{c:.0f}%" for c in cores)
+    else:
+        per_core = f"min {min(cores):.0f}% / avg {sum(cores) / len(cores):.0f}% / max {max(cores):.0f}%"
+    return (
+        f"Usage: `{sample['cpu_percent']:.1f}%` across `{len(cores)}` cores\n"
+        f"Load average: `{load1:.2f} {load5:.2f} {load15:.2f}`\n"
+        f"Per-core utilisation: `{per_core}`"
+    )
+
+def format_pressure_summary(sample):
+    """PSI 'some avg10' per resource for the /node embed"""
+    parts = []
+    for resource, pressure in sample["pressure"].items():
+        if pressure and "some" in pressure:
+            parts.append(f"{resource} `{pressure['some']['avg10']:.1f}%`")
+    return " | ".join(parts) or "Not available on this kernel"
+
+# Shared stats snapshot, refreshed in the background by stats_sampler
+class StatsCache:
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.containers = {}
+        self.system = None
+        self.updated_at = None
+        self.refresh_lock = asyncio.Lock()
+
+    def age(self):
+        if self.updated_at is None:
+            return None
+        return time.monotonic() - self.updated_at
+
+    def is_fresh(self):
+        age = self.age()
+        return age is not None and age <= self.ttl
+
+    def age_text(self):
+        age = self.age()
+        if age is None:
+            return "Stats not sampled yet"
+        return f"Stats updated {int(age)}s ago"
+
+    async def refresh(self):
+        """Take a new snapshot; concurrent callers share a single refresh"""
+        requested_at = time.monotonic()
+        async with self.refresh_lock:
+            if self.updated_at is not None and self.updated_at >= requested_at:
+                return
+            containers, system = await asyncio.gather(
+                collect_container_stats(),
+                asyncio.to_thread(get_system_stats)
+            )
+            self.containers = containers
+            self.system = system
+            self.updated_at = time.monotonic()
+
+    async def get_system(self):
+        if not self.is_fresh():
+            await self.refresh()
+        return self.system
+
+    async def get_containers(self, container_names):
+        """Stats for the given containers, keyed by name"""
+        if not self.is_fresh():
+            await self.refresh()
+        missing = [name for name in container_names if name not in self.containers]
+        if missing:
+            # Containers deployed since the last sample
+            self.containers.update(await collect_container_stats(missing))
+        stats = {}
+        for name in container_names:
+            stats[name] = self.containers[name]
+            # Status comes live from the event stream even when usage is from the last sample
+            if container_tracker.is_following(runtime.node_of(name)):
+                running = container_tracker.state_of(name) == "running"
+                if running != (stats[name]["status"] == "🟢 Running"):
+                    stats[name] = format_container_stats(name, "running" if running else "exited")
+        return stats
+
+stats_cache = StatsCache(STATS_CACHE_TTL)
+
+# One tmate server per container on a named socket. The SSH string is
+# cached and only regenerated when the session is gone.
+class TmateSessionManager:
+    def __init__(self, socket_path=TMATE_SOCKET):
+        self.socket_path = socket_path
+        self.sessions = {}
+        self.execs = {}
+        self.locks = {}
+
+    async def _tmate(self, container_name, *args, timeout=TMATE_COMMAND_TIMEOUT):
+        """Run a tmate command against the container's socket, tracking the exec until it exits"""
+        with metrics.timer("dp_vps_tmate", op=args[0]):
+            exec_id = await runtime.exec_create(container_name, "tmate", "-S", self.socket_path, *args)
+            owned = self.execs.setdefault(container_name, set())
+            owned.add(exec_id)
+            try:
+                return await runtime.exec_wait(exec_id, timeout)
+            finally:
+                owned.discard(exec_id)
+
+    async def is_alive(self, container_name):
+        try:
+            exit_code, output = await self._tmate(container_name, "has-session")
+            return exit_code == 0
+        except ContainerRuntimeError:
+            return False
+
+    async def _read_ssh(self, container_name):
+        exit_code, output = await self._tmate(container_name, "display", "-p", "#{tmate_ssh}")
+        output = output.strip()
+        return output if exit_code == 0 and output.startswith("ssh ") else None
+
+    async def get_session(self, container_name, force_new=False, wait_boot=True):
+        """SSH command for the container's tmate session, starting one if needed.
+
+        A new session is only started once the container has booted (unless the
+        caller already waited). Returns None if tmate does not become ready
+        within TMATE_READY_TIMEOUT.
+        """
+        lock = self.locks.setdefault(container_name, asyncio.Lock())
+        async with lock:
+            if not force_new and await self.is_alive(container_name):
+                cached = self.sessions.get(container_name) or await self._read_ssh(container_name)
+                if cached:
+                    self.sessions[container_name] = cached
+                    return cached
+
+            if wait_boot and not await wait_for_boot(container_name, BOOT_READY_TIMEOUT):
+                print(f"{container_name} did not finish booting within {BOOT_READY_TIMEOUT}s; starting tmate anyway")
+
+            # Reap whatever is left of the previous session before starting a new one
+            self.sessions.pop(container_name, None)
+            try:
+                await self._tmate(container_name, "kill-server")
+            except ContainerRuntimeError:
+                pass
+            await self._tmate(container_name, "new-session", "-d")
+            try:
+                exit_code, output = await self._tmate(container_name, "wait", "tmate-ready", timeout=TMATE_READY_TIMEOUT)
+            except ContainerRuntimeError:
+                return None
+            if exit_code != 0:
+                return None
+            ssh_command = await self._read_ssh(container_name)
+            if ssh_command:
+                self.sessions[container_name] = ssh_command
+            return ssh_command
+
+    async def forget(self, container_name):
+        """Drop the cached session and kill any exec still running for the container"""
+        self.sessions.pop(container_name, None)
+        self.locks.pop(container_name, None)
+        for exec_id in list(self.execs.pop(container_name, ())):
+            await runtime.kill_exec(exec_id)
+
+tmate_sessions = TmateSessionManager()
+
+class SupervisorError(Exception):
+    pass
+
+# Long-lived processes the bot starts inside VPS containers (serveo tunnels),
+# keyed by VPS and purpose. Output is drained as it arrives so pipes never
+# fill, only the last few lines are kept, and a process that exits is
+# restarted with backoff. Everything a VPS owns is reaped when the container
+# stops or the VPS is deleted.
+class ProcessSupervisor:
+    def __init__(self, runtime, max_per_vps=SUPERVISOR_MAX_PER_VPS):
+        self.runtime = runtime
+        self.max_per_vps = max_per_vps
+        self.children = {}  # (container name, purpose) -> child state
+
+    def for_container(self, container_name):
+        return sorted((c for (name, purpose), c in self.children.items() if name == container_name),
+                      key=lambda c: c["purpose"])
+
+    def all(self):
+        return sorted(self.children.values(), key=lambda c: (c["container"], c["purpose"]))
+
+    async def spawn(self, container_name, purpose, *command, match=None, restart=True):
+        """Start a supervised process, replacing one with the same purpose.
+
+        With match, child["ready"] resolves to the first output line containing it
+        (or None if the process exits first).
+        """
+        key = (container_name, purpose)
+        if key in self.children:
+            await self.stop(container_name, purpose)
+        elif len(self.for_container(container_name)) >= self.max_per_vps:
+            raise SupervisorError(f"`{container_name}` already runs {self.max_per_vps} background processes.")
+        child = {
+            "container": container_name,
+            "purpose": purpose,
+            "command": command,
+            "match": match,
+            "restart": restart,
+            "status": "starting",
+            "exec_id": None,
+            "started": None,
+            "restarts": 0,
+            "exit_code": None,
+            "error": None,
+            "matched": None,
+            "output": collections.deque(maxlen=SUPERVISOR_LOG_LINES),
+            "ready": asyncio.get_running_loop().create_future()
+        }
+        self.children[key] = child
+        child["task"] = asyncio.create_task(self.run(child))
+        return child
+
+    async def stop(self, container_name, purpose):
+        child = self.children.pop((container_name, purpose), None)
+        if not child:
+            return False
+        child["task"].cancel()
+        await asyncio.gather(child["task"], return_exceptions=True)
+        if child["exec_id"]:
+            await self.runtime.kill_exec(child["exec_id"])
+        return True
+
+    def reap(self, container_name):
+        """Stop every process a VPS owns; returns how many were running"""
+        children = self.for_container(container_name)
+        for child in children:
+            asyncio.create_task(self.stop(container_name, child["purpose"]))
+        return len(children)
+
+    def on_registry_change(self, event, record, changed):
+        if event == "remove":
+            self.reap(record["container_name"])
+
+    async def container_running(self, container_name):
+        try:
+            details = await self.runtime.inspect(container_name)
+        except ContainerRuntimeError:
+            return False
+        state = details.get("State") or {}
+        return bool(state.get("Running"))
+
+    async def run(self, child):
+        key = (child["container"], child["purpose"])
+        delay = SUPERVISOR_BACKOFF_BASE
+        try:
+            while True:
+                started = time.monotonic()
+                stream = None
+                try:
+                    child["exec_id"] = await self.runtime.exec_create(child["container"], *child["command"])
+                    stream = await self.runtime.exec_start(child["exec_id"])
+                    child["status"] = "running"
+                    child["started"] = time.time()
+                    child["error"] = None
+                    await self.drain(child, stream)
+                    result = await self.runtime.exec_inspect(child["exec_id"])
+                    child["exit_code"] = result.get("ExitCode")
+                except ContainerRuntimeError as e:
+                    child["error"] = str(e)
+                finally:
+                    if stream:
+                        stream.close()
+                child["exec_id"] = None
+                if not child["restart"] or not await self.container_running(child["container"]):
+                    return
+                if time.monotonic() - started >= SUPERVISOR_STABLE_AFTER:
+                    delay = SUPERVISOR_BACKOFF_BASE
+                child["status"] = "backoff"
+                child["restarts"] += 1
+                metrics.inc("dp_vps_supervisor_restarts_total", purpose=child["purpose"].split(":")[0])
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, SUPERVISOR_BACKOFF_MAX)
+        finally:
+            if self.children.get(key) is child:
+                del self.children[key]
+            if not child["ready"].done():
+                child["ready"].set_result(None)
+
+    async def drain(self, child, stream):
+        """Read the process's output until it exits, keeping only recent lines"""
+        partial = b""
+        while True:
+            stream_type, data = await stream.read_frame()
+            if stream_type is None:
+                break
+            *lines, partial = (partial + data).split(b"\n")
+            if len(partial) > 4096:
+                lines.append(partial)
+                partial = b""
+            for line in lines:
+                line = line.decode("utf-8", errors="replace").strip()
+                if not line:
+                    continue
+                child["output"].append(line[:200])
+                if child["match"] and child["match"] in line:
+                    child["matched"] = line
+                    if not child["ready"].done():
+                        child["ready"].set_result(line)
+
+supervisor = ProcessSupervisor(runtime)
+metrics.add_collector(lambda: metrics.set("dp_vps_supervised_processes", len(supervisor.children)))
+metrics.describe("dp_vps_supervised_processes", "gauge", "Long-lived processes the bot supervises inside VPS containers")
+metrics.describe("dp_vps_supervisor_restarts_total", "counter", "Restarts of supervised processes after they exited")
+
+def image_build_context(dockerfile=IMAGE_DOCKERFILE):
+    """Tar archive holding just the Dockerfile, which is all the image build needs"""
+    with open(dockerfile, "rb") as f:
+        content = f.read()
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w") as archive:
+        info = tarfile.TarInfo("Dockerfile")
+        info.size = len(content)
+        archive.addfile(info, io.BytesIO(content))
+    return buffer.getvalue()
+
+# VPS images per node. On start-up every image in IMAGE_CATALOG is inspected
+# on every node and its ID recorded; missing ones are built in the
+# background. Deploys use the recorded ID, so an image rebuilt under the
+# same tag never changes a deploy that is already under way.
+class ImageCatalog:
+    def __init__(self, router, registry, catalog=IMAGE_CATALOG):
+        self.router = router
+        self.registry = registry
+        self.catalog = catalog
+        self.status = {}  # (node, os_type) -> "checking", "ready", "missing", "building" or "failed"
+        self.errors = {}  # (node, os_type) -> last error
+        self.digests = {}  # (node, os_type) -> image ID
+        self.builds = {}  # node -> build task
+        self.task = None
+        with registry.lock:
+            registry.conn.execute("""
+                CREATE TABLE IF NOT EXISTS images (
+                    node TEXT NOT NULL,
+                    os_type TEXT NOT NULL,
+                    image TEXT NOT NULL,
+                    digest TEXT NOT NULL,
+                    updated TEXT,
+                    PRIMARY KEY (node, os_type)
+                )
+            """)
+        for node, os_type, digest in registry.conn.execute("SELECT node, os_type, digest FROM images"):
+            self.digests[(node, os_type)] = digest
+
+    def ready_nodes(self, os_type):
+        return [node for node in self.router.nodes if self.status.get((node, os_type)) == "ready"]
+
+    def is_ready(self, os_type, node=None):
+        if node:
+            return self.status.get((node, os_type)) == "ready"
+        return bool(self.ready_nodes(os_type))
+
+    def tag(self, os_type):
+        image = self.catalog[os_type]["image"]
+        return f"{image}-fastboot" if IMAGE_FAST_BOOT else image
+
+    def image_for(self, os_type, node):
+        """Image ID to create a container from, falling back to the tag before the first check"""
+        if self.is_ready(os_type, node):
+            return self.digests[(node, os_type)]
+        return self.tag(os_type if os_type in self.catalog else next(iter(self.catalog)))
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.check_all())
+
+    async def check_all(self):
+        await asyncio.gather(*(self.check_node(node) for node in self.router.nodes))
+
+    async def check_node(self, node):
+        for os_type in self.catalog:
+            await self.check(node, os_type)
+        if any(self.status.get((node, os_type)) == "missing" for os_type in self.catalog):
+            self.build_missing(node)
+
+    async def check(self, node, os_type):
+        """Inspect one catalogued image on a node; returns whether it is ready"""
+        key = (node, os_type)
+        image = self.tag(os_type)
+        self.status[key] = "checking"
+        try:
+            details = await self.router.nodes[node].image_inspect(image)
+        except DockerAPIError as e:
+            if e.status != 404:
+                self.status[key], self.errors[key] = "failed", str(e)
+                return False
+            self.status[key] = "missing"
+            print(f"Image {image} is missing on {node}")
+            return False
+        except ContainerRuntimeError as e:
+            self.status[key], self.errors[key] = "failed", str(e)
+            return False
+        recorded = self.digests.get(key)
+        if recorded and recorded != details["Id"]:
+            print(f"Image {image} on {node} changed from {recorded[:19]} to {details['Id'][:19]}")
+        self.record(node, os_type, details["Id"])
+        return True
+
+    def record(self, node, os_type, digest):
+        key = (node, os_type)
+        with self.registry.lock, metrics.timer("dp_vps_db", op="images_update"):
+            self.registry.conn.execute(
+                "INSERT OR REPLACE INTO images (node, os_type, image, digest, updated) VALUES (?, ?, ?, ?, ?)",
+                (node, os_type, self.tag(os_type), digest, datetime.now().strftime(EXPIRY_FORMAT))
+            )
+        self.digests[key] = digest
+        self.status[key] = "ready"
+        self.errors.pop(key, None)
+        warm_pool.refill(node, os_type)
+
+    def mark_missing(self, node, os_type):
+        """A deploy found the image gone (e.g. pruned); rebuild it"""
+        self.status[(node, os_type)] = "missing"
+        self.build_missing(node)
+
+    def build_missing(self, node):
+        task = self.builds.get(node)
+        if task is None or task.done():
+            self.builds[node] = asyncio.create_task(self._build_missing(node))
+
+    async def _build_missing(self, node):
+        # One build at a time per node; later ones reuse the layers the first one cached
+        for os_type, entry in self.catalog.items():
+            key = (node, os_type)
+            if self.status.get(key) != "missing":
+                continue
+            image = self.tag(os_type)
+            self.status[key] = "building"
+            print(f"Building {image} on {node} from {entry['base']}")
+            try:
+                with metrics.timer("dp_vps_image_build", node=node, os_type=os_type):
+                    digest = await self.router.nodes[node].build(
+                        image_build_context(), image, buildargs={"BASE_IMAGE": entry["base"]},
+                        labels={IMAGE_LABEL: os_type}, target="fastboot" if IMAGE_FAST_BOOT else None
+                    )
+            except (ContainerRuntimeError, OSError) as e:
+                print(f"Failed to build {image} on {node}: {e}")
+                self.status[key], self.errors[key] = "failed", str(e)
+                continue
+            self.record(node, os_type, digest)
+            print(f"Built {image} on {node}: {digest[:19]}")
+
+    def summary(self):
+        multi_node = len(self.router.nodes) > 1
+        icons = {"ready": "🟢", "building": "🟡", "checking": "🟡", "missing": "🔴", "failed": "🔴"}
+        lines = []
+        for node in self.router.nodes:
+            for os_type, entry in self.catalog.items():
+                key = (node, os_type)
+                status = self.status.get(key, "checking")
+                line = f"{icons[status]} {f'{node}/' if multi_node else ''}{entry['name']}: `{status}`"
+                if status == "ready":
+                    line += f" `{self.digests[key][7:19]}`"
+                elif key in self.errors:
+                    line += f" ({self.errors[key][:60]})"
+                lines.append(line)
+        return "\n".join(lines)
+
+image_catalog = None  # built on the registry by init()
 
 def get_ssh_command_from_database(container_id):
-    if not os.path.exists(database_file):
-        return None
-    with open(database_file, 'r') as f:
-        for line in f:
-            if container_id in line:
-                parts = line.strip().split('|')
-                if len(parts) >= 3:
-                    return parts[2]
-    return None
+    record = registry.get(container_id)
+    return record["ssh_command"] if record else None
 
 def get_user_servers(user):
-    if not os.path.exists(database_file):
-        return []
-    servers = []
-    with open(database_file, 'r') as f:
-        for line in f:
-            parts = line.strip().split('|')
-            if len(parts) >= 1:
-                # Check if the user matches (either by ID or username)
-                stored_user = parts[0]
-                if stored_user == user or stored_user == str(user):
-                    servers.append(line.strip())
-    return servers
+    return [format_database_line(r) for r in registry.for_owner(user)]
 
 def count_user_servers(user):
-    return len(get_user_servers(user))
+    return len(registry.for_owner(user))
 
 def get_container_id_from_database(user, container_name=None):
-    servers = get_user_servers(user)
-    if servers:
-        if container_name:
-            for server in servers:
-                parts = server.split('|')
-                if len(parts) >= 2 and container_name in parts[1]:
-                    return parts[1]
+    if container_name:
+        record = registry.get(container_name)
+        if record and record["user"] == str(user):
+            return record["container_name"]
+        return None
+    servers = registry.for_owner(user)
+    return servers[0]["container_name"] if servers else None
+
+def public_ip_for(container_name):
+    """Public IP of the node hosting a container"""
+    return NODES[runtime.node_of(container_name)].get("public_ip", PUBLIC_IP)
+
+class PortAllocationError(Exception):
+    pass
+
+# Public ports handed out by /port-add. Each node has a bitmap over
+# PORT_RANGES (one bit per port) and the mappings persist in the registry
+# database, so ports survive restarts and are reclaimed with the VPS.
+class PortAllocator:
+    def __init__(self, registry, ranges=PORT_RANGES, per_vps=PORTS_PER_VPS):
+        self.registry = registry
+        self.ranges = sorted((low, high) for low, high in ranges)
+        self.size = sum(high - low + 1 for low, high in self.ranges)
+        self.per_vps = per_vps
+        self.bitmaps = {}  # node -> bytearray
+        self.cursors = {}  # node -> bit index the next search starts from
+        self.by_port = {}  # (node, public_port) -> mapping
+        self.by_container = {}  # container name -> {public_port: mapping}
+        with registry.lock:
+            registry.conn.executescript("""
+                CREATE TABLE IF NOT EXISTS ports (
+                    node TEXT NOT NULL,
+                    public_port INTEGER NOT NULL,
+                    container_name TEXT NOT NULL,
+                    container_port INTEGER NOT NULL,
+                    created TEXT,
+                    PRIMARY KEY (node, public_port)
+                );
+                CREATE INDEX IF NOT EXISTS idx_ports_container ON ports(container_name);
+            """)
+        self.load()
+
+    def load(self):
+        self.bitmaps.clear()
+        self.by_port.clear()
+        self.by_container.clear()
+        with metrics.timer("dp_vps_db", op="ports_load"):
+            rows = self.registry.conn.execute(
+                "SELECT node, public_port, container_name, container_port, created FROM ports"
+            ).fetchall()
+        for node, public_port, container_name, container_port, created in rows:
+            self._index({"node": node, "public_port": public_port, "container_name": container_name,
+                         "container_port": container_port, "created": created})
+
+    def _bit(self, port):
+        """Bitmap index of a port, or None if it is outside every range"""
+        offset = 0
+        for low, high in self.ranges:
+            if low <= port <= high:
+                return offset + port - low
+            offset += high - low + 1
+        return None
+
+    def _port(self, bit):
+        for low, high in self.ranges:
+            if bit <= high - low:
+                return low + bit
+            bit -= high - low + 1
+        raise IndexError(bit)
+
+    def _bitmap(self, node):
+        if node not in self.bitmaps:
+            self.bitmaps[node] = bytearray((self.size + 7) // 8)
+        return self.bitmaps[node]
+
+    def _index(self, mapping):
+        self.by_port[(mapping["node"], mapping["public_port"])] = mapping
+        self.by_container.setdefault(mapping["container_name"], {})[mapping["public_port"]] = mapping
+        bit = self._bit(mapping["public_port"])
+        # Ports from a range that has since been removed stay mapped but are not in the bitmap
+        if bit is not None:
+            self._bitmap(mapping["node"])[bit // 8] |= 1 << (bit % 8)
+
+    def _unindex(self, mapping):
+        self.by_port.pop((mapping["node"], mapping["public_port"]), None)
+        owned = self.by_container.get(mapping["container_name"], {})
+        owned.pop(mapping["public_port"], None)
+        if not owned:
+            self.by_container.pop(mapping["container_name"], None)
+        bit = self._bit(mapping["public_port"])
+        if bit is not None:
+            self._bitmap(mapping["node"])[bit // 8] &= ~(1 << (bit % 8)) & 0xFF
+
+    def _find_free(self, node):
+        """Next free bit after the node's cursor, wrapping around once"""
+        bitmap = self._bitmap(node)
+        start = self.cursors.get(node, 0) // 8
+        for step in range(len(bitmap)):
+            byte_index = (start + step) % len(bitmap)
+            byte = bitmap[byte_index]
+            if byte == 0xFF:
+                continue
+            for bit in range(8):
+                index = byte_index * 8 + bit
+                if not byte & (1 << bit) and index < self.size:
+                    return index
+        return None
+
+    def mark_unavailable(self, node, public_port):
+        """Keep a port another host process holds out of allocation until the next load"""
+        bit = self._bit(public_port)
+        if bit is not None and (node, public_port) not in self.by_port:
+            self._bitmap(node)[bit // 8] |= 1 << (bit % 8)
+
+    def free_count(self, node):
+        used = sum(bin(byte).count("1") for byte in self._bitmap(node))
+        return self.size - used
+
+    def for_container(self, container_name):
+        return sorted(self.by_container.get(container_name, {}).values(), key=lambda m: m["public_port"])
+
+    def allocate(self, container_name, container_port, node):
+        """Public port forwarding to container_port, reusing an existing mapping for the same port"""
+        for mapping in self.for_container(container_name):
+            if mapping["container_port"] == container_port:
+                return mapping
+        if len(self.by_container.get(container_name, {})) >= self.per_vps:
+            raise PortAllocationError(f"`{container_name}` already has {self.per_vps} forwarded ports. Remove one with /port-remove first.")
+        bit = self._find_free(node)
+        if bit is None:
+            raise PortAllocationError("No public ports are free on this node.")
+        mapping = {"node": node, "public_port": self._port(bit), "container_name": container_name,
+                   "container_port": container_port, "created": datetime.now().strftime(EXPIRY_FORMAT)}
+        with self.registry.lock, metrics.timer("dp_vps_db", op="ports_add"):
+            self.registry.conn.execute(
+                "INSERT INTO ports (node, public_port, container_name, container_port, created) VALUES (?, ?, ?, ?, ?)",
+                (mapping["node"], mapping["public_port"], container_name, container_port, mapping["created"])
+            )
+            self._index(mapping)
+        self.cursors[node] = bit + 1
+        return mapping
+
+    def release(self, node, public_port):
+        mapping = self.by_port.get((node, public_port))
+        if not mapping:
             return None
+        with self.registry.lock, metrics.timer("dp_vps_db", op="ports_remove"):
+            self.registry.conn.execute("DELETE FROM ports WHERE node = ? AND public_port = ?", (node, public_port))
+            self._unindex(mapping)
+        return mapping
+
+    def release_container(self, container_name):
+        mappings = self.for_container(container_name)
+        if mappings:
+            with self.registry.lock, metrics.timer("dp_vps_db", op="ports_remove"):
+                self.registry.conn.execute("DELETE FROM ports WHERE container_name = ?", (container_name,))
+                for mapping in mappings:
+                    self._unindex(mapping)
+        return mappings
+
+    def on_registry_change(self, event, record, changed):
+        if event == "remove":
+            self.release_container(record["container_name"])
+
+port_allocator = None  # built on the registry by init()
+
+# TCP forwarder for ports allocated by /port-add on local nodes. Each
+# mapping gets a listening socket on the host; connections are relayed to
+# the container's bridge IP with splice(2) where available, so payload
+# bytes move between the sockets without being copied into Python.
+class TCPForwarder:
+    def __init__(self, allocator, bind=PORT_FORWARD_BIND, max_connections=FORWARD_MAX_CONNECTIONS,
+                 idle_timeout=FORWARD_IDLE_TIMEOUT):
+        self.allocator = allocator
+        self.bind = bind
+        self.max_connections = max_connections
+        self.idle_timeout = idle_timeout
+        self.listeners = {}  # (node, public_port) -> (listening socket, accept task, mapping)
+        self.connections = {}  # (node, public_port) -> set of relay tasks
+        self.counters = {}  # (node, public_port) -> traffic counters
+        self.addresses = {}  # container name -> (resolved at, IP)
+        self.use_splice = hasattr(os, "splice")
+
+    def is_local(self, node):
+        return not NODES.get(node, {}).get("host")
+
+    def counters_for(self, mapping):
+        return self.counters.get((mapping["node"], mapping["public_port"]))
+
+    async def start(self):
+        """Listen on every persisted mapping of a local node"""
+        for mapping in list(self.allocator.by_port.values()):
+            if self.is_local(mapping["node"]):
+                try:
+                    await self.open(mapping)
+                except OSError as e:
+                    print(f"Cannot forward port {mapping['public_port']} to {mapping['container_name']}: {e}")
+
+    async def open(self, mapping):
+        key = (mapping["node"], mapping["public_port"])
+        if key in self.listeners:
+            return
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.bind((self.bind, mapping["public_port"]))
+            sock.listen(128)
+            sock.setblocking(False)
+        except OSError:
+            sock.close()
+            raise
+        self.counters.setdefault(key, {"bytes_in": 0, "bytes_out": 0, "active": 0, "connections": 0, "rejected": 0})
+        self.connections[key] = set()
+        self.listeners[key] = (sock, asyncio.create_task(self.accept_loop(key, sock, mapping)), mapping)
+
+    def close(self, node, public_port):
+        key = (node, public_port)
+        listener = self.listeners.pop(key, None)
+        if not listener:
+            return
+        sock, task, mapping = listener
+        task.cancel()
+        sock.close()
+        for relay in self.connections.pop(key, ()):
+            relay.cancel()
+        self.counters.pop(key, None)
+
+    def on_registry_change(self, event, record, changed):
+        if event == "remove":
+            for key, (sock, task, mapping) in list(self.listeners.items()):
+                if mapping["container_name"] == record["container_name"]:
+                    self.close(*key)
+            self.addresses.pop(record["container_name"], None)
+
+    async def accept_loop(self, key, sock, mapping):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                client, address = await loop.sock_accept(sock)
+            except OSError as e:
+                print(f"Accept failed on port {mapping['public_port']}: {e}")
+                await asyncio.sleep(1)
+                continue
+            counters = self.counters[key]
+            if counters["active"] >= self.max_connections:
+                counters["rejected"] += 1
+                client.close()
+                continue
+            client.setblocking(False)
+            relay = asyncio.create_task(self.relay(key, mapping, client))
+            self.connections[key].add(relay)
+            relay.add_done_callback(self.connections[key].discard)
+
+    async def resolve(self, container_name, refresh=False):
+        """Bridge IP of a container, cached for FORWARD_ADDRESS_TTL"""
+        cached = self.addresses.get(container_name)
+        if cached and not refresh and time.monotonic() - cached[0] < FORWARD_ADDRESS_TTL:
+            return cached[1]
+        details = await runtime.inspect(container_name)
+        network = details.get("NetworkSettings") or {}
+        address = network.get("IPAddress") or next(
+            (n.get("IPAddress") for n in (network.get("Networks") or {}).values() if n.get("IPAddress")), None)
+        if not address:
+            raise ContainerRuntimeError(f"{container_name} has no IP address (is it running?)")
+        self.addresses[container_name] = (time.monotonic(), address)
+        return address
+
+    async def connect(self, mapping):
+        loop = asyncio.get_running_loop()
+        try:
+            await hibernator.resume(mapping["container_name"])
+        except ContainerRuntimeError as e:
+            print(f"Cannot wake {mapping['container_name']} for a forwarded connection: {e}")
+            return None
+        for refresh in (False, True):
+            upstream = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            upstream.setblocking(False)
+            try:
+                address = await self.resolve(mapping["container_name"], refresh)
+                await asyncio.wait_for(loop.sock_connect(upstream, (address, mapping["container_port"])), FORWARD_CONNECT_TIMEOUT)
+                return upstream
+            except (OSError, asyncio.TimeoutError, ContainerRuntimeError):
+                # The container may have restarted with a new address; retry once with a fresh lookup
+                upstream.close()
+        return None
+
+    async def relay(self, key, mapping, client):
+        counters = self.counters[key]
+        counters["active"] += 1
+        counters["connections"] += 1
+        upstream = None
+        try:
+            upstream = await self.connect(mapping)
+            if upstream is None:
+                return
+            activity = {"last": time.monotonic()}
+            pumps = [
+                asyncio.create_task(self.pump(client, upstream, key, mapping, "bytes_in", activity)),
+                asyncio.create_task(self.pump(upstream, client, key, mapping, "bytes_out", activity))
+            ]
+            try:
+                # One side finishing is a half-close; one side failing ends the connection
+                await asyncio.wait(pumps, return_when=asyncio.FIRST_EXCEPTION)
+            finally:
+                for pump in pumps:
+                    pump.cancel()
+                await asyncio.gather(*pumps, return_exceptions=True)
+        finally:
+            counters["active"] -= 1
+            client.close()
+            if upstream:
+                upstream.close()
+
+    async def _wait(self, sock, writable=False):
+        """Wait until a socket is readable (or writable), giving up after the connection's idle timeout"""
+        loop = asyncio.get_running_loop()
+        waiter = loop.create_future()
+        add, remove = (loop.add_writer, loop.remove_writer) if writable else (loop.add_reader, loop.remove_reader)
+        add(sock.fileno(), lambda: waiter.done() or waiter.set_result(None))
+        try:
+            await asyncio.wait_for(waiter, self.idle_timeout)
+        finally:
+            remove(sock.fileno())
+
+    async def pump(self, src, dst, key, mapping, direction, activity):
+        """Copy one direction until EOF, then half-close the other side"""
+        try:
+            if self.use_splice:
+                try:
+                    await self.pump_splice(src, dst, key, mapping, direction, activity)
+                    return
+                except OSError as e:
+                    if e.errno not in (errno.EINVAL, errno.ENOSYS):
+                        raise
+                    # splice is unavailable for these sockets; copy through a buffer instead
+                    self.use_splice = False
+            await self.pump_buffered(src, dst, key, mapping, direction, activity)
+        finally:
+            try:
+                dst.shutdown(socket.SHUT_WR)
+            except OSError:
+                pass
+
+    async def wait_active(self, sock, activity, writable=False):
+        """_wait that only times out when neither direction has moved data for idle_timeout"""
+        while True:
+            try:
+                await self._wait(sock, writable)
+                return
+            except asyncio.TimeoutError:
+                if time.monotonic() - activity["last"] >= self.idle_timeout:
+                    raise
+
+    def count(self, key, mapping, direction, nbytes, activity):
+        activity["last"] = time.monotonic()
+        counters = self.counters.get(key)
+        if counters:
+            counters[direction] += nbytes
+        metrics.inc("dp_vps_forward_bytes_total", nbytes, port=mapping["public_port"],
+                    container=mapping["container_name"], direction=direction[6:])
+
+    async def pump_splice(self, src, dst, key, mapping, direction, activity):
+        flags = os.SPLICE_F_MOVE | os.SPLICE_F_NONBLOCK
+        pipe_r, pipe_w = os.pipe()
+        try:
+            while True:
+                await self.wait_active(src, activity)
+                try:
+                    received = os.splice(src.fileno(), pipe_w, FORWARD_BUFFER, flags=flags)
+                except BlockingIOError:
+                    continue
+                if received == 0:
+                    return
+                remaining = received
+                while remaining:
+                    try:
+                        remaining -= os.splice(pipe_r, dst.fileno(), remaining, flags=flags)
+                    except BlockingIOError:
+                        await self.wait_active(dst, activity, writable=True)
+                self.count(key, mapping, direction, received, activity)
+        finally:
+            os.close(pipe_r)
+            os.close(pipe_w)
+
+    async def pump_buffered(self, src, dst, key, mapping, direction, activity):
+        loop = asyncio.get_running_loop()
+        buffer = bytearray(FORWARD_BUFFER)
+        view = memoryview(buffer)
+        while True:
+            await self.wait_active(src, activity)
+            try:
+                received = src.recv_into(buffer)
+            except BlockingIOError:
+                continue
+            if received == 0:
+                return
+            await loop.sock_sendall(dst, view[:received])
+            self.count(key, mapping, direction, received, activity)
+
+tcp_forwarder = None  # built on port_allocator by init()
+metrics.describe("dp_vps_forward_bytes_total", "counter", "Bytes relayed by the TCP forwarder per mapping and direction")
+
+def http_routes_of(record):
+    """A record's /port-http routes as {hostname: container port}"""
+    try:
+        routes = json.loads(record.get("http_routes") or "{}")
+    except ValueError:
+        return {}
+    return routes if isinstance(routes, dict) else {}
+
+def http_url_for(hostname):
+    """Public URL of a /port-http hostname (a bare label is a subdomain of HTTP_PROXY_DOMAIN)"""
+    host = hostname if "." in hostname else f"{hostname}.{HTTP_PROXY_DOMAIN}"
+    return f"http://{host}" + (f":{HTTP_PROXY_PORT}" if HTTP_PROXY_PORT != 80 else "")
+
+class HTTPError(Exception):
+    def __init__(self, status, reason):
+        super().__init__(f"{status} {reason}")
+        self.status = status
+        self.reason = reason
+
+# Headers that describe a single connection and are never forwarded as-is
+HOP_BY_HOP_HEADERS = {"connection", "keep-alive", "proxy-connection", "te", "trailer", "upgrade"}
+
+# Reverse proxy for /port-http. Requests are routed by Host header (or its
+# subdomain under HTTP_PROXY_DOMAIN) to a container port; the routes live in
+# the registry, so adding one is a table update the proxy picks up through
+# its listener. Bodies are streamed in both directions and upstream
+# connections are kept alive in a small pool per container port.
+class HTTPProxy:
+    def __init__(self, registry, host=HTTP_PROXY_HOST, port=HTTP_PROXY_PORT):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self.server = None
+        self.routes = {}  # hostname -> (container name, container port)
+        self.pools = {}  # (container name, container port) -> deque of (reader, writer, idle since)
+        for record in registry.all():
+            self.index(record)
+
+    async def start(self):
+        if self.server or not self.port:
+            return
+        self.server = await asyncio.start_server(self.handle, self.host, self.port, limit=HTTP_MAX_HEADER)
+        print(f"HTTP proxy listening on {self.host}:{self.port} for *.{HTTP_PROXY_DOMAIN}")
+
+    def index(self, record):
+        for hostname, container_port in http_routes_of(record).items():
+            self.routes.setdefault(hostname.lower(), (record["container_name"], int(container_port)))
+
+    def unindex(self, container_name):
+        for hostname, (name, container_port) in list(self.routes.items()):
+            if name == container_name:
+                del self.routes[hostname]
+
+    def on_registry_change(self, event, record, changed):
+        if event == "update" and "http_routes" not in changed:
+            return
+        self.unindex(record["container_name"])
+        if event == "remove":
+            for key in [k for k in self.pools if k[0] == record["container_name"]]:
+                for reader, writer, idle_since in self.pools.pop(key):
+                    writer.close()
         else:
-            return servers[0].split('|')[1]
-    return None
+            self.index(record)
+
+    def owner_of(self, hostname):
+        """Container name a hostname is routed to, if any"""
+        route = self.routes.get(hostname.lower())
+        return route[0] if route else None
+
+    def route(self, host):
+        host = host.rsplit(":", 1)[0].rstrip(".").lower() if not host.endswith("]") else host.lower()
+        if host in self.routes:
+            return self.routes[host]
+        suffix = "." + HTTP_PROXY_DOMAIN.lower()
+        if host.endswith(suffix):
+            return self.routes.get(host[:-len(suffix)])
+        return None
+
+    async def acquire(self, key, fresh=False):
+        """A pooled keep-alive connection to the container port, or a new one (always new if fresh)"""
+        await hibernator.resume(key[0])
+        pool = None if fresh else self.pools.get(key)
+        while pool:
+            reader, writer, idle_since = pool.pop()
+            if time.monotonic() - idle_since < HTTP_POOL_IDLE and not reader.at_eof() and not writer.is_closing():
+                return reader, writer, True
+            writer.close()
+        address = await tcp_forwarder.resolve(key[0])
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(address, key[1], limit=HTTP_MAX_HEADER), FORWARD_CONNECT_TIMEOUT)
+        except (OSError, asyncio.TimeoutError):
+            # The container may have restarted with a new address
+            address = await tcp_forwarder.resolve(key[0], refresh=True)
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(address, key[1], limit=HTTP_MAX_HEADER), FORWARD_CONNECT_TIMEOUT)
+        return reader, writer, False
+
+    def release(self, key, reader, writer):
+        pool = self.pools.setdefault(key, collections.deque())
+        now = time.monotonic()
+        while pool and now - pool[0][2] >= HTTP_POOL_IDLE:
+            pool.popleft()[1].close()
+        if len(pool) >= HTTP_POOL_SIZE or key[0] not in self.registry:
+            writer.close()
+        else:
+            pool.append((reader, writer, now))
+
+    @staticmethod
+    async def read_head(reader, timeout):
+        """Start line and headers of a message, or None on a clean EOF"""
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), timeout)
+        except asyncio.IncompleteReadError as e:
+            if not e.partial.strip():
+                return None
+            raise HTTPError(400, "Bad Request")
+        except asyncio.LimitOverrunError:
+            raise HTTPError(431, "Request Header Fields Too Large")
+        lines = head.decode("latin-1").split("\r\n")
+        headers = []
+        for line in lines[1:]:
+            if not line:
+                continue
+            name, sep, value = line.partition(":")
+            if not sep or not name or name != name.strip():
+                raise HTTPError(400, "Bad Request")
+            headers.append((name, value.strip()))
+        return lines[0], headers
+
+    @staticmethod
+    def header(headers, name):
+        return next((value for key, value in headers if key.lower() == name), None)
+
+    @staticmethod
+    def status_of(status_line):
+        try:
+            return int(status_line.split(" ")[1])
+        except (IndexError, ValueError):
+            raise HTTPError(502, "Bad Gateway")
+
+    @staticmethod
+    def body_framing(headers):
+        """('chunked', None), ('length', n) or None for a message without explicit framing"""
+        encoding = HTTPProxy.header(headers, "transfer-encoding")
+        if encoding is not None:
+            if encoding.split(",")[-1].strip().lower() != "chunked":
+                raise HTTPError(501, "Not Implemented")
+            return "chunked", None
+        length = HTTPProxy.header(headers, "content-length")
+        if length is not None:
+            if not length.isdigit():
+                raise HTTPError(400, "Bad Request")
+            return "length", int(length)
+        return None
+
+    @staticmethod
+    def forward_headers(headers, framing):
+        """Drop hop-by-hop headers (and a Content-Length that chunked framing overrides)"""
+        connection = HTTPProxy.header(headers, "connection") or ""
+        dropped = HOP_BY_HOP_HEADERS | {t.strip().lower() for t in connection.split(",")}
+        if framing and framing[0] == "chunked":
+            dropped.add("content-length")
+        return [(k, v) for k, v in headers if k.lower() not in dropped]
+
+    @staticmethod
+    def render_head(start_line, headers):
+        return (start_line + "\r\n" + "".join(f"{k}: {v}\r\n" for k, v in headers) + "\r\n").encode("latin-1")
+
+    @staticmethod
+    async def copy_length(reader, writer, remaining):
+        while remaining:
+            data = await asyncio.wait_for(reader.read(min(remaining, FORWARD_BUFFER)), HTTP_UPSTREAM_TIMEOUT)
+            if not data:
+                raise ConnectionResetError("connection closed mid-body")
+            writer.write(data)
+            await writer.drain()
+            remaining -= len(data)
+
+    @staticmethod
+    async def copy_chunked(reader, writer):
+        """Relay a chunked body as it arrives, chunk framing and trailers included"""
+        while True:
+            line = await asyncio.wait_for(reader.readline(), HTTP_UPSTREAM_TIMEOUT)
+            if not line.endswith(b"\n"):
+                raise ConnectionResetError("connection closed mid-body")
+            writer.write(line)
+            try:
+                size = int(line.split(b";", 1)[0].strip(), 16)
+            except ValueError:
+                raise HTTPError(400, "Bad Request")
+            if size == 0:
+                while True:
+                    line = await asyncio.wait_for(reader.readline(), HTTP_UPSTREAM_TIMEOUT)
+                    writer.write(line)
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                await writer.drain()
+                return
+            await HTTPProxy.copy_length(reader, writer, size + 2)
+
+    @staticmethod
+    async def copy_until_eof(reader, writer):
+        while True:
+            data = await asyncio.wait_for(reader.read(FORWARD_BUFFER), FORWARD_IDLE_TIMEOUT)
+            if not data:
+                break
+            writer.write(data)
+            await writer.drain()
+        if writer.can_write_eof():
+            writer.write_eof()
+
+    async def copy_body(self, framing, reader, writer):
+        if framing is None:
+            return
+        if framing[0] == "chunked":
+            await self.copy_chunked(reader, writer)
+        else:
+            await self.copy_length(reader, writer, framing[1])
+
+    async def send_error(self, writer, status, reason):
+        body = f"{status} {reason}\n".encode()
+        writer.write(
+            f"HTTP/1.1 {status} {reason}\r\nContent-Type: text/plain\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+        )
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+
+    async def handle(self, reader, writer):
+        """Serve requests from one client connection until either side closes it"""
+        peer = (writer.get_extra_info("peername") or ("unknown",))[0]
+        try:
+            while await self.handle_request(reader, writer, peer):
+                pass
+        except HTTPError as e:
+            await self.send_error(writer, e.status, e.reason)
+        except (ConnectionError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            print(f"HTTP proxy error: {e}")
+        finally:
+            writer.close()
+
+    async def handle_request(self, reader, writer, peer):
+        """Proxy one request; returns whether the client connection can be reused"""
+        head = await self.read_head(reader, HTTP_HEADER_TIMEOUT)
+        if head is None:
+            return False
+        request_line, headers = head
+        parts = request_line.split(" ")
+        if len(parts) != 3 or not parts[2].startswith("HTTP/1."):
+            raise HTTPError(400, "Bad Request")
+        method, target, version = parts
+        host = self.header(headers, "host")
+        route = self.route(host) if host else None
+        if not route:
+            raise HTTPError(404, "Not Found")
+        framing = self.body_framing(headers)
+        connection = (self.header(headers, "connection") or "").lower()
+        client_keep_alive = "close" not in connection if version == "HTTP/1.1" else "keep-alive" in connection
+        upgrade = self.header(headers, "upgrade") if "upgrade" in connection else None
+
+        forwarded = self.forward_headers(headers, framing)
+        prior = self.header(headers, "x-forwarded-for")
+        forwarded = [(k, v) for k, v in forwarded if k.lower() not in ("x-forwarded-for", "x-forwarded-host", "x-forwarded-proto")]
+        forwarded += [("X-Forwarded-For", f"{prior}, {peer}" if prior else peer),
+                      ("X-Forwarded-Host", host), ("X-Forwarded-Proto", "http")]
+        forwarded += [("Connection", "Upgrade"), ("Upgrade", upgrade)] if upgrade else [("Connection", "keep-alive")]
+        request_head = self.render_head(f"{method} {target} HTTP/1.1", forwarded)
+
+        started = time.perf_counter()
+        for attempt in range(2):
+            try:
+                up_reader, up_writer, reused = await self.acquire(route, fresh=attempt > 0)
+            except (OSError, asyncio.TimeoutError, ContainerRuntimeError):
+                raise HTTPError(502, "Bad Gateway")
+            sent = False
+            try:
+                up_writer.write(request_head)
+                await self.copy_body(framing, reader, up_writer)
+                sent = True
+                response = await self.read_head(up_reader, HTTP_UPSTREAM_TIMEOUT)
+                if response is None:
+                    raise ConnectionResetError("upstream closed the connection")
+                break
+            except (ConnectionError, asyncio.IncompleteReadError) as e:
+                up_writer.close()
+                # A pooled connection the container already closed; retry on a fresh one if nothing was consumed
+                if not reused or framing is not None:
+                    raise HTTPError(502, "Bad Gateway") from e
+            except asyncio.TimeoutError:
+                up_writer.close()
+                raise HTTPError(504, "Gateway Timeout")
+            except HTTPError as e:
+                up_writer.close()
+                # Until the request is sent a parse error is the client's; after that it is the container's
+                raise HTTPError(502, "Bad Gateway") if sent else e
+        else:
+            raise HTTPError(502, "Bad Gateway")
+
+        try:
+            status_line, response_headers = response
+            status = self.status_of(status_line)
+            # Interim responses (100 Continue) are passed through before the final one
+            while 100 <= status < 200 and status != 101:
+                writer.write(self.render_head(status_line, response_headers))
+                response = await self.read_head(up_reader, HTTP_UPSTREAM_TIMEOUT)
+                if response is None:
+                    raise ConnectionResetError("upstream closed the connection")
+                status_line, response_headers = response
+                status = self.status_of(status_line)
+            metrics.observe("dp_vps_http_upstream_seconds", time.perf_counter() - started, container=route[0])
+            metrics.inc("dp_vps_http_requests_total", container=route[0], code=f"{status // 100}xx")
+
+            if status == 101 and upgrade:
+                # Protocol switch (WebSocket): relay raw bytes both ways until one side closes
+                writer.write(self.render_head(status_line, response_headers))
+                await writer.drain()
+                pumps = [asyncio.create_task(self.copy_until_eof(reader, up_writer)),
+                         asyncio.create_task(self.copy_until_eof(up_reader, writer))]
+                try:
+                    await asyncio.wait(pumps, return_when=asyncio.FIRST_COMPLETED)
+                finally:
+                    for pump in pumps:
+                        pump.cancel()
+                    await asyncio.gather(*pumps, return_exceptions=True)
+                up_writer.close()
+                return False
+
+            if method == "HEAD" or status in (101, 204, 304):
+                response_framing = ("length", 0)
+            else:
+                try:
+                    response_framing = self.body_framing(response_headers)
+                except HTTPError:
+                    raise HTTPError(502, "Bad Gateway")
+            upstream_reusable = (response_framing is not None and status_line.startswith("HTTP/1.1")
+                                 and "close" not in (self.header(response_headers, "connection") or "").lower())
+            keep_alive = client_keep_alive and response_framing is not None
+            out_headers = self.forward_headers(response_headers, response_framing)
+            out_headers.append(("Connection", "keep-alive" if keep_alive else "close"))
+            writer.write(self.render_head(f"{version} {' '.join(status_line.split(' ')[1:])}", out_headers))
+            if response_framing is None:
+                # No length or chunking: the body runs until the container closes the connection
+                await self.copy_until_eof(up_reader, writer)
+            else:
+                await self.copy_body(response_framing, up_reader, writer)
+                await writer.drain()
+        except BaseException:
+            up_writer.close()
+            raise
+        if upstream_reusable:
+            self.release(route, up_reader, up_writer)
+        else:
+            up_writer.close()
+        return keep_alive
+
+http_proxy = None  # built on the registry by init()
+metrics.describe("dp_vps_http_requests_total", "counter", "Requests proxied by /port-http routes per container and status class")
+metrics.describe("dp_vps_http_upstream_seconds", "histogram", "Time until a container starts answering a proxied HTTP request")
 
 # OS Selection dropdown for deploy command
 # OS Selection dropdown for deploy command
 class OSSelectView(View):
     def __init__(self, callback):
-        super().__init__(timeout=60)
-        self.callback = callback
-        
-        # Create the OS selection dropdown
-        select = Select(
-            placeholder="Select an operating system",
-            options=[
-                discord.SelectOption(label="Ubuntu 22.04", description="Latest LTS Ubuntu release", emoji="🐧", value="ubuntu"),
-                discord.SelectOption(label="Debian 12", description="Stable Debian release", emoji="🐧", value="debian")
-            ]
-        )
+        super().__init__(timeout=60)
+        self.callback = callback
         
-        select.callback = self.select_callback
-        self.add_item(select)
+        # Create the OS selection dropdown, offering only images that are built on some node.
+        # Discord rejects a Select without options, so callers check self.options first
+        self.options = [
+            discord.SelectOption(label=entry["name"], description=entry["description"], emoji="🐧", value=os_type)
+            for os_type, entry in IMAGE_CATALOG.items() if image_catalog.is_ready(os_type)
+        ]
+        if self.options:
+            select = Select(placeholder="Select an operating system", options=self.options)
+            select.callback = self.select_callback
+            self.add_item(select)
         
     async def select_callback(self, interaction: discord.Interaction):
         selected_os = interaction.data["values"][0]
         await interaction.response.defer()
         await self.callback(interaction, selected_os)
 
+# Bulk teardown used by /delete-all and /cleanup
+async def teardown_containers(container_names, on_progress=None, workers=TEARDOWN_WORKERS):
+    """Force-remove containers in parallel.
+
+    Returns a dict mapping each container name to None on success (or if it
+    was already gone) or to an error message.
+    """
+    results = {}
+    semaphore = asyncio.Semaphore(workers)
+
+    async def remove(name):
+        async with semaphore:
+            try:
+                await runtime.remove(name, force=True)
+                results[name] = None
+                await tmate_sessions.forget(name)
+            except DockerAPIError as e:
+                results[name] = None if e.status == 404 else str(e)
+            except ContainerRuntimeError as e:
+                results[name] = str(e)
+        if on_progress:
+            await on_progress(results, len(container_names))
+
+    await asyncio.gather(*(remove(name) for name in container_names))
+    return results
+
+def build_teardown_embed(title, results, total, finished=False):
+    failed = {name: error for name, error in results.items() if error}
+    done = len(results)
+    embed = discord.Embed(
+        title=title,
+        description=(
+            f"{'Finished' if finished else 'Progress'}: **{done}/{total}**\n"
+            f"✅ Removed: `{done - len(failed)}` | ❌ Failed: `{len(failed)}`"
+        ),
+        color=0x2400ff
+    )
+    removed = [name for name, error in results.items() if not error]
+    if finished and removed:
+        embed.add_field(
+            name="Removed Containers",
+            value="\n".join(removed[:10]) + ("..." if len(removed) > 10 else ""),
+            inline=False
+        )
+    if failed:
+        embed.add_field(
+            name="Failed Containers",
+            value="\n".join(f"`{name}`: {error[:80]}" for name, error in list(failed.items())[:10])
+                  + ("\n..." if len(failed) > 10 else ""),
+            inline=False
+        )
+    return embed
+
+class TeardownProgress:
+    """Edits a progress embed live, at most once per TEARDOWN_PROGRESS_INTERVAL"""
+    def __init__(self, message, title):
+        self.message = message
+        self.title = title
+        self.last_edit = 0.0
+
+    async def __call__(self, results, total):
+        now = time.monotonic()
+        if now - self.last_edit < TEARDOWN_PROGRESS_INTERVAL or len(results) == total:
+            return
+        self.last_edit = now
+        try:
+            await self.message.edit(embed=build_teardown_embed(self.title, results, total))
+        except discord.HTTPException:
+            pass
+
+    async def finish(self, results, total, title=None):
+        embed = build_teardown_embed(title or self.title, results, total, finished=True)
+        await self.message.edit(embed=embed)
+
 # Confirmation dialog class for delete operations
 # Confirmation dialog class for delete operations
 class ConfirmView(View):
@@ -299,31 +3090,17 @@ class ConfirmView(View):
         try:
             if self.is_delete_all:
                 # Delete all VPS instances
-                containers = get_all_containers()
-                deleted_count = 0
-                
-                for container_info in containers:
-                    parts = container_info.split('|')
-                    if len(parts) >= 2:
-                        container_id = parts[1]
-                        try:
-                            subprocess.run(["docker", "stop", container_id], check=True, stderr=subprocess.DEVNULL)
-                            subprocess.run(["docker", "rm", container_id], check=True, stderr=subprocess.DEVNULL)
-                            deleted_count += 1
-                        except Exception:
-                            pass
-                
-                # Clear the database file
-                with open(database_file, 'w') as f:
-                    f.write('')
-                    
-                embed = discord.Embed(
-                    title=" All VPS Instances Deleted",
-                    description=f"Successfully deleted {deleted_count} VPS instances.",
-                    color=0x2400ff
+                names = [r["container_name"] for r in registry.all()]
+                message = await interaction.followup.send(
+                    embed=build_teardown_embed("🗑️ Deleting All VPS Instances", {}, len(names)), wait=True
                 )
-                # Use followup instead of edit_message
-                await interaction.followup.send(embed=embed)
+                progress = TeardownProgress(message, "🗑️ Deleting All VPS Instances")
+                results = await teardown_containers(names, on_progress=progress)
+
+                # Update the registry in one batch
+                registry.remove_many([name for name, error in results.items() if error is None])
+
+                await progress.finish(results, len(names), title=" All VPS Instances Deleted")
                 
                 # Disable all buttons
                 for child in self.children:
@@ -332,8 +3109,9 @@ class ConfirmView(View):
             else:
                 # Delete single VPS instance
                 try:
-                    subprocess.run(["docker", "stop", self.container_id], check=True, stderr=subprocess.DEVNULL)
-                    subprocess.run(["docker", "rm", self.container_id], check=True, stderr=subprocess.DEVNULL)
+                    await runtime.stop(self.container_id)
+                    await runtime.remove(self.container_id)
+                    await tmate_sessions.forget(self.container_id)
                     remove_from_database(self.container_id)
                     
                     embed = discord.Embed(
@@ -379,29 +3157,298 @@ class ConfirmView(View):
         for child in self.children:
             child.disabled = True
 
+# Bot status showing the VPS count, pushed only when the count changes
+class PresenceUpdater:
+    def __init__(self, debounce=PRESENCE_DEBOUNCE, min_interval=PRESENCE_MIN_INTERVAL):
+        self.debounce = debounce
+        self.min_interval = min_interval
+        self.count = 0
+        self.pushed_count = None
+        self.last_push = 0.0
+        self.task = None
+
+    def start(self):
+        self.count = len(registry)
+        self.pushed_count = None  # the gateway session may be new, so always push once
+        self.schedule()
+
+    def on_registry_change(self, event, record, changed):
+        if event == "add":
+            self.count += 1
+        elif event == "remove":
+            self.count -= 1
+        else:
+            return
+        self.schedule()
+
+    def schedule(self):
+        if self.count == self.pushed_count or not bot.is_ready():
+            return
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.flush())
+
+    async def flush(self):
+        await asyncio.sleep(self.debounce)
+        wait = self.last_push + self.min_interval - time.monotonic()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        count = self.count
+        if count == self.pushed_count:
+            return
+        try:
+            await bot.change_presence(activity=discord.Game(name=f"🔮 SaturnNode | {count} VM's"))
+            self.pushed_count = count
+        except Exception as e:
+            print(f"Failed to update status: {e}")
+        finally:
+            self.last_push = time.monotonic()
+        # Changes that landed while we were pushing get their own flush
+        if self.count != self.pushed_count:
+            self.task = asyncio.create_task(self.flush())
+
+presence = PresenceUpdater()
+
 @bot.event
 async def on_ready():
-    change_status.start()
+    presence.start()
+    container_tracker.start()
+    image_catalog.start()
+    try:
+        await metrics_server.start()
+    except OSError as e:
+        print(f"Failed to start metrics endpoint: {e}")
+    if not stats_sampler.is_running():
+        stats_sampler.start()
+    try:
+        await warm_pool.discover()
+    except ContainerRuntimeError as e:
+        print(f"Failed to discover warm pool containers: {e}")
+    warm_pool.refill()
+    expiry_scheduler.start()
+    abuse_monitor.start()
+    hibernator.start()
+    memory_balancer.start()
+    if PORT_FORWARD_MODE == 'proxy':
+        await tcp_forwarder.start()
+        try:
+            await http_proxy.start()
+        except OSError as e:
+            print(f"Failed to start HTTP proxy: {e}")
+    asyncio.create_task(restore_port_tunnels())
     print(f'🚀 Bot is ready. Logged in as {bot.user}')
     await bot.tree.sync()
 
-@tasks.loop(seconds=5)
-async def change_status():
+@tasks.loop(seconds=STATS_SAMPLE_INTERVAL)
+async def stats_sampler():
     try:
-        if os.path.exists(database_file):
-            with open(database_file, 'r') as f:
-                lines = f.readlines()
-                instance_count = len(lines)
-        else:
-            instance_count = 0
-
-        status = f"🔮 SaturnNode | {instance_count} VM's"
-        await bot.change_presence(activity=discord.Game(name=status))
+        await stats_cache.refresh()
     except Exception as e:
-        print(f"Failed to update status: {e}")
+        print(f"Failed to sample stats: {e}")
+
+# Paginated admin listing. Only the rows on the visible page get stats, and
+# recently viewed pages are kept for a while so paging back is free.
+class JumpToPageModal(discord.ui.Modal, title="Jump to page"):
+    page = discord.ui.TextInput(label="Page number", placeholder="1", max_length=6)
+
+    def __init__(self, view):
+        super().__init__()
+        self.view = view
+
+    async def on_submit(self, interaction: discord.Interaction):
+        try:
+            self.view.page = int(self.page.value) - 1
+        except ValueError:
+            await interaction.response.send_message("Please enter a page number.", ephemeral=True)
+            return
+        await self.view.update(interaction)
+
+class OwnerFilterModal(discord.ui.Modal, title="Filter by owner"):
+    owner = discord.ui.TextInput(label="Owner (leave empty for everyone)", required=False, max_length=100)
+
+    def __init__(self, view):
+        super().__init__()
+        self.view = view
+        self.owner.default = view.owner or ""
+
+    async def on_submit(self, interaction: discord.Interaction):
+        self.view.owner = self.owner.value.strip() or None
+        self.view.page = 0
+        await self.view.update(interaction, reload=True)
+
+class NodeAdminView(View):
+    def __init__(self, owner=None, status=None, os_type=None, page_size=NODEDMIN_PAGE_SIZE):
+        super().__init__(timeout=600)
+        self.owner = owner
+        self.status = status
+        self.os_type = os_type
+        self.page_size = page_size
+        self.page = 0
+        self.rows = []
+        self.page_cache = collections.OrderedDict()
+        self.message = None
+
+        status_select = Select(
+            placeholder="Status: all",
+            options=[
+                discord.SelectOption(label="All statuses", value="all", emoji="📋"),
+                discord.SelectOption(label="Running", value="running", emoji="🟢"),
+                discord.SelectOption(label="Stopped", value="stopped", emoji="🔴")
+            ],
+            row=1
+        )
+        status_select.callback = self.status_callback
+        self.add_item(status_select)
+
+        os_types = sorted({r["os_type"] for r in registry.all()})[:24]
+        os_select = Select(
+            placeholder="OS: all",
+            options=[discord.SelectOption(label="All operating systems", value="all", emoji="🌐")] +
+                    [discord.SelectOption(label=name, value=name, emoji="🐧") for name in os_types],
+            row=2
+        )
+        os_select.callback = self.os_callback
+        self.add_item(os_select)
+
+    async def interaction_check(self, interaction: discord.Interaction):
+        if not is_admin(interaction.user.id):
+            await interaction.response.send_message("You don't have permission to use this view.", ephemeral=True)
+            return False
+        return True
+
+    async def load_rows(self):
+        """Apply the filters; container states are only looked up when filtering on status"""
+        rows = sorted(registry.all(), key=lambda r: r["container_name"])
+        if self.owner:
+            owner = self.owner.lower()
+            rows = [r for r in rows if owner in r["user"].lower()]
+        if self.os_type:
+            rows = [r for r in rows if r["os_type"] == self.os_type]
+        if self.status:
+            states = await container_states([r["container_name"] for r in rows])
+            rows = [r for r in rows if (states.get(r["container_name"]) == "running") == (self.status == "running")]
+        self.rows = rows
+
+    def page_count(self):
+        return max(1, -(-len(self.rows) // self.page_size))
+
+    async def page_stats(self, container_names):
+        key = tuple(container_names)
+        cached = self.page_cache.get(key)
+        if cached and time.monotonic() - cached[0] <= NODEDMIN_PAGE_TTL:
+            self.page_cache.move_to_end(key)
+            return cached[1]
+        stats = await collect_container_stats(container_names)
+        self.page_cache[key] = (time.monotonic(), stats)
+        while len(self.page_cache) > NODEDMIN_PAGE_CACHE_SIZE:
+            self.page_cache.popitem(last=False)
+        return stats
+
+    def filter_text(self):
+        filters = []
+        if self.owner:
+            filters.append(f"owner `{self.owner}`")
+        if self.status:
+            filters.append(f"status `{self.status}`")
+        if self.os_type:
+            filters.append(f"OS `{self.os_type}`")
+        return ", ".join(filters) if filters else "none"
+
+    async def build_embed(self):
+        self.page = min(max(self.page, 0), self.page_count() - 1)
+        page_rows = self.rows[self.page * self.page_size:(self.page + 1) * self.page_size]
+        embed = discord.Embed(
+            title=f"📊 All VPS Instances (Page {self.page + 1}/{self.page_count()})",
+            description=f"`{len(self.rows)}` of `{len(registry)}` VPS instances | Filters: {self.filter_text()}",
+            color=0x2980b9
+        )
+        if bot.user.avatar:
+            embed.set_thumbnail(url=bot.user.avatar.url)
+        all_stats = await self.page_stats([r["container_name"] for r in page_rows])
+        for record in page_rows:
+            container_name = record["container_name"]
+            stats = all_stats[container_name]
+            status_emoji = "🟢" if stats['status'] == "🟢 Running" else "🔴"
+            embed.add_field(
+                name=f"{status_emoji} `{container_name}` ({stats['status']})",
+                value=(
+                    f"👤 **User:** `{record['user']}`\n"
+                    f"💾 **RAM:** `{record['ram']}GB` | **CPU:** `{record['cpu']}`\n"
+                    f"🌐 **OS:** `{record['os_type']}`\n"
+                    f"👑 **Creator:** `{record['creator']}`\n"
+                    f"🔑 **SSH:** `{record['ssh_command']}`\n"
+                    f"⏱️ **Expires:** `{record['expiry']}`\n"
+                    f"**Memory:** `{stats['memory']}` | **CPU:** `{stats['cpu']}`"
+                ),
+                inline=False
+            )
+        if not page_rows:
+            embed.add_field(name="No matches", value="No VPS instances match these filters.", inline=False)
+        embed.set_footer(text="Powered by SaturnNode | Admin View")
+        self.previous_button.disabled = self.page == 0
+        self.next_button.disabled = self.page >= self.page_count() - 1
+        return embed
+
+    async def update(self, interaction, reload=False):
+        await interaction.response.defer()
+        if reload:
+            await self.load_rows()
+        await interaction.edit_original_response(embed=await self.build_embed(), view=self)
+
+    @discord.ui.button(label="◀️ Previous", style=discord.ButtonStyle.secondary, row=0)
+    async def previous_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.page -= 1
+        await self.update(interaction)
+
+    @discord.ui.button(label="🔢 Jump", style=discord.ButtonStyle.secondary, row=0)
+    async def jump_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await interaction.response.send_modal(JumpToPageModal(self))
+
+    @discord.ui.button(label="▶️ Next", style=discord.ButtonStyle.primary, row=0)
+    async def next_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.page += 1
+        await self.update(interaction)
+
+    @discord.ui.button(label="👤 Owner", style=discord.ButtonStyle.secondary, row=0)
+    async def owner_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await interaction.response.send_modal(OwnerFilterModal(self))
+
+    @discord.ui.button(label="🔄 Refresh", style=discord.ButtonStyle.secondary, row=0)
+    async def refresh_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.page_cache.clear()
+        await self.update(interaction, reload=True)
+
+    async def status_callback(self, interaction: discord.Interaction):
+        value = interaction.data["values"][0]
+        self.status = None if value == "all" else value
+        self.page = 0
+        await self.update(interaction, reload=True)
+
+    async def os_callback(self, interaction: discord.Interaction):
+        value = interaction.data["values"][0]
+        self.os_type = None if value == "all" else value
+        self.page = 0
+        await self.update(interaction, reload=True)
+
+    async def on_timeout(self):
+        for child in self.children:
+            child.disabled = True
+        try:
+            await self.message.edit(view=self)
+        except Exception:
+            pass
 
 @bot.tree.command(name="nodedmin", description="Admin: Lists all VPSs, their details, and SSH commands in a modern embed")
-async def nodedmin(interaction: discord.Interaction):
+@instrument_command
+@app_commands.describe(
+    owner="Only show VPSes whose owner contains this text",
+    status="Only show running or stopped VPSes",
+    os_type="Only show VPSes running this OS (e.g. Ubuntu 22.04)"
+)
+@app_commands.choices(status=[
+    app_commands.Choice(name="Running", value="running"),
+    app_commands.Choice(name="Stopped", value="stopped")
+])
+async def nodedmin(interaction: discord.Interaction, owner: str = None, status: str = None, os_type: str = None):
     if not is_admin(interaction.user.id):
         embed = discord.Embed(
             title="❌ Access Denied",
@@ -411,7 +3458,7 @@ async def nodedmin(interaction: discord.Interaction):
         await interaction.response.send_message(embed=embed, ephemeral=True)
         return
     await interaction.response.defer()
-    if not os.path.exists(database_file):
+    if not len(registry):
         embed = discord.Embed(
             title="VPS Instances",
             description="No VPS data available.",
@@ -419,46 +3466,17 @@ async def nodedmin(interaction: discord.Interaction):
         )
         await interaction.followup.send(embed=embed)
         return
-    with open(database_file, 'r') as f:
-        lines = f.readlines()
-    # Paginate if more than 20
-    page_size = 20
-    pages = [lines[i:i+page_size] for i in range(0, len(lines), page_size)]
-    for page_num, page in enumerate(pages, 1):
-        embed = discord.Embed(
-            title=f"📊 All VPS Instances (Page {page_num}/{len(pages)})",
-            description="Detailed information about all VPS instances",
-            color=0x2980b9
-        )
-        if bot.user.avatar:
-            embed.set_thumbnail(url=bot.user.avatar.url)
-        for line in page:
-            parts = line.strip().split('|')
-            if len(parts) >= 8:
-                user, container_name, ssh_command, ram, cpu, creator, os_type, expiry = parts
-                stats = get_container_stats(container_name)
-                status_emoji = "🟢" if stats['status'] == "🟢 Running" else "🔴"
-                embed.add_field(
-                    name=f"{status_emoji} `{container_name}` ({stats['status']})",
-                    value=(
-                        f"👤 **User:** `{user}`\n"
-                        f"💾 **RAM:** `{ram}GB` | **CPU:** `{cpu}`\n"
-                        f"🌐 **OS:** `{os_type}`\n"
-                        f"👑 **Creator:** `{creator}`\n"
-                        f"🔑 **SSH:** `{ssh_command}`\n"
-                        f"⏱️ **Expires:** `{expiry}`\n"
-                        f"**Memory:** `{stats['memory']}` | **CPU:** `{stats['cpu']}`"
-                    ),
-                    inline=False
-                )
-        embed.set_footer(text="Powered by SaturnNode | Admin View")
-        await interaction.followup.send(embed=embed)
+    view = NodeAdminView(owner=owner, status=status, os_type=os_type)
+    await view.load_rows()
+    view.message = await interaction.followup.send(embed=await view.build_embed(), view=view, wait=True)
 
 @bot.tree.command(name="node", description="Show system resource usage and VPS status in a modern embed")
+@instrument_command
 async def node_stats(interaction: discord.Interaction):
     await interaction.response.defer()
-    system_stats = get_system_stats()
-    containers = get_all_containers()
+    system_stats = await stats_cache.get_system()
+    containers = registry.all()
+    all_stats = await stats_cache.get_containers([r["container_name"] for r in containers])
 
     embed = discord.Embed(
         title="🖥️ System Resource Usage",
@@ -477,23 +3495,66 @@ async def node_stats(interaction: discord.Interaction):
         value=f"Used: `{system_stats['used_disk']}` / Total: `{system_stats['total_disk']}`",
         inline=False
     )
+    if system_stats.get("metrics"):
+        embed.add_field(
+            name="⚙️ CPU",
+            value=format_cpu_summary(system_stats["metrics"]),
+            inline=False
+        )
+        embed.add_field(
+            name="🌡️ Pressure (some, avg10)",
+            value=format_pressure_summary(system_stats["metrics"]),
+            inline=False
+        )
+    if len(NODES) > 1:
+        embed.add_field(
+            name="🌍 Nodes",
+            value=await placement.summary(),
+            inline=False
+        )
+    embed.add_field(
+        name="♨️ Warm Pool",
+        value=warm_pool.summary(),
+        inline=False
+    )
+    embed.add_field(
+        name="🖼️ Images",
+        value=image_catalog.summary() or "None",
+        inline=False
+    )
+    memory_summary = memory_balancer.summary()
+    if memory_summary:
+        embed.add_field(name="🧠 Memory Balancer", value=memory_summary, inline=False)
     embed.add_field(
         name=f"🧊 VPS Instances ({len(containers)})",
-        value="List of all VPS instances and their status:",
+        value="VPS instances by CPU usage, busiest first:",
         inline=False
     )
-    for container_info in containers:
-        parts = container_info.split('|')
-        if len(parts) >= 2:
-            container_id = parts[1]
-            stats = get_container_stats(container_id)
-            status_emoji = "🟢" if stats['status'] == "🟢 Running" else "🔴"
-            embed.add_field(
-                name=f"{status_emoji} `{container_id}`",
-                value=f"Status: {stats['status']}\nMemory: `{stats['memory']}`\nCPU: `{stats['cpu']}`",
-                inline=True
-            )
-    embed.set_footer(text="Powered by SaturnNode")
+    # Embeds cap at 25 fields; list the busiest VPSes and count the rest
+    def cpu_usage(record):
+        try:
+            return float(all_stats[record["container_name"]]["cpu"].rstrip("%"))
+        except ValueError:
+            return -1.0
+    ranked = sorted(containers, key=cpu_usage, reverse=True)
+    room = 25 - len(embed.fields)
+    shown = ranked if len(ranked) <= room else ranked[:room - 1]
+    for record in shown:
+        container_id = record["container_name"]
+        stats = all_stats[container_id]
+        status_emoji = "🟢" if stats['status'] == "🟢 Running" else "🔴"
+        embed.add_field(
+            name=f"{status_emoji} `{container_id}`",
+            value=f"Status: {stats['status']}\nMemory: `{stats['memory']}`\nCPU: `{stats['cpu']}`",
+            inline=True
+        )
+    if len(shown) < len(ranked):
+        embed.add_field(
+            name=f"…and {len(ranked) - len(shown)} more",
+            value="Less busy VPS instances are not listed.",
+            inline=True
+        )
+    embed.set_footer(text=f"Powered by SaturnNode | {stats_cache.age_text()}")
     await interaction.followup.send(embed=embed)
 
 async def regen_ssh_command(interaction: discord.Interaction, container_name: str):
@@ -509,33 +3570,24 @@ async def regen_ssh_command(interaction: discord.Interaction, container_name: st
         await interaction.response.send_message(embed=embed)
         return
 
+    # Waking a hibernated VPS and starting tmate take longer than the interaction deadline
+    await interaction.response.defer()
+
     try:
-        exec_cmd = await asyncio.create_subprocess_exec("docker", "exec", container_id, "tmate", "-F",
-                                                        stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
-    except subprocess.CalledProcessError as e:
+        await hibernator.resume(container_id)
+        ssh_session_line = await tmate_sessions.get_session(container_id, force_new=True)
+    except ContainerRuntimeError as e:
         embed = discord.Embed(
             title="❌ Error",
             description=f"Error executing tmate in Docker container: {e}",
             color=0x2400ff
         )
-        await interaction.response.send_message(embed=embed)
+        await interaction.followup.send(embed=embed)
         return
 
-    ssh_session_line = await capture_ssh_session_line(exec_cmd)
     if ssh_session_line:
         # Update SSH command in database
-        if os.path.exists(database_file):
-            with open(database_file, 'r') as f:
-                lines = f.readlines()
-            with open(database_file, 'w') as f:
-                for line in lines:
-                    if container_id in line:
-                        parts = line.strip().split('|')
-                        if len(parts) >= 3:
-                            parts[2] = ssh_session_line
-                            f.write('|'.join(parts) + '\n')
-                    else:
-                        f.write(line)
+        update_ssh_command_in_database(container_id, ssh_session_line)
         
         # Send DM with new SSH command
         dm_embed = discord.Embed(
@@ -556,14 +3608,14 @@ async def regen_ssh_command(interaction: discord.Interaction, container_name: st
             description="New SSH session generated. Check your DMs for details.",
             color=0x2400ff
         )
-        await interaction.response.send_message(embed=success_embed)
+        await interaction.followup.send(embed=success_embed)
     else:
         error_embed = discord.Embed(
             title="❌ Failed",
             description="Failed to generate new SSH session.",
             color=0x2400ff
         )
-        await interaction.response.send_message(embed=error_embed)
+        await interaction.followup.send(embed=error_embed)
 
 async def start_server(interaction: discord.Interaction, container_name: str):
     user = str(interaction.user.id)
@@ -578,28 +3630,35 @@ async def start_server(interaction: discord.Interaction, container_name: str):
         await interaction.response.send_message(embed=embed)
         return
 
+    if is_expired(registry.get(container_id)):
+        embed = discord.Embed(
+            title="⏰ VPS Expired",
+            description=f"Your VPS instance `{container_name}` has expired and is waiting to be deleted. Ask an admin to renew it first.",
+            color=0x2400ff
+        )
+        await interaction.response.send_message(embed=embed)
+        return
+
+    cooldown = AbuseMonitor.cooldown_left(registry.get(container_id))
+    if cooldown:
+        embed = discord.Embed(
+            title="🛑 VPS Stopped for Abuse",
+            description=f"Your VPS instance `{container_name}` was stopped for excessive CPU usage and can be started again in {cooldown // 60 + 1} minutes.",
+            color=0x2400ff
+        )
+        await interaction.response.send_message(embed=embed)
+        return
+
     await interaction.response.defer()
 
     try:
-        subprocess.run(["docker", "start", container_id], check=True)
-        exec_cmd = await asyncio.create_subprocess_exec("docker", "exec", container_id, "tmate", "-F",
-                                                        stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
-        ssh_session_line = await capture_ssh_session_line(exec_cmd)
+        if not await hibernator.resume(container_id):
+            await runtime.start(container_id)
+        ssh_session_line = await tmate_sessions.get_session(container_id)
         
         if ssh_session_line:
             # Update SSH command in database
-            if os.path.exists(database_file):
-                with open(database_file, 'r') as f:
-                    lines = f.readlines()
-                with open(database_file, 'w') as f:
-                    for line in lines:
-                        if container_id in line:
-                            parts = line.strip().split('|')
-                            if len(parts) >= 3:
-                                parts[2] = ssh_session_line
-                                f.write('|'.join(parts) + '\n')
-                        else:
-                            f.write(line)
+            update_ssh_command_in_database(container_id, ssh_session_line)
             
             # Send DM with SSH command
             dm_embed = discord.Embed(
@@ -643,7 +3702,7 @@ async def start_server(interaction: discord.Interaction, container_name: str):
                 color=0x2400ff
             )
             await interaction.followup.send(embed=error_embed)
-    except subprocess.CalledProcessError as e:
+    except ContainerRuntimeError as e:
         error_embed = discord.Embed(
             title="❌ Error",
             description=f"Error starting VPS instance: {e}",
@@ -667,14 +3726,16 @@ async def stop_server(interaction: discord.Interaction, container_name: str):
     await interaction.response.defer()
 
     try:
-        subprocess.run(["docker", "stop", container_id], check=True)
+        await hibernator.resume(container_id, restore=False)
+        await runtime.stop(container_id)
+        await tmate_sessions.forget(container_id)
         success_embed = discord.Embed(
             title="⏹️ VPS Stopped",
             description=f"Your VPS instance `{container_name}` has been stopped. You can start it again with `/start {container_name}`",
             color=0x2400ff
         )
         await interaction.followup.send(embed=success_embed)
-    except subprocess.CalledProcessError as e:
+    except ContainerRuntimeError as e:
         error_embed = discord.Embed(
             title="❌ Error",
             description=f"Failed to stop VPS instance: {str(e)}",
@@ -695,28 +3756,36 @@ async def restart_server(interaction: discord.Interaction, container_name: str):
         await interaction.response.send_message(embed=embed)
         return
 
+    if is_expired(registry.get(container_id)):
+        embed = discord.Embed(
+            title="⏰ VPS Expired",
+            description=f"Your VPS instance `{container_name}` has expired and is waiting to be deleted. Ask an admin to renew it first.",
+            color=0x2400ff
+        )
+        await interaction.response.send_message(embed=embed)
+        return
+
+    cooldown = AbuseMonitor.cooldown_left(registry.get(container_id))
+    if cooldown:
+        embed = discord.Embed(
+            title="🛑 VPS Stopped for Abuse",
+            description=f"Your VPS instance `{container_name}` was stopped for excessive CPU usage and can be started again in {cooldown // 60 + 1} minutes.",
+            color=0x2400ff
+        )
+        await interaction.response.send_message(embed=embed)
+        return
+
     await interaction.response.defer()
 
     try:
-        subprocess.run(["docker", "restart", container_id], check=True)
-        exec_cmd = await asyncio.create_subprocess_exec("docker", "exec", container_id, "tmate", "-F",
-                                                        stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
-        ssh_session_line = await capture_ssh_session_line(exec_cmd)
+        await hibernator.resume(container_id, restore=False)
+        await tmate_sessions.forget(container_id)
+        await runtime.restart(container_id)
+        ssh_session_line = await tmate_sessions.get_session(container_id)
         
         if ssh_session_line:
             # Update SSH command in database
-            if os.path.exists(database_file):
-                with open(database_file, 'r') as f:
-                    lines = f.readlines()
-                with open(database_file, 'w') as f:
-                    for line in lines:
-                        if container_id in line:
-                            parts = line.strip().split('|')
-                            if len(parts) >= 3:
-                                parts[2] = ssh_session_line
-                                f.write('|'.join(parts) + '\n')
-                        else:
-                            f.write(line)
+            update_ssh_command_in_database(container_id, ssh_session_line)
             
             # Send DM with SSH command
             dm_embed = discord.Embed(
@@ -760,7 +3829,7 @@ async def restart_server(interaction: discord.Interaction, container_name: str):
                 color=0x2400ff
             )
             await interaction.followup.send(embed=error_embed)
-    except subprocess.CalledProcessError as e:
+    except ContainerRuntimeError as e:
         error_embed = discord.Embed(
             title="❌ Error",
             description=f"Error restarting VPS instance: {e}",
@@ -768,19 +3837,67 @@ async def restart_server(interaction: discord.Interaction, container_name: str):
         )
         await interaction.followup.send(embed=error_embed)
 
-async def capture_output(process, keyword):
-    while True:
-        output = await process.stdout.readline()
-        if not output:
-            break
-        output = output.decode('utf-8').strip()
-        if keyword in output:
-            return output
-    return None
+SERVEO_SSH = ("ssh", "-o", "StrictHostKeyChecking=no", "-o", "ServerAliveInterval=30", "-o", "ExitOnForwardFailure=yes")
+
+async def start_port_tunnel(mapping):
+    """Supervised serveo.net tunnel for a /port-add mapping the TCP forwarder cannot serve"""
+    return await supervisor.spawn(
+        mapping["container_name"], f"port:{mapping['public_port']}",
+        *SERVEO_SSH, "-N", "-R", f"{mapping['public_port']}:localhost:{mapping['container_port']}", "serveo.net"
+    )
+
+async def restore_port_tunnels():
+    """Take over the serveo tunnels of persisted mappings after a restart"""
+    for mapping in list(port_allocator.by_port.values()):
+        if PORT_FORWARD_MODE == 'proxy' and tcp_forwarder.is_local(mapping["node"]):
+            continue
+        record = registry.get(mapping["container_name"])
+        if not record or (mapping["container_name"], f"port:{mapping['public_port']}") in supervisor.children:
+            continue
+        if container_tracker.state_of(record["container_name"]) not in (None, "running"):
+            continue
+        try:
+            # A tunnel left by the previous run is still alive but nobody is reading it
+            await runtime.exec_run(mapping["container_name"], "pkill", "-f", f"-R {mapping['public_port']}:localhost:", timeout=10)
+            await start_port_tunnel(mapping)
+        except (ContainerRuntimeError, SupervisorError) as e:
+            print(f"Cannot restore tunnel for port {mapping['public_port']} of {mapping['container_name']}: {e}")
+
+async def open_port_mapping(container_name, container_port, node):
+    """Allocate a public port and start serving it, skipping ports other host processes hold"""
+    for attempt in range(PORT_BIND_RETRIES + 1):
+        mapping = port_allocator.allocate(container_name, container_port, node)
+        try:
+            if PORT_FORWARD_MODE == 'proxy' and tcp_forwarder.is_local(node):
+                # Relay the public port on this host straight to the container
+                await tcp_forwarder.open(mapping)
+            else:
+                # Tunnel the port through serveo.net from inside the container
+                await start_port_tunnel(mapping)
+            return mapping
+        except OSError as e:
+            port_allocator.release(node, mapping["public_port"])
+            if e.errno != errno.EADDRINUSE or attempt == PORT_BIND_RETRIES:
+                raise
+            port_allocator.mark_unavailable(node, mapping["public_port"])
+        except Exception:
+            port_allocator.release(node, mapping["public_port"])
+            raise
 
 @bot.tree.command(name="port-add", description="🔌 Adds a port forwarding rule")
+@instrument_command
 @app_commands.describe(container_name="The name of the container", container_port="The port in the container")
-async def port_add(interaction: discord.Interaction, container_name: str, container_port: int):
+async def port_add(interaction: discord.Interaction, container_name: str, container_port: app_commands.Range[int, 1, 65535]):
+    record = registry.get(container_name)
+    if not record or (record["user"] != str(interaction.user.id) and not is_admin(interaction.user.id)):
+        embed = discord.Embed(
+            title="❌ Not Found",
+            description="No instance found with that name for your user.",
+            color=0x2400ff
+        )
+        await interaction.response.send_message(embed=embed)
+        return
+
     embed = discord.Embed(
         title="🔄 Setting Up IPV4 Forwarding",
         description="Setting up port forwarding. This might take a moment...",
@@ -788,32 +3905,16 @@ async def port_add(interaction: discord.Interaction, container_name: str, contai
     )
     await interaction.response.send_message(embed=embed)
 
-    public_port = generate_random_port()
-
-    # Set up port forwarding inside the container
-    command = f"ssh -o StrictHostKeyChecking=no -R {public_port}:localhost:{container_port} serveo.net -N -f"
-
     try:
-        # Run the command in the background using Docker exec
-        await asyncio.create_subprocess_exec(
-            "docker", "exec", container_name, "bash", "-c", command,
-            stdout=asyncio.subprocess.DEVNULL,
-            stderr=asyncio.subprocess.DEVNULL
-        )
-
-        # Respond with the port and public IP
-        success_embed = discord.Embed(
-            title="✅ Get IPV4 Successful",
-            description=f"Your service is now accessible from the internet.",
+        mapping = await open_port_mapping(container_name, container_port, runtime.node_of(container_name))
+    except PortAllocationError as e:
+        error_embed = discord.Embed(
+            title="❌ No Port Available",
+            description=str(e),
             color=0x2400ff
         )
-        success_embed.add_field(
-            name="🌐 Connection Details",
-            value=f"**Host:** {PUBLIC_IP}\n**Port:** {public_port}",
-            inline=False
-        )
-        await interaction.followup.send(embed=success_embed)
-
+        await interaction.followup.send(embed=error_embed)
+        return
     except Exception as e:
         error_embed = discord.Embed(
             title="❌ Error",
@@ -821,10 +3922,184 @@ async def port_add(interaction: discord.Interaction, container_name: str, contai
             color=0x2400ff
         )
         await interaction.followup.send(embed=error_embed)
+        return
+
+    # Respond with the port and public IP
+    success_embed = discord.Embed(
+        title="✅ Get IPV4 Successful",
+        description=f"Your service is now accessible from the internet.",
+        color=0x2400ff
+    )
+    success_embed.add_field(
+        name="🌐 Connection Details",
+        value=f"**Host:** {public_ip_for(container_name)}\n**Port:** {mapping['public_port']}",
+        inline=False
+    )
+    await interaction.followup.send(embed=success_embed)
+
+@bot.tree.command(name="port-list", description="📋 Lists the forwarded ports of your VPS instances")
+@instrument_command
+@app_commands.describe(container_name="Only show this container (admins can name any container)")
+async def port_list(interaction: discord.Interaction, container_name: str = None):
+    if container_name:
+        record = registry.get(container_name)
+        records = [record] if record and (record["user"] == str(interaction.user.id) or is_admin(interaction.user.id)) else []
+    else:
+        records = registry.for_owner(interaction.user.id)
+
+    embed = discord.Embed(
+        title="🔌 Forwarded Ports",
+        color=0x2400ff
+    )
+    for record in records:
+        mappings = port_allocator.for_container(record["container_name"])
+        routes = http_routes_of(record)
+        if not mappings and not routes:
+            continue
+        host = public_ip_for(record["container_name"])
+        lines = [f"{http_url_for(hostname)} → `{port}`" for hostname, port in sorted(routes.items())]
+        for m in mappings:
+            line = f"`{host}:{m['public_port']}` → `{m['container_port']}`"
+            counters = tcp_forwarder.counters_for(m)
+            if counters:
+                line += (f" | ⬇️ {format_binary_size(counters['bytes_in'])} ⬆️ {format_binary_size(counters['bytes_out'])}"
+                         f" | {counters['active']} open")
+            lines.append(line)
+        embed.add_field(
+            name=f"🖥️ {record['container_name']}",
+            value="\n".join(lines),
+            inline=False
+        )
+    if not embed.fields:
+        embed.description = "No forwarded ports. Add one with `/port-add`."
+    await interaction.response.send_message(embed=embed)
+
+@bot.tree.command(name="port-remove", description="🗑️ Removes a port forwarding rule")
+@instrument_command
+@app_commands.describe(container_name="The name of the container", public_port="The public port to release")
+async def port_remove(interaction: discord.Interaction, container_name: str, public_port: int):
+    record = registry.get(container_name)
+    mapping = None
+    if record and (record["user"] == str(interaction.user.id) or is_admin(interaction.user.id)):
+        mapping = next((m for m in port_allocator.for_container(container_name) if m["public_port"] == public_port), None)
+    if not mapping:
+        embed = discord.Embed(
+            title="❌ Not Found",
+            description=f"`{container_name}` has no forwarded port `{public_port}`.",
+            color=0x2400ff
+        )
+        await interaction.response.send_message(embed=embed)
+        return
+
+    await interaction.response.defer()
+    tcp_forwarder.close(mapping["node"], public_port)
+    await supervisor.stop(container_name, f"port:{public_port}")
+    port_allocator.release(mapping["node"], public_port)
+    embed = discord.Embed(
+        title="✅ Port Removed",
+        description=f"Public port `{public_port}` (→ `{mapping['container_port']}`) of `{container_name}` has been released.",
+        color=0x2400ff
+    )
+    await interaction.followup.send(embed=embed)
+
+HTTP_LABEL = re.compile(r"[a-z0-9]([a-z0-9-]{0,61}[a-z0-9])?")
+
+def valid_http_label(label):
+    """A single DNS label for a subdomain of HTTP_PROXY_DOMAIN"""
+    return bool(HTTP_LABEL.fullmatch(label))
+
+@bot.tree.command(name="port-http", description="🌐 Forward HTTP traffic to your container")
+@instrument_command
+@app_commands.describe(
+    container_name="The name of your container",
+    container_port="The port inside the container to forward",
+    hostname=f"Subdomain of {HTTP_PROXY_DOMAIN} (letters, digits and dashes)"
+)
+async def port_forward_website(interaction: discord.Interaction, container_name: str, container_port: app_commands.Range[int, 1, 65535], hostname: str = None):
+    record = registry.get(container_name)
+    if not record or (record["user"] != str(interaction.user.id) and not is_admin(interaction.user.id)):
+        embed = discord.Embed(
+            title="❌ Not Found",
+            description="No instance found with that name for your user.",
+            color=0x2400ff
+        )
+        await interaction.response.send_message(embed=embed)
+        return
+
+    if PORT_FORWARD_MODE != 'proxy' or not HTTP_PROXY_PORT or not tcp_forwarder.is_local(record["node"]):
+        await port_http_serveo(interaction, container_name, container_port)
+        return
+
+    hostname = (hostname or re.sub(r"[^a-z0-9-]+", "-", f"{container_name}-{container_port}".lower())[-63:].strip("-")).lower().rstrip(".")
+    if hostname.endswith("." + HTTP_PROXY_DOMAIN.lower()):
+        hostname = hostname[:-len(HTTP_PROXY_DOMAIN) - 1]
+    routes = http_routes_of(record)
+    owner = http_proxy.owner_of(hostname)
+    if not valid_http_label(hostname):
+        problem = f"`{hostname}` is not a valid subdomain of `{HTTP_PROXY_DOMAIN}`. Use a single label of letters, digits and dashes."
+    elif hostname in HTTP_RESERVED_LABELS:
+        problem = f"`{hostname}` is reserved. Pick another subdomain."
+    elif owner and owner != container_name:
+        problem = f"`{hostname}` is already routed to another VPS."
+    elif hostname not in routes and len(routes) >= HTTP_ROUTES_PER_VPS:
+        problem = f"`{container_name}` already has {HTTP_ROUTES_PER_VPS} HTTP routes. Remove one with /port-http-remove first."
+    else:
+        problem = None
+    if problem:
+        embed = discord.Embed(
+            title="❌ Cannot Add Route",
+            description=problem,
+            color=0x2400ff
+        )
+        await interaction.response.send_message(embed=embed)
+        return
+
+    routes[hostname] = container_port
+    registry.update(container_name, http_routes=json.dumps(routes, sort_keys=True))
+    url = http_url_for(hostname)
+    embed = discord.Embed(
+        title="✅ HTTP Forwarding Successful",
+        description=f"Your web service is now accessible from the internet.",
+        color=0x2400ff
+    )
+    embed.add_field(
+        name="🌐 Website URL",
+        value=f"[{url}]({url}) → port `{container_port}`",
+        inline=False
+    )
+    await interaction.response.send_message(embed=embed)
+
+@bot.tree.command(name="port-http-remove", description="🗑️ Removes an HTTP route")
+@instrument_command
+@app_commands.describe(container_name="The name of your container", hostname="The hostname shown by /port-list")
+async def port_http_remove(interaction: discord.Interaction, container_name: str, hostname: str):
+    record = registry.get(container_name)
+    routes = {}
+    if record and (record["user"] == str(interaction.user.id) or is_admin(interaction.user.id)):
+        routes = http_routes_of(record)
+    hostname = hostname.lower().rstrip(".").removeprefix("http://").split(":")[0]
+    if hostname.endswith("." + HTTP_PROXY_DOMAIN.lower()):
+        hostname = hostname[:-len(HTTP_PROXY_DOMAIN) - 1]
+    if hostname not in routes:
+        embed = discord.Embed(
+            title="❌ Not Found",
+            description=f"`{container_name}` has no HTTP route `{hostname}`.",
+            color=0x2400ff
+        )
+        await interaction.response.send_message(embed=embed)
+        return
 
-@bot.tree.command(name="port-http", description="🌐 Forward HTTP traffic to your container")
-@app_commands.describe(container_name="The name of your container", container_port="The port inside the container to forward")
-async def port_forward_website(interaction: discord.Interaction, container_name: str, container_port: int):
+    container_port = routes.pop(hostname)
+    registry.update(container_name, http_routes=json.dumps(routes, sort_keys=True))
+    embed = discord.Embed(
+        title="✅ Route Removed",
+        description=f"`{hostname}` (→ `{container_port}`) no longer routes to `{container_name}`.",
+        color=0x2400ff
+    )
+    await interaction.response.send_message(embed=embed)
+
+async def port_http_serveo(interaction, container_name, container_port):
+    """/port-http through a serveo.net SSH tunnel, for nodes this host cannot reach directly"""
     embed = discord.Embed(
         title="🔄 Setting Up HTTP Forwarding",
         description="Setting up HTTP forwarding. This might take a moment...",
@@ -833,11 +4108,15 @@ async def port_forward_website(interaction: discord.Interaction, container_name:
     await interaction.response.send_message(embed=embed)
     
     try:
-        exec_cmd = await asyncio.create_subprocess_exec(
-            "docker", "exec", container_name, "ssh", "-o", "StrictHostKeyChecking=no", "-R", f"80:localhost:{container_port}", "serveo.net",
-            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+        child = await supervisor.spawn(
+            container_name, f"http:{container_port}",
+            *SERVEO_SSH, "-R", f"80:localhost:{container_port}", "serveo.net",
+            match="Forwarding HTTP traffic from"
         )
-        url_line = await capture_output(exec_cmd, "Forwarding HTTP traffic from")
+        try:
+            url_line = await asyncio.wait_for(asyncio.shield(child["ready"]), TUNNEL_READY_TIMEOUT)
+        except asyncio.TimeoutError:
+            url_line = None
         
         if url_line:
             url = url_line.split(" ")[-1]
@@ -852,6 +4131,7 @@ async def port_forward_website(interaction: discord.Interaction, container_name:
             )
             await interaction.followup.send(embed=success_embed)
         else:
+            await supervisor.stop(container_name, f"http:{container_port}")
             error_embed = discord.Embed(
                 title="❌ Error",
                 description="Failed to set up HTTP forwarding. Please try again later.",
@@ -866,7 +4146,50 @@ async def port_forward_website(interaction: discord.Interaction, container_name:
         )
         await interaction.followup.send(embed=error_embed)
 
+SUPERVISOR_STATUS_ICONS = {"starting": "🟡", "running": "🟢", "backoff": "🟠"}
+
+@bot.tree.command(name="tunnels", description="🚇 Lists the background tunnels of your VPS instances")
+@instrument_command
+@app_commands.describe(container_name="Only show this container (admins see every VPS by default)")
+async def tunnels(interaction: discord.Interaction, container_name: str = None):
+    if container_name:
+        record = registry.get(container_name)
+        allowed = record and (record["user"] == str(interaction.user.id) or is_admin(interaction.user.id))
+        children = supervisor.for_container(container_name) if allowed else []
+    elif is_admin(interaction.user.id):
+        children = supervisor.all()
+    else:
+        owned = {r["container_name"] for r in registry.for_owner(interaction.user.id)}
+        children = [c for c in supervisor.all() if c["container"] in owned]
+
+    embed = discord.Embed(
+        title="🚇 Background Tunnels",
+        color=0x2400ff
+    )
+    for child in children[:25]:
+        lines = [f"{SUPERVISOR_STATUS_ICONS.get(child['status'], '⚪')} {child['status'].capitalize()}"]
+        if child["started"]:
+            lines[0] += f" since <t:{int(child['started'])}:R>"
+        if child["restarts"]:
+            lines.append(f"🔁 {child['restarts']} restarts" + (f" (last exit code {child['exit_code']})" if child["exit_code"] is not None else ""))
+        if child["error"]:
+            lines.append(f"⚠️ {child['error'][:200]}")
+        last_line = child["matched"] or (child["output"][-1] if child["output"] else None)
+        if last_line:
+            lines.append(f"`{last_line}`")
+        embed.add_field(
+            name=f"🖥️ {child['container']} · {child['purpose']}",
+            value="\n".join(lines),
+            inline=False
+        )
+    if len(children) > 25:
+        embed.set_footer(text=f"Showing 25 of {len(children)} processes")
+    if not children:
+        embed.description = "No background tunnels are running."
+    await interaction.response.send_message(embed=embed)
+
 @bot.tree.command(name="deploy", description="🚀 Admin: Deploy a new VPS instance")
+@instrument_command
 @app_commands.describe(
     ram="RAM allocation in GB (max 100gb)",
     cpu="CPU cores (max 24)",
@@ -923,8 +4246,50 @@ async def deploy(
         await deploy_with_os(interaction, selected_os, ram, cpu, user_id, user, container_name, expiry_date)
     
     view = OSSelectView(os_selected_callback)
+    if not view.options:
+        embed = discord.Embed(
+            title="⏳ Images Not Ready",
+            description="No VPS image is ready yet. Missing images are being built in the background; `/node` shows their progress.",
+            color=0x2400ff
+        )
+        embed.add_field(name="🖼️ Images", value=image_catalog.summary() or "None", inline=False)
+        await interaction.response.send_message(embed=embed)
+        return
+
     await interaction.response.send_message(embed=embed, view=view)
 
+async def place_vps(os_type, container_name, ram, cpu):
+    """Place a new VPS on a node that has the image, then claim a booted container
+    from that node's warm pool or create one with resource limits.
+
+    Returns (node, pool_hit). A node that goes down after it was chosen is
+    skipped and the VPS is placed on the next best one.
+    """
+    nodes = image_catalog.ready_nodes(os_type)
+    if not nodes:
+        raise ContainerRuntimeError(f"The {os_type_to_display_name(os_type)} image is not ready on any node yet")
+    while True:
+        node = await placement.choose(ram, cpu, nodes)
+        try:
+            # A warm container grows to the full plan too, so both paths wait for memory pressure to drop
+            if not await memory_balancer.admit(node):
+                raise ContainerRuntimeError("The host is short on memory right now; please try again in a few minutes")
+            pool_hit = await warm_pool.claim(os_type, container_name, ram, cpu, node)
+            if not pool_hit:
+                await runtime.run(get_docker_image_for_os(os_type, node), container_name, ram, cpu, node=node)
+            return node, pool_hit
+        except NodeUnreachableError as e:
+            print(f"Node {node} went down while deploying {container_name}: {e}")
+            runtime.release(container_name)
+            placement.forget(node)
+            nodes = [n for n in nodes if n != node]
+        except ContainerRuntimeError as e:
+            runtime.release(container_name)
+            if isinstance(e, DockerAPIError) and e.status == 404:
+                # The image was removed behind our back
+                image_catalog.mark_missing(node, os_type)
+            raise
+
 async def deploy_with_os(interaction, os_type, ram, cpu, user_id, user, container_name, expiry_date):
     # Prepare response
     embed = discord.Embed(
@@ -938,21 +4303,13 @@ async def deploy_with_os(interaction, os_type, ram, cpu, user_id, user, containe
     )
     await interaction.followup.send(embed=embed)
     
-    # Select image based on OS type
-    image = get_docker_image_for_os(os_type)
-    
+    deploy_started = time.monotonic()
+    phases = DeployPhases()
+
     try:
-        # Create container with resource limits
-        container_id = subprocess.check_output([
-            "docker", "run", "-itd", 
-            "--privileged", 
-            "--cap-add=ALL",
-            f"--memory={ram}g",
-            f"--cpus={cpu}",
-            "--name", container_name,
-            image
-        ]).strip().decode('utf-8')
-    except subprocess.CalledProcessError as e:
+        with phases.phase("create"):
+            node, pool_hit = await place_vps(os_type, container_name, ram, cpu)
+    except ContainerRuntimeError as e:
         error_embed = discord.Embed(
             title="❌ Error",
             description=f"Error creating Docker container: {e}",
@@ -961,9 +4318,14 @@ async def deploy_with_os(interaction, os_type, ram, cpu, user_id, user, containe
         await interaction.followup.send(embed=error_embed)
         return
 
+    # tmate can only start once systemd is up; warm containers are already booted
+    with phases.phase("boot"):
+        if not await wait_for_boot(container_name, BOOT_READY_TIMEOUT):
+            print(f"{container_name} did not finish booting within {BOOT_READY_TIMEOUT}s; starting tmate anyway")
+
     try:
-        exec_cmd = await asyncio.create_subprocess_exec("docker", "exec", container_name, "tmate", "-F",
-                                                        stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+        with phases.phase("tmate"):
+            ssh_session_line = await tmate_sessions.get_session(container_name, force_new=True, wait_boot=False)
     except Exception as e:
         error_embed = discord.Embed(
             title="❌ Error",
@@ -973,12 +4335,17 @@ async def deploy_with_os(interaction, os_type, ram, cpu, user_id, user, containe
         await interaction.followup.send(embed=error_embed)
         
         # Clean up container
-        subprocess.run(["docker", "stop", container_name], check=False)
-        subprocess.run(["docker", "rm", container_name], check=False)
+        try:
+            await runtime.remove(container_name, force=True)
+        except ContainerRuntimeError:
+            pass
+        runtime.release(container_name)
         return
 
-    ssh_session_line = await capture_ssh_session_line(exec_cmd)
     if ssh_session_line:
+        time_to_ssh = time.monotonic() - deploy_started
+        warm_pool.record_time_to_ssh(pool_hit, time_to_ssh)
+
         # Add to database with extended information
         add_to_database(
             user, 
@@ -988,7 +4355,8 @@ async def deploy_with_os(interaction, os_type, ram, cpu, user_id, user, containe
             cpu_limit=cpu, 
             creator=str(interaction.user),
             expiry=expiry_date,
-            os_type=os_type_to_display_name(os_type)
+            os_type=os_type_to_display_name(os_type),
+            node=node
         )
         
         # Create a DM embed with detailed information
@@ -1008,10 +4376,12 @@ async def deploy_with_os(interaction, os_type, ram, cpu, user_id, user, containe
         dm_embed.set_footer(text="Keep this information safe and private!")
         
         # Try to send DM to target user
-        target_user_obj = await bot.fetch_user(int(user_id))
+        with phases.phase("dm"):
+            target_user_obj = await bot.fetch_user(int(user_id))
         
         try:
-            await target_user_obj.send(embed=dm_embed)
+            with phases.phase("dm"):
+                await target_user_obj.send(embed=dm_embed)
             
             # Public success message
             success_embed = discord.Embed(
@@ -1019,6 +4389,11 @@ async def deploy_with_os(interaction, os_type, ram, cpu, user_id, user, containe
                 description=f"** 🎉 VPS instance has been created for <@{user_id}>. They should check their DMs for connection details.**",
                 color=0x2400ff
             )
+            success_embed.add_field(
+                name="⚡ Provisioning",
+                value=f"{'Warm pool' if pool_hit else 'Cold start'} | SSH ready in {time_to_ssh:.1f}s\n{phases.summary()}",
+                inline=False
+            )
             await interaction.followup.send(embed=success_embed)
             
         except discord.Forbidden:
@@ -1030,13 +4405,14 @@ async def deploy_with_os(interaction, os_type, ram, cpu, user_id, user, containe
             )
             warning_embed.add_field(name="🔑 SSH Connection Command", value=f"```{ssh_session_line}```", inline=False)
             await interaction.followup.send(embed=warning_embed)
+        phases.record(pool_hit)
     else:
         # Clean up container if SSH session couldn't be established
         try:
-            subprocess.run(["docker", "stop", container_name], check=False)
-            subprocess.run(["docker", "rm", container_name], check=False)
-        except Exception:
+            await runtime.remove(container_name, force=True)
+        except ContainerRuntimeError:
             pass
+        runtime.release(container_name)
         
         error_embed = discord.Embed(
             title="❌ Deployment Failed",
@@ -1047,19 +4423,971 @@ async def deploy_with_os(interaction, os_type, ram, cpu, user_id, user, containe
 
 def os_type_to_display_name(os_type):
     """Convert OS type to display name"""
-    os_map = {
-        "ubuntu": "Ubuntu 22.04",
-        "debian": "Debian 12"
-    }
-    return os_map.get(os_type, "Unknown OS")
+    entry = IMAGE_CATALOG.get(os_type)
+    return entry["name"] if entry else "Unknown OS"
 
-def get_docker_image_for_os(os_type):
-    """Get Docker image name for OS type"""
-    os_map = {
-        "ubuntu": "ubuntu-22.04-with-tmate",
-        "debian": "debian-with-tmate"
-    }
-    return os_map.get(os_type, "ubuntu-22.04-with-tmate")
+def get_docker_image_for_os(os_type, node=DEFAULT_NODE):
+    """Image to create an OS type's containers from on a node (its recorded ID once checked)"""
+    return image_catalog.image_for(os_type, node)
+
+async def wait_for_boot(container_name, timeout=WARM_POOL_BOOT_TIMEOUT):
+    """Wait until the container has finished booting.
+
+    Each attempt is a single exec that blocks inside the container until boot
+    completes; attempts are only repeated while PID 1 is too early in boot to
+    answer (or the exec itself fails).
+    """
+    if BOOT_PROBE == 'marker':
+        command = ("sh", "-c", f"until [ -e {BOOT_MARKER} ]; do sleep 0.1; done")
+    else:
+        command = ("systemctl", "is-system-running", "--wait")
+    deadline = time.monotonic() + timeout
+    while (remaining := deadline - time.monotonic()) > 0:
+        try:
+            exit_code, output = await runtime.exec_run(container_name, *command, timeout=remaining)
+            if BOOT_PROBE == 'marker' and exit_code == 0:
+                return True
+            # --wait returns once systemd leaves "starting"; degraded just means a unit failed
+            if output.strip() in ("running", "degraded", "maintenance"):
+                return True
+        except ContainerRuntimeError:
+            pass
+        await asyncio.sleep(min(0.5, max(deadline - time.monotonic(), 0)))
+    return False
+
+# Wall-clock time of each deploy phase (create, boot, tmate, dm)
+class DeployPhases:
+    def __init__(self):
+        self.durations = {}
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.durations[name] = self.durations.get(name, 0) + time.perf_counter() - started
+
+    def record(self, pool_hit):
+        source = "warm" if pool_hit else "cold"
+        for name, seconds in self.durations.items():
+            metrics.observe("dp_vps_deploy_phase_seconds", seconds, phase=name, source=source)
+        warm_pool.record_phases(pool_hit, self.durations)
+
+    def summary(self):
+        return " · ".join(f"{name} `{seconds:.1f}s`" for name, seconds in self.durations.items())
+
+metrics.describe("dp_vps_deploy_phase_seconds", "histogram", "Time spent in each /deploy phase, by warm pool hit or cold start")
+
+# Booted, unassigned containers per OS, claimed by /deploy instead of a cold start
+class WarmPool:
+    def __init__(self, sizes, nodes):
+        self.sizes = dict(sizes)
+        # Pools are kept per (node, OS) so a claim never crosses hosts
+        self.ready = {(node, os_type): [] for node in nodes for os_type in self.sizes}
+        self.refills = {}
+        self.hits = 0
+        self.misses = 0
+        self.ssh_times = {True: collections.deque(maxlen=50), False: collections.deque(maxlen=50)}
+        self.phase_times = {True: {}, False: {}}  # pool hit -> phase -> recent durations
+
+    async def discover(self):
+        """Adopt warm containers left over from a previous run"""
+        containers = await runtime.list_containers(filters={"label": [WARM_POOL_LABEL]})
+        for container in containers:
+            name = container["Names"][0].lstrip("/")
+            key = (container["Node"], (container.get("Labels") or {}).get(WARM_POOL_LABEL))
+            # Claimed containers keep the label but have been renamed
+            if not name.startswith(WARM_POOL_PREFIX) or key not in self.ready or name in self.ready[key]:
+                continue
+            runtime.assign(name, container["Node"])
+            if container.get("State") == "running":
+                self.ready[key].append(name)
+            else:
+                try:
+                    await runtime.remove(name, force=True)
+                except ContainerRuntimeError:
+                    pass
+                runtime.release(name)
+
+    def refill(self, node=None, os_type=None):
+        """Top the pools back up in the background"""
+        for key in self.ready:
+            task = self.refills.get(key)
+            if (node is None or key[0] == node) and (os_type is None or key[1] == os_type) \
+                    and (task is None or task.done()):
+                self.refills[key] = asyncio.create_task(self._refill(*key))
+
+    async def _refill(self, node, os_type):
+        pool = self.ready[(node, os_type)]
+        # Until the image is checked (or built) there is nothing to warm; the catalog refills once it is
+        while len(pool) < self.sizes[os_type] and image_catalog.is_ready(os_type, node) \
+                and not memory_balancer.under_pressure(node):
+            name = f"{WARM_POOL_PREFIX}{os_type}_{generate_random_string(8)}"
+            try:
+                await runtime.run(get_docker_image_for_os(os_type, node), name, labels={WARM_POOL_LABEL: os_type}, node=node)
+                if not await wait_for_boot(name):
+                    raise ContainerRuntimeError("container did not finish booting")
+            except ContainerRuntimeError as e:
+                print(f"Failed to warm a {os_type} container on {node}: {e}")
+                try:
+                    await runtime.remove(name, force=True)
+                except ContainerRuntimeError:
+                    pass
+                runtime.release(name)
+                return
+            pool.append(name)
+
+    async def claim(self, os_type, container_name, ram, cpu, node):
+        """Resize and rename a warm container on the node for a deploy; returns False on a pool miss"""
+        pool = self.ready.get((node, os_type), [])
+        while pool:
+            name = pool.pop(0)
+            try:
+                await runtime.update_resources(name, ram, cpu)
+                await runtime.rename(name, container_name)
+            except ContainerRuntimeError as e:
+                print(f"Discarding warm container {name}: {e}")
+                try:
+                    await runtime.remove(name, force=True)
+                except ContainerRuntimeError:
+                    pass
+                runtime.release(name)
+                continue
+            self.hits += 1
+            self.refill(node, os_type)
+            return True
+        self.misses += 1
+        self.refill(node, os_type)
+        return False
+
+    def record_time_to_ssh(self, pool_hit, seconds):
+        self.ssh_times[pool_hit].append(seconds)
+
+    def record_phases(self, pool_hit, durations):
+        for name, seconds in durations.items():
+            self.phase_times[pool_hit].setdefault(name, collections.deque(maxlen=50)).append(seconds)
+
+    def summary(self):
+        def average(samples):
+            return f"{sum(samples) / len(samples):.1f}s" if samples else "n/a"
+        multi_node = len({node for node, _ in self.ready}) > 1
+        ready = ", ".join(
+            f"{f'{node}/' if multi_node else ''}{os_type} {len(pool)}/{self.sizes[os_type]}"
+            for (node, os_type), pool in self.ready.items()
+        )
+        phases = "\n".join(
+            f"Avg phases ({'hit' if pool_hit else 'miss'}): "
+            + " | ".join(f"{name} `{average(samples)}`" for name, samples in self.phase_times[pool_hit].items())
+            for pool_hit in (True, False) if self.phase_times[pool_hit]
+        )
+        return (
+            f"Ready: `{ready}`\n"
+            f"Hits: `{self.hits}` | Misses: `{self.misses}`\n"
+            f"Avg time-to-SSH: hit `{average(self.ssh_times[True])}` | miss `{average(self.ssh_times[False])}`"
+            + (f"\n{phases}" if phases else "")
+        )
+
+warm_pool = WarmPool(WARM_POOL_SIZES, NODES)
+
+async def send_owner_dm(record, embed):
+    """DM the owner of a VPS, ignoring owners we cannot reach"""
+    try:
+        owner = await bot.fetch_user(int(record["user"]))
+        await owner.send(embed=embed)
+    except (ValueError, discord.HTTPException):
+        pass
+
+# Enforces the stored expiry column. Deadlines live in a min-heap and the
+# loop sleeps until the earliest one instead of polling the registry.
+class ExpiryScheduler:
+    def __init__(self, grace_period=EXPIRY_GRACE_PERIOD):
+        self.grace_period = grace_period
+        self.heap = []
+        self.deadlines = {}
+        self.wakeup = asyncio.Event()
+        self.task = None
+
+    def schedule(self, container_name, expiry_ts, due=None):
+        """(Re)schedule a container; heap entries whose expiry no longer matches are skipped lazily"""
+        if expiry_ts is None:
+            self.deadlines.pop(container_name, None)
+            return
+        self.deadlines[container_name] = expiry_ts
+        entry = (due or expiry_ts, container_name, expiry_ts)
+        heapq.heappush(self.heap, entry)
+        if self.heap[0] == entry:
+            self.wakeup.set()
+
+    def on_registry_change(self, event, record, changed):
+        if event == "remove":
+            self.deadlines.pop(record["container_name"], None)
+        elif "expiry" in changed:
+            self.schedule(record["container_name"], parse_expiry(record["expiry"]))
+
+    def start(self):
+        if self.task and not self.task.done():
+            return
+        self.heap = []
+        self.deadlines = {}
+        for record in registry.all():
+            expiry_ts = parse_expiry(record["expiry"])
+            if expiry_ts is not None and is_expired(record):
+                # Already stopped and its owner told; only the deletion is left
+                self.schedule(record["container_name"], expiry_ts, due=expiry_ts + self.grace_period)
+            else:
+                self.schedule(record["container_name"], expiry_ts)
+        self.task = asyncio.create_task(self.run())
+
+    async def run(self):
+        while True:
+            self.wakeup.clear()
+            while self.heap and self.deadlines.get(self.heap[0][1]) != self.heap[0][2]:
+                heapq.heappop(self.heap)
+            if not self.heap:
+                await self.wakeup.wait()
+                continue
+            due, container_name, expiry_ts = self.heap[0]
+            delay = due - time.time()
+            if delay > 0:
+                # Re-check at least daily in case the wall clock jumped
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), timeout=min(delay, 86400))
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            heapq.heappop(self.heap)
+            try:
+                await self.expire(container_name, expiry_ts)
+            except Exception as e:
+                print(f"Failed to expire {container_name}: {e}")
+
+    async def expire(self, container_name, expiry_ts):
+        record = registry.get(container_name)
+        if not record:
+            self.deadlines.pop(container_name, None)
+            return
+        delete_at = expiry_ts + self.grace_period
+        if time.time() < delete_at:
+            # Stop now and delete once the grace period is over
+            self.schedule(container_name, expiry_ts, due=delete_at)
+            if is_expired(record):
+                return
+            try:
+                await runtime.stop(container_name)
+            except ContainerRuntimeError:
+                pass
+            await tmate_sessions.forget(container_name)
+            registry.update(container_name, expired=record["expiry"])
+            embed = discord.Embed(
+                title="⏰ VPS Expired",
+                description=(
+                    f"Your VPS instance `{container_name}` has expired and has been stopped.\n"
+                    f"It will be deleted on `{datetime.fromtimestamp(delete_at).strftime(EXPIRY_FORMAT)}` unless it is renewed."
+                ),
+                color=0x2400ff
+            )
+            await send_owner_dm(record, embed)
+            return
+
+        results = await teardown_containers([container_name])
+        if results[container_name]:
+            print(f"Failed to delete expired VPS {container_name}: {results[container_name]}")
+            self.schedule(container_name, expiry_ts, due=time.time() + 300)
+            return
+        registry.remove(container_name)
+        embed = discord.Embed(
+            title="🗑️ VPS Deleted",
+            description=f"Your VPS instance `{container_name}` expired and has been deleted.",
+            color=0x2400ff
+        )
+        await send_owner_dm(record, embed)
+
+expiry_scheduler = ExpiryScheduler()
+
+# Per-VPS CPU abuse monitor reading cgroup v2 accounting. A VPS that keeps
+# using most of its CPU allocation is throttled, then paused, then stopped.
+class AbuseMonitor:
+    LEVELS = ("ok", "throttled", "paused", "stopped")
+
+    def __init__(self, cgroup_root=CGROUP_ROOT, audit_log=ABUSE_AUDIT_LOG):
+        self.cgroup_root = cgroup_root
+        self.audit_log = audit_log
+        self.cgroups = {}  # container name -> cgroup directory
+        self.samples = {}  # container name -> (monotonic time, usage_usec)
+        self.states = {}  # container name -> escalation state
+        self.task = None
+
+    def start(self):
+        if not os.path.isdir(self.cgroup_root) or not os.path.exists(os.path.join(self.cgroup_root, "cgroup.controllers")):
+            print(f"Abuse monitor disabled: no cgroup v2 hierarchy at {self.cgroup_root}")
+            return
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    def local_nodes(self):
+        """Nodes whose cgroups live on this host"""
+        return {node for node, config in NODES.items() if not config.get("host")}
+
+    async def cgroup_for(self, container_name):
+        """Cgroup directory of a container; a stale cached one is dropped by forget() once reading it fails"""
+        path = self.cgroups.get(container_name)
+        if path:
+            return path
+        container_id = (container_tracker.states.get((runtime.node_of(container_name), container_name)) or {}).get("id")
+        if not container_id:
+            try:
+                container_id = (await runtime.inspect(container_name))["Id"]
+            except ContainerRuntimeError:
+                return None
+        path = await asyncio.to_thread(self.find_cgroup, container_id)
+        if path:
+            self.cgroups[container_name] = path
+        return path
+
+    def find_cgroup(self, container_id):
+        # systemd cgroup driver first, then the cgroupfs driver
+        for path in (os.path.join(self.cgroup_root, "system.slice", f"docker-{container_id}.scope"),
+                     os.path.join(self.cgroup_root, "docker", container_id)):
+            if os.path.exists(os.path.join(path, "cpu.stat")):
+                return path
+        return None
+
+    @staticmethod
+    def read_cgroup(path):
+        """(usage_usec, memory.current, memory.max or None) of a container cgroup"""
+        with open(os.path.join(path, "cpu.stat")) as f:
+            usage = next(int(line.split()[1]) for line in f if line.startswith("usage_usec "))
+        with open(os.path.join(path, "memory.current")) as f:
+            memory = int(f.read())
+        with open(os.path.join(path, "memory.max")) as f:
+            limit = f.read().strip()
+        return usage, memory, None if limit == "max" else int(limit)
+
+    @staticmethod
+    def read_cpu_max(path):
+        with open(os.path.join(path, "cpu.max")) as f:
+            return f.read().strip()
+
+    @staticmethod
+    def write_cpu_max(path, value):
+        with open(os.path.join(path, "cpu.max"), "w") as f:
+            f.write(value)
+
+    def audit(self, action, record, state, **details):
+        entry = {
+            "time": datetime.now().isoformat(timespec="seconds"),
+            "action": action,
+            "container": record["container_name"],
+            "owner": record["user"],
+            "node": record["node"],
+            "level": self.LEVELS[state["level"]],
+            **details
+        }
+        print(f"Abuse monitor: {action} {record['container_name']} {details}")
+        try:
+            with open(self.audit_log, "a") as f:
+                f.write(json.dumps(entry) + "\n")
+        except OSError as e:
+            print(f"Failed to write abuse audit log: {e}")
+
+    async def notify(self, record, title, description):
+        embed = discord.Embed(title=title, description=description, color=0x2400ff)
+        await send_owner_dm(record, embed)
+
+    async def run(self):
+        while True:
+            try:
+                await self.check()
+            except Exception as e:
+                print(f"Abuse monitor check failed: {e}")
+            await asyncio.sleep(ABUSE_CHECK_INTERVAL)
+
+    async def check(self):
+        local_nodes = self.local_nodes()
+        records = [r for r in registry.all() if r["node"] in local_nodes]
+        paths = {}
+        for record in records:
+            name = record["container_name"]
+            if container_tracker.is_following(record["node"]) and container_tracker.state_of(name) not in ("running", "paused"):
+                self.forget(name, keep_state=True)
+                continue
+            path = await self.cgroup_for(name)
+            if path:
+                paths[name] = path
+        readings = await asyncio.to_thread(self.read_all, paths)
+        now = time.monotonic()
+        for record in records:
+            name = record["container_name"]
+            reading = readings.get(name)
+            if reading is None:
+                self.forget(name, keep_state=True)
+                continue
+            usage, memory, memory_max = reading
+            previous = self.samples.get(name)
+            self.samples[name] = (now, usage)
+            if previous is None or now <= previous[0]:
+                continue
+            cores = (usage - previous[1]) / 1e6 / (now - previous[0])
+            await self.evaluate(record, paths[name], cores, memory, memory_max, now)
+
+    def read_all(self, paths):
+        readings = {}
+        for name, path in paths.items():
+            try:
+                readings[name] = self.read_cgroup(path)
+            except (OSError, ValueError, StopIteration):
+                pass
+        return readings
+
+    def forget(self, container_name, keep_state=False):
+        self.samples.pop(container_name, None)
+        self.cgroups.pop(container_name, None)
+        state = self.states.get(container_name)
+        # A stopped or restarted container gets a fresh cgroup with Docker's own limits
+        if state and (not keep_state or state["level"] != 2):
+            self.states.pop(container_name, None)
+
+    def on_registry_change(self, event, record, changed):
+        if event == "remove":
+            self.forget(record["container_name"])
+
+    async def evaluate(self, record, path, cores, memory, memory_max, now):
+        name = record["container_name"]
+        state = self.states.get(name)
+        if state is None:
+            state = self.states[name] = await self.recover_state(record, path, now)
+        if state["level"] == 3:
+            return  # waiting for the stop to show up as a stopped container
+        if state["paused_until"] is not None:
+            if now >= state["paused_until"]:
+                try:
+                    await runtime.unpause(name)
+                except ContainerRuntimeError as e:
+                    print(f"Failed to unpause {name}: {e}")
+                    return
+                state.update(paused_until=None, over_since=None, under_since=now)
+                self.audit("unpause", record, state)
+            return
+
+        try:
+            allocated = float(record["cpu"])
+        except (TypeError, ValueError):
+            return
+        limit = allocated * (ABUSE_THROTTLE_FRACTION if state["level"] >= 1 else 1)
+        details = {"cpu_cores": round(cores, 3), "cpu_limit": round(limit, 3),
+                   "memory_bytes": memory, "memory_max": memory_max}
+
+        if cores < limit * ABUSE_CPU_THRESHOLD / 100:
+            state["over_since"] = None
+            state["under_since"] = state["under_since"] or now
+            if state["level"] and now - state["under_since"] >= ABUSE_COOLDOWN:
+                if state["saved_cpu_max"]:
+                    try:
+                        await asyncio.to_thread(self.write_cpu_max, path, state["saved_cpu_max"])
+                    except OSError as e:
+                        print(f"Failed to restore cpu.max of {name}: {e}")
+                        return
+                state.update(level=0, saved_cpu_max=None)
+                if record.get("abuse_stopped"):
+                    registry.update(name, abuse_stopped="")
+                self.audit("restore", record, state, **details)
+                await self.notify(record, "✅ VPS Restored", f"CPU usage of `{name}` has been normal for a while, so its full CPU allocation is back.")
+            return
+
+        state["under_since"] = None
+        state["over_since"] = state["over_since"] or now
+        if now - state["over_since"] < ABUSE_SUSTAIN:
+            return
+        state["over_since"] = None
+        if state["level"] == 0:
+            await self.throttle(record, path, state, allocated, details)
+        elif state["level"] == 1:
+            await self.pause(record, state, now, details)
+        else:
+            await self.stop(record, state, details)
+
+    async def recover_state(self, record, path, now):
+        """Escalation state for a VPS first seen by this run.
+
+        Throttles and pauses outlive the bot, so a cpu.max below the plan or a
+        paused container (not hibernated) is picked up where the previous run
+        left it; otherwise it would stay capped forever. A VPS that was stopped
+        for abuse comes back throttled.
+        """
+        state = {"level": 0, "over_since": None, "under_since": None, "saved_cpu_max": None, "paused_until": None}
+        try:
+            allocated = float(record["cpu"])
+            quota, period = (await asyncio.to_thread(self.read_cpu_max, path)).split()
+            throttled = quota != "max" and int(quota) < allocated * int(period) * 0.99
+        except (OSError, TypeError, ValueError):
+            return state
+        if throttled:
+            # Docker sets the plan's --cpus as "<cpus * period> <period>"
+            state.update(level=1, under_since=now, saved_cpu_max=f"{int(allocated * int(period))} {period}")
+            self.audit("recover_throttle", record, state, cpu_max=f"{quota} {period}")
+        elif record.get("abuse_stopped"):
+            await self.throttle(record, path, state, allocated, {"after_stop": True})
+        if container_tracker.state_of(record["container_name"]) == "paused" and not record.get("hibernation"):
+            state.update(level=2, paused_until=now + ABUSE_PAUSE_DURATION)
+            self.audit("recover_pause", record, state)
+        return state
+
+    async def throttle(self, record, path, state, allocated, details):
+        period = 100000
+        quota = max(1000, int(allocated * ABUSE_THROTTLE_FRACTION * period))
+        try:
+            saved = await asyncio.to_thread(self.read_cpu_max, path)
+            await asyncio.to_thread(self.write_cpu_max, path, f"{quota} {period}")
+        except OSError as e:
+            print(f"Failed to throttle {record['container_name']}: {e}")
+            return
+        state.update(level=1, saved_cpu_max=saved)
+        self.audit("throttle", record, state, cpu_max=f"{quota} {period}", **details)
+        await self.notify(
+            record, "⚠️ VPS CPU Throttled",
+            f"Your VPS `{record['container_name']}` has used over {ABUSE_CPU_THRESHOLD}% of its CPU allocation "
+            f"for {ABUSE_SUSTAIN // 60} minutes and is now limited to {ABUSE_THROTTLE_FRACTION:.0%} of it. "
+            f"If the load continues the VPS will be paused."
+        )
+
+    async def pause(self, record, state, now, details):
+        try:
+            await runtime.pause(record["container_name"])
+        except ContainerRuntimeError as e:
+            print(f"Failed to pause {record['container_name']}: {e}")
+            return
+        state.update(level=2, paused_until=now + ABUSE_PAUSE_DURATION)
+        self.audit("pause", record, state, pause_seconds=ABUSE_PAUSE_DURATION, **details)
+        await self.notify(
+            record, "⏸️ VPS Paused",
+            f"Your VPS `{record['container_name']}` kept its CPU at the throttled limit and has been paused for "
+            f"{ABUSE_PAUSE_DURATION // 60} minutes. If the load continues after that it will be stopped."
+        )
+
+    async def stop(self, record, state, details):
+        try:
+            await runtime.stop(record["container_name"])
+        except ContainerRuntimeError as e:
+            print(f"Failed to stop {record['container_name']}: {e}")
+            return
+        await tmate_sessions.forget(record["container_name"])
+        state.update(level=3)
+        # Persisted, so neither /start nor a bot restart gives the VPS a clean slate
+        registry.update(record["container_name"], abuse_stopped=str(int(time.time())))
+        self.audit("stop", record, state, **details)
+        await self.notify(
+            record, "🛑 VPS Stopped",
+            f"Your VPS `{record['container_name']}` kept using excessive CPU after being throttled and paused, "
+            f"so it has been stopped. It can be started again in {ABUSE_STOP_COOLDOWN // 60} minutes and will "
+            f"start throttled. Contact an admin if you believe this is a mistake."
+        )
+
+    @staticmethod
+    def cooldown_left(record):
+        """Seconds until a VPS stopped for abuse may be started again (0 if it may)"""
+        try:
+            stopped_at = int(record.get("abuse_stopped") or 0)
+        except ValueError:
+            return 0
+        return max(0, int(stopped_at + ABUSE_STOP_COOLDOWN - time.time())) if stopped_at else 0
+
+abuse_monitor = AbuseMonitor()
+
+# Idle VPS hibernation. CPU comes from the same cgroup v2 accounting the abuse
+# monitor reads, network bytes from the container's network namespace. A VPS
+# idle for HIBERNATE_IDLE_AFTER is paused or checkpointed, and resumed by
+# /start, /restart, /regen-ssh or the next forwarded connection.
+class IdleHibernator:
+    STATES = {"paused": "💤 Hibernated (paused)", "checkpointed": "💤 Hibernated (checkpointed)"}
+
+    def __init__(self, monitor, proc_root=PROC_ROOT):
+        self.monitor = monitor
+        self.proc_root = proc_root
+        self.samples = {}  # container name -> (monotonic time, usage_usec, network bytes, idle since)
+        self.locks = {}
+        self.task = None
+
+    def start(self):
+        if not HIBERNATE_IDLE_AFTER:
+            return
+        if not os.path.exists(os.path.join(self.monitor.cgroup_root, "cgroup.controllers")):
+            print(f"Idle hibernation disabled: no cgroup v2 hierarchy at {self.monitor.cgroup_root}")
+            return
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    def state_text(self, record):
+        return self.STATES.get(record.get("hibernation"))
+
+    def read_usage(self, path):
+        """(usage_usec, network bytes in + out) of a container cgroup"""
+        with open(os.path.join(path, "cpu.stat")) as f:
+            usage = next(int(line.split()[1]) for line in f if line.startswith("usage_usec "))
+        # Any process of the container sees its network namespace
+        with open(os.path.join(path, "cgroup.procs")) as f:
+            pid = int(f.readline())
+        network = 0
+        with open(os.path.join(self.proc_root, str(pid), "net", "dev")) as f:
+            for line in f:
+                interface, sep, counters = line.partition(":")
+                if not sep or interface.strip() == "lo":
+                    continue
+                fields = counters.split()
+                network += int(fields[0]) + int(fields[8])
+        return usage, network
+
+    def read_all(self, paths):
+        readings = {}
+        for name, path in paths.items():
+            try:
+                readings[name] = self.read_usage(path)
+            except (OSError, ValueError, IndexError, StopIteration):
+                pass
+        return readings
+
+    async def run(self):
+        while True:
+            try:
+                await self.check()
+            except Exception as e:
+                print(f"Idle hibernation check failed: {e}")
+            await asyncio.sleep(HIBERNATE_CHECK_INTERVAL)
+
+    def candidates(self):
+        local_nodes = self.monitor.local_nodes()
+        for record in registry.all():
+            name = record["container_name"]
+            if record["node"] not in local_nodes or record["hibernation"]:
+                continue
+            if container_tracker.is_following(record["node"]) and container_tracker.state_of(name) != "running":
+                continue
+            # Leave VPSes the abuse monitor is acting on, and ones serving supervised tunnels
+            if self.monitor.states.get(name, {}).get("level") or supervisor.for_container(name):
+                continue
+            yield record
+
+    async def check(self):
+        records = {r["container_name"]: r for r in self.candidates()}
+        for name in set(self.samples) - set(records):
+            self.samples.pop(name, None)
+        paths = {}
+        for name in records:
+            path = await self.monitor.cgroup_for(name)
+            if path:
+                paths[name] = path
+        readings = await asyncio.to_thread(self.read_all, paths)
+        now = time.monotonic()
+        for name, record in records.items():
+            reading = readings.get(name)
+            if reading is None:
+                self.samples.pop(name, None)
+                continue
+            usage, network = reading
+            previous = self.samples.get(name)
+            # Counters going backwards mean the container was restarted
+            if previous is None or now <= previous[0] or usage < previous[1] or network < previous[2]:
+                self.samples[name] = (now, usage, network, now)
+                continue
+            elapsed = now - previous[0]
+            busy = ((usage - previous[1]) / 1e4 / elapsed >= HIBERNATE_CPU_PERCENT
+                    or (network - previous[2]) / elapsed >= HIBERNATE_NET_RATE)
+            idle_since = now if busy else previous[3]
+            self.samples[name] = (now, usage, network, idle_since)
+            if now - idle_since >= HIBERNATE_IDLE_AFTER:
+                await self.hibernate(record)
+
+    async def hibernate(self, record):
+        name = record["container_name"]
+        state = "paused"
+        if HIBERNATE_MODE == 'checkpoint':
+            # CRIU cannot checkpoint established connections, so end the tmate session first
+            await tmate_sessions.forget(name)
+            try:
+                await runtime.exec_run(name, "tmate", "-S", TMATE_SOCKET, "kill-server", timeout=10)
+            except ContainerRuntimeError:
+                pass
+            try:
+                await runtime.checkpoint_delete(name, HIBERNATE_CHECKPOINT)
+            except ContainerRuntimeError:
+                pass
+            try:
+                await runtime.checkpoint_create(name, HIBERNATE_CHECKPOINT)
+                state = "checkpointed"
+            except ContainerRuntimeError as e:
+                print(f"Cannot checkpoint {name}, pausing it instead: {e}")
+        if state == "paused":
+            try:
+                await runtime.pause(name)
+            except ContainerRuntimeError as e:
+                print(f"Failed to hibernate {name}: {e}")
+                return
+        self.samples.pop(name, None)
+        registry.update(name, hibernation=state)
+        metrics.inc("dp_vps_hibernations_total", state=state)
+        print(f"Hibernated idle VPS {name} ({state})")
+        embed = discord.Embed(
+            title="💤 VPS Hibernated",
+            description=(
+                f"Your VPS `{name}` has been idle for {HIBERNATE_IDLE_AFTER // 3600} hours and has been hibernated "
+                f"to free resources. Use `/start {name}` to wake it up; forwarded ports wake it on the next connection."
+            ),
+            color=0x2400ff
+        )
+        await send_owner_dm(record, embed)
+
+    async def resume(self, container_name, restore=True):
+        """Wake a hibernated VPS; returns whether it was hibernated.
+
+        With restore=False a checkpointed VPS is left stopped and its checkpoint
+        discarded, for callers that are about to (re)start it anyway.
+        """
+        record = registry.get(container_name)
+        if not record or not record["hibernation"]:
+            return False
+        lock = self.locks.setdefault(container_name, asyncio.Lock())
+        async with lock:
+            record = registry.get(container_name)
+            if not record or not record["hibernation"]:
+                return False
+            state = record["hibernation"]
+            with metrics.timer("dp_vps_resume", state=state):
+                if state == "paused":
+                    try:
+                        await runtime.unpause(container_name)
+                    except ContainerRuntimeError as e:
+                        # Stopped or restarted since it was paused
+                        print(f"Cannot unpause {container_name}, starting it instead: {e}")
+                        if restore:
+                            await runtime.start(container_name)
+                else:
+                    if restore:
+                        try:
+                            await runtime.start(container_name, checkpoint=HIBERNATE_CHECKPOINT)
+                        except ContainerRuntimeError as e:
+                            print(f"Cannot restore {container_name} from its checkpoint, booting it instead: {e}")
+                            await runtime.start(container_name)
+                    try:
+                        await runtime.checkpoint_delete(container_name, HIBERNATE_CHECKPOINT)
+                    except ContainerRuntimeError:
+                        pass
+            registry.update(container_name, hibernation="")
+            # The tmate client lost its server connection while frozen
+            await tmate_sessions.forget(container_name)
+            print(f"Resumed hibernated VPS {container_name} ({state})")
+            return True
+
+    def on_registry_change(self, event, record, changed):
+        if event == "remove":
+            self.samples.pop(record["container_name"], None)
+            self.locks.pop(record["container_name"], None)
+
+hibernator = IdleHibernator(abuse_monitor)
+metrics.describe("dp_vps_hibernations_total", "counter", "Idle VPSes hibernated, by state")
+metrics.describe("dp_vps_resume_seconds", "histogram", "Time to wake a hibernated VPS")
+metrics.describe("dp_vps_hibernated", "gauge", "VPSes currently hibernated")
+metrics.add_collector(lambda: metrics.set("dp_vps_hibernated", sum(1 for r in registry.all() if r["hibernation"])))
+
+# Pressure-driven memory rebalancing on local nodes. The plan stays each VPS's
+# hard limit; its reservation follows its working set, or the whole plan while
+# it is under memory pressure itself, and reservations are fitted into host
+# memory by taking memory back from idle VPSes first. While the host is under
+# pressure, idle VPSes have their page cache squeezed out and new VPSes are
+# held back.
+class MemoryBalancer:
+    def __init__(self, monitor, host=host_metrics):
+        self.monitor = monitor
+        self.host = host
+        self.reservations = {}  # container name -> reservation in bytes last applied
+        self.squeezed = {}  # container name -> cgroup directory with a lowered memory.high
+        self.host_pressure = None  # last host memory pressure (some avg10, %); None without PSI
+        self.task = None
+
+    def start(self):
+        if not MEMORY_BALANCE_INTERVAL:
+            return
+        if self.read_host_pressure() is None or not os.path.exists(os.path.join(self.monitor.cgroup_root, "cgroup.controllers")):
+            print("Memory rebalancing disabled: no memory pressure (PSI) or cgroup v2 support")
+            return
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    def read_host_pressure(self):
+        pressure = self.host.read_pressure("memory")
+        self.host_pressure = pressure["some"]["avg10"] if pressure and "some" in pressure else None
+        return self.host_pressure
+
+    @staticmethod
+    def read_memory(path):
+        """(memory.current, working set, memory pressure some avg10) of a container cgroup"""
+        with open(os.path.join(path, "memory.current")) as f:
+            current = int(f.read())
+        inactive_file = 0
+        with open(os.path.join(path, "memory.stat")) as f:
+            for line in f:
+                key, value = line.split()
+                if key == "inactive_file":
+                    inactive_file = int(value)
+                    break
+        try:
+            with open(os.path.join(path, "memory.pressure")) as f:
+                pressure = parse_pressure(f.read()).get("some", {}).get("avg10", 0.0)
+        except OSError:
+            pressure = 0.0
+        # Inactive page cache is the first thing the kernel reclaims, so it is not counted as in use
+        return current, max(current - inactive_file, 0), pressure
+
+    def read_all(self, paths):
+        readings = {}
+        for name, path in paths.items():
+            try:
+                readings[name] = self.read_memory(path)
+            except (OSError, ValueError):
+                pass
+        return readings
+
+    @staticmethod
+    def write_memory_high(path, value):
+        with open(os.path.join(path, "memory.high"), "w") as f:
+            f.write(str(value))
+
+    async def run(self):
+        while True:
+            try:
+                await self.rebalance()
+            except Exception as e:
+                print(f"Memory rebalancing failed: {e}")
+            await asyncio.sleep(MEMORY_BALANCE_INTERVAL)
+
+    def candidates(self):
+        local_nodes = self.monitor.local_nodes()
+        for record in registry.all():
+            if record["node"] not in local_nodes or record["hibernation"]:
+                continue
+            if container_tracker.is_following(record["node"]) and container_tracker.state_of(record["container_name"]) != "running":
+                continue
+            yield record
+
+    @staticmethod
+    def targets(readings, plans, budget):
+        """(reservation in bytes per VPS, names of busy VPSes), fitted into the budget"""
+        floor = MEMORY_MIN_RESERVATION * 1024 ** 3
+        targets = {}
+        busy = set()
+        for name, (current, working_set, pressure) in readings.items():
+            if pressure >= MEMORY_BUSY_PSI:
+                busy.add(name)
+                targets[name] = plans[name]
+            else:
+                targets[name] = min(plans[name], max(floor, working_set * MEMORY_HEADROOM))
+        # Take memory back from idle VPSes first, then from everyone
+        for group in ([name for name in targets if name not in busy], list(targets)):
+            excess = sum(targets.values()) - budget
+            if excess <= 0:
+                break
+            spare = sum(max(targets[name] - floor, 0) for name in group)
+            if spare <= 0:
+                continue
+            share = min(excess / spare, 1)
+            for name in group:
+                targets[name] -= max(targets[name] - floor, 0) * share
+        return {name: int(target) for name, target in targets.items()}, busy
+
+    async def rebalance(self):
+        was_holding = self.host_pressure is not None and self.host_pressure >= MEMORY_ADMISSION_PSI
+        pressure = await asyncio.to_thread(self.read_host_pressure)
+        if was_holding and (pressure is None or pressure < MEMORY_ADMISSION_PSI):
+            warm_pool.refill()  # warm pools stop topping up while deploys are held back
+        meminfo = await asyncio.to_thread(self.host.read_meminfo)
+        budget = meminfo.get("MemTotal", 0) - MEMORY_HOST_RESERVE * 1024 ** 3
+        plans = {}
+        paths = {}
+        for record in self.candidates():
+            name = record["container_name"]
+            try:
+                plans[name] = int(float(record["ram"]) * 1024 ** 3)
+            except (TypeError, ValueError):
+                continue
+            path = await self.monitor.cgroup_for(name)
+            if path:
+                paths[name] = path
+        # A restarted container starts over with Docker's settings, so forget what was applied
+        for name in set(self.reservations) - set(paths):
+            self.reservations.pop(name, None)
+        readings = await asyncio.to_thread(self.read_all, paths)
+        targets, busy = self.targets(readings, plans, budget)
+
+        for name, target in targets.items():
+            previous = self.reservations.get(name)
+            if previous is not None and abs(target - previous) < plans[name] * MEMORY_UPDATE_STEP:
+                continue
+            try:
+                await runtime.update_reservation(name, target)
+            except ContainerRuntimeError as e:
+                print(f"Failed to update the memory reservation of {name}: {e}")
+                continue
+            self.reservations[name] = target
+            direction = "grant" if previous is None or target > previous else "reclaim"
+            metrics.inc("dp_vps_memory_rebalances_total", direction=direction)
+
+        # Squeezing stops at the working set: a lowered reservation already makes the kernel
+        # reclaim from idle VPSes first, this only pushes out their page cache sooner
+        squeeze = pressure is not None and pressure >= MEMORY_RECLAIM_PSI
+        for name, target in targets.items():
+            current, working_set, _ = readings[name]
+            high = max(target, working_set)
+            if squeeze and name not in busy and current > high:
+                try:
+                    await asyncio.to_thread(self.write_memory_high, paths[name], high)
+                    self.squeezed[name] = paths[name]
+                except OSError as e:
+                    print(f"Failed to squeeze {name}: {e}")
+        for name, path in list(self.squeezed.items()):
+            if squeeze and name in targets and name not in busy:
+                continue
+            try:
+                await asyncio.to_thread(self.write_memory_high, path, "max")
+            except OSError:
+                pass  # the cgroup is gone with the container
+            del self.squeezed[name]
+
+    def under_pressure(self, node):
+        """Whether new containers on the node should wait, from the last pressure reading"""
+        return (node in self.monitor.local_nodes() and self.host_pressure is not None
+                and self.host_pressure >= MEMORY_ADMISSION_PSI)
+
+    async def admit(self, node):
+        """Wait for host memory pressure to drop before a VPS is created on the node; False if it does not"""
+        if node not in self.monitor.local_nodes():
+            return True
+        deadline = time.monotonic() + MEMORY_ADMISSION_WAIT
+        while True:
+            pressure = await asyncio.to_thread(self.read_host_pressure)
+            if pressure is None or pressure < MEMORY_ADMISSION_PSI:
+                return True
+            if time.monotonic() >= deadline:
+                metrics.inc("dp_vps_deploys_held_total")
+                return False
+            await asyncio.sleep(5)
+
+    def summary(self):
+        if self.task is None or self.task.done():
+            return None
+        reserved = sum(self.reservations.values()) / 1024 ** 3
+        pressure = f"`{self.host_pressure:.1f}%`" if self.host_pressure is not None else "`N/A`"
+        return (f"Reserved: `{reserved:.1f}GB` across `{len(self.reservations)}` VPS | "
+                f"Squeezed: `{len(self.squeezed)}` | Host pressure: {pressure}")
+
+    def on_registry_change(self, event, record, changed):
+        if event == "remove":
+            self.reservations.pop(record["container_name"], None)
+            self.squeezed.pop(record["container_name"], None)
+
+memory_balancer = MemoryBalancer(abuse_monitor)
+metrics.describe("dp_vps_memory_rebalances_total", "counter", "Memory reservation changes, by direction")
+metrics.describe("dp_vps_deploys_held_total", "counter", "Deploys refused because host memory pressure stayed high")
+metrics.add_collector(lambda: metrics.set("dp_vps_memory_reserved_bytes", sum(memory_balancer.reservations.values())))
+metrics.add_collector(lambda: metrics.set("dp_vps_memory_squeezed", len(memory_balancer.squeezed)))
 
 # Tips navigation view
 class TipsView(View):
@@ -1126,12 +5454,14 @@ class TipsView(View):
         return embed
 
 @bot.tree.command(name="tips", description="💡 Shows useful tips for managing your VPS")
+@instrument_command
 async def tips_command(interaction: discord.Interaction):
     view = TipsView()
     embed = view.get_current_embed()
     await interaction.response.send_message(embed=embed, view=view)
 
 @bot.tree.command(name="delete", description="Delete your VPS instance")
+@instrument_command
 @app_commands.describe(container_name="The name of your container")
 async def delete_server(interaction: discord.Interaction, container_name: str):
     user = str(interaction.user.id)
@@ -1157,6 +5487,7 @@ async def delete_server(interaction: discord.Interaction, container_name: str):
     await interaction.response.send_message(embed=confirm_embed, view=view)
 
 @bot.tree.command(name="delete-all", description="🗑️ Admin: Delete all VPS instances")
+@instrument_command
 async def delete_all_servers(interaction: discord.Interaction):
     # Check if user is admin
     if interaction.user.id not in ADMIN_IDS:
@@ -1169,19 +5500,71 @@ async def delete_all_servers(interaction: discord.Interaction):
         return
     
     # Get count of all containers
-    containers = get_all_containers()
+    instance_count = len(registry)
     
     # Create confirmation dialog
     confirm_embed = discord.Embed(
         title="**⚠️ Confirm Mass Deletion**",
-        description=f"**Are you sure you want to delete ALL {len(containers)} VPS instances? This action cannot be undone.**",
+        description=f"**Are you sure you want to delete ALL {instance_count} VPS instances? This action cannot be undone.**",
         color=0x2400ff
     )
     
     view = ConfirmView(None, None, is_delete_all=True)
     await interaction.response.send_message(embed=confirm_embed, view=view)
 
+@bot.tree.command(name="extend", description="⏳ Admin: Extend or remove a VPS expiry")
+@instrument_command
+@app_commands.describe(
+    container_name="The name of the container",
+    duration="Time to add (e.g. 1d, 2h, 30m, 1y, 3M) or 'never' to remove the expiry"
+)
+async def extend_expiry(interaction: discord.Interaction, container_name: str, duration: str):
+    # Check if user is admin
+    if interaction.user.id not in ADMIN_IDS:
+        embed = discord.Embed(
+            title="❌ Access Denied",
+            description="You don't have permission to use this command.",
+            color=0x2400ff
+        )
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+        return
+
+    record = registry.get(container_name)
+    if not record:
+        embed = discord.Embed(
+            title="❌ Not Found",
+            description=f"No instance named `{container_name}` exists.",
+            color=0x2400ff
+        )
+        await interaction.response.send_message(embed=embed)
+        return
+
+    if duration.lower() == "never":
+        new_expiry = None
+    else:
+        seconds = parse_time_to_seconds(duration)
+        if not seconds:
+            embed = discord.Embed(
+                title="❌ Invalid Duration",
+                description="Use a duration like `1d`, `2h`, `30m`, `1y`, `3M`, or `never`.",
+                color=0x2400ff
+            )
+            await interaction.response.send_message(embed=embed, ephemeral=True)
+            return
+        # Extend from the current expiry, or from now if it has already passed
+        base = max(time.time(), parse_expiry(record["expiry"]) or 0)
+        new_expiry = datetime.fromtimestamp(base + seconds).strftime(EXPIRY_FORMAT)
+
+    registry.update(container_name, expiry=new_expiry or 'None')
+    embed = discord.Embed(
+        title="⏳ Expiry Updated",
+        description=f"VPS instance `{container_name}` now expires: `{new_expiry or 'Never'}`",
+        color=0x2400ff
+    )
+    await interaction.response.send_message(embed=embed)
+
 @bot.tree.command(name="cleanup", description="🧹 Admin: Clean up orphaned containers")
+@instrument_command
 async def cleanup_orphaned_containers(interaction: discord.Interaction):
     # Check if user is admin
     if interaction.user.id not in ADMIN_IDS:
@@ -1197,20 +5580,17 @@ async def cleanup_orphaned_containers(interaction: discord.Interaction):
     
     try:
         # Get all running containers
-        containers = subprocess.check_output(["docker", "ps", "-a", "--format", "{{.Names}}"]).decode().strip().split('\n')
-        containers = [c for c in containers if c and c.startswith('VPS_')]
-        
-        # Get containers from database
-        db_containers = []
-        if os.path.exists(database_file):
-            with open(database_file, 'r') as f:
-                for line in f:
-                    parts = line.strip().split('|')
-                    if len(parts) >= 2:
-                        db_containers.append(parts[1])
+        containers = await runtime.list_containers()
+        containers = [c for c in containers if c.get("Names") and c["Names"][0].lstrip("/").startswith('VPS_')]
         
         # Find orphaned containers
-        orphaned = [c for c in containers if c not in db_containers]
+        orphaned = []
+        for container in containers:
+            name = container["Names"][0].lstrip("/")
+            record = registry.get(name)
+            if not record or record["node"] != container["Node"]:
+                orphaned.append(name)
+                runtime.assign(name, container["Node"])
         
         if not orphaned:
             embed = discord.Embed(
@@ -1222,28 +5602,14 @@ async def cleanup_orphaned_containers(interaction: discord.Interaction):
             return
         
         # Clean up orphaned containers
-        cleaned_count = 0
-        for container in orphaned:
-            try:
-                subprocess.run(["docker", "stop", container], check=False, stderr=subprocess.DEVNULL)
-                subprocess.run(["docker", "rm", container], check=False, stderr=subprocess.DEVNULL)
-                cleaned_count += 1
-            except Exception:
-                pass
-        
-        embed = discord.Embed(
-            title="🧹 Cleanup Complete",
-            description=f"Successfully cleaned up {cleaned_count} orphaned containers.",
-            color=0x2400ff
+        message = await interaction.followup.send(
+            embed=build_teardown_embed("🧹 Cleaning Up Orphaned Containers", {}, len(orphaned)), wait=True
         )
-        if orphaned:
-            embed.add_field(
-                name="Cleaned Containers",
-                value="\n".join(orphaned[:10]) + ("..." if len(orphaned) > 10 else ""),
-                inline=False
-            )
-        
-        await interaction.followup.send(embed=embed)
+        progress = TeardownProgress(message, "🧹 Cleaning Up Orphaned Containers")
+        results = await teardown_containers(orphaned, on_progress=progress)
+        for name in orphaned:
+            runtime.release(name)
+        await progress.finish(results, len(orphaned), title="🧹 Cleanup Complete")
         
     except Exception as e:
         error_embed = discord.Embed(
@@ -1254,6 +5620,7 @@ async def cleanup_orphaned_containers(interaction: discord.Interaction):
         await interaction.followup.send(embed=error_embed)
 
 @bot.tree.command(name="debug", description="🔍 Admin: Debug user's VPS data")
+@instrument_command
 async def debug_user_data(interaction: discord.Interaction, user: discord.User = None):
     # Check if user is admin
     if interaction.user.id not in ADMIN_IDS:
@@ -1302,9 +5669,10 @@ async def debug_user_data(interaction: discord.Interaction, user: discord.User =
     await interaction.followup.send(embed=embed)
 
 @bot.tree.command(name="myvps", description="Show all your VPS instances in a modern embed")
+@instrument_command
 async def myvps(interaction: discord.Interaction):
     user = str(interaction.user.id)
-    servers = get_user_servers(user)
+    servers = registry.for_owner(user)
     await interaction.response.defer()
 
     if not servers:
@@ -1325,30 +5693,32 @@ async def myvps(interaction: discord.Interaction):
     )
     if bot.user.avatar:
         embed.set_thumbnail(url=bot.user.avatar.url)
-    for server in servers:
-        parts = server.split('|')
-        container_id = parts[1]
-        stats = get_container_stats(container_id)
-        ram = parts[3] if len(parts) > 3 else "?"
-        cpu = parts[4] if len(parts) > 4 else "?"
-        os_type = parts[6] if len(parts) > 6 else "?"
-        expiry = parts[7] if len(parts) > 7 else "?"
-        status_emoji = "🟢" if stats['status'] == "🟢 Running" else "🔴"
+    all_stats = await stats_cache.get_containers([r["container_name"] for r in servers])
+    for record in servers:
+        container_id = record["container_name"]
+        stats = all_stats[container_id]
+        ram = record["ram"]
+        cpu = record["cpu"]
+        os_type = record["os_type"]
+        expiry = record["expiry"]
+        hibernation = hibernator.state_text(record)
+        status_emoji = "💤" if hibernation else "🟢" if stats['status'] == "🟢 Running" else "🔴"
         embed.add_field(
             name=f"{status_emoji} `{container_id}`",
             value=(
                 f"**RAM:** `{ram}GB` | **CPU:** `{cpu}`\n"
                 f"**OS:** `{os_type}`\n"
-                f"**Status:** {stats['status']}\n"
+                f"**Status:** {hibernation or stats['status']}\n"
                 f"**Memory:** `{stats['memory']}` | **CPU:** `{stats['cpu']}`\n"
                 f"**Expires:** `{expiry}`"
             ),
             inline=False
         )
-    embed.set_footer(text="Powered by SaturnNode")
+    embed.set_footer(text=f"Powered by SaturnNode | {stats_cache.age_text()}")
     await interaction.followup.send(embed=embed)
 
 @bot.tree.command(name="sendvps", description="👑 Admin: Send VPS details to a user via DM")
+@instrument_command
 @app_commands.describe(
     ram="RAM in GB",
     cpu="CPU cores",
@@ -1410,26 +5780,31 @@ async def sendvps(
 
 
 @bot.tree.command(name="regen-ssh", description="🔄 Regenerate SSH session for your instance")
+@instrument_command
 @app_commands.describe(container_name="The name of your container")
 async def regen_ssh(interaction: discord.Interaction, container_name: str):
     await regen_ssh_command(interaction, container_name)
 
 @bot.tree.command(name="start", description="▶️ Start your VPS instance")
+@instrument_command
 @app_commands.describe(container_name="The name of your container")
 async def start(interaction: discord.Interaction, container_name: str):
     await start_server(interaction, container_name)
 
 @bot.tree.command(name="stop", description="⏹️ Stop your VPS instance")
+@instrument_command
 @app_commands.describe(container_name="The name of your container")
 async def stop(interaction: discord.Interaction, container_name: str):
     await stop_server(interaction, container_name)
 
 @bot.tree.command(name="restart", description="🔄 Restart your VPS instance")
+@instrument_command
 @app_commands.describe(container_name="The name of your container")
 async def restart(interaction: discord.Interaction, container_name: str):
     await restart_server(interaction, container_name)
 
 @bot.tree.command(name="ping", description="🏓 Check the bot's latency")
+@instrument_command
 async def ping(interaction: discord.Interaction):
     latency = round(bot.latency * 1000)
     embed = discord.Embed(
@@ -1485,6 +5860,7 @@ class RewardSelectView(View):
             else:
                 await interaction.response.send_message(f"❌ You need at least **2 boosts** to claim. Current: {boost_count}", ephemeral=True)
 @bot.tree.command(name="create", description="🎁 Request a VPS via Invite or Boost rewards")
+@instrument_command
 async def create(interaction: discord.Interaction):
     if not interaction.guild:
         await interaction.response.send_message("❌ You must use this in a server.", ephemeral=True)
@@ -1516,6 +5892,7 @@ async def send_vps_request(interaction, user, method, reward, count):
     await interaction.response.send_message("✅ Your VPS request has been sent for approval!", ephemeral=True)
 
 @bot.tree.command(name="help", description="❓ Shows the help message")
+@instrument_command
 async def help_command(interaction: discord.Interaction):
     embed = discord.Embed(
         title="**🌟 SaturnNode VPS Bot Help**",
@@ -1536,7 +5913,11 @@ async def help_command(interaction: discord.Interaction):
     embed.add_field(name="/list", value="List all your VPS instances", inline=True)
     embed.add_field(name="/delete <container_name>", value="Delete your VPS instance", inline=True)
     embed.add_field(name="/port-add <container_name> <port>", value="Forward a port", inline=True)
-    embed.add_field(name="/port-http <container_name> <port>", value="Forward HTTP traffic", inline=True)
+    embed.add_field(name="/port-http <container_name> <port> [hostname]", value="Forward HTTP traffic", inline=True)
+    embed.add_field(name="/port-http-remove <container_name> <hostname>", value="Remove an HTTP route", inline=True)
+    embed.add_field(name="/port-list", value="List your forwarded ports", inline=True)
+    embed.add_field(name="/tunnels", value="List your background tunnels", inline=True)
+    embed.add_field(name="/port-remove <container_name> <port>", value="Release a forwarded port", inline=True)
     embed.add_field(name="/ping", value="Check bot latency", inline=True)
     
     # Admin commands
@@ -1552,7 +5933,29 @@ async def help_command(interaction: discord.Interaction):
         embed.add_field(name="/delete-all", value="Delete all VPS instances", inline=True)
         embed.add_field(name="/cleanup", value="Clean up orphaned containers", inline=True)
         embed.add_field(name="/debug", value="Debug user's VPS data", inline=True)
+        embed.add_field(name="/extend", value="Extend or remove a VPS expiry", inline=True)
     
     await interaction.response.send_message(embed=embed)
 
-bot.run(TOKEN)
+# The registry and the singletons holding a reference to it are built here
+# rather than on import, so the bench and tests get the same wiring on a
+# registry of their own
+def init(new_registry=None):
+    """Open the registry (vps.db, importing database.txt once), build the
+    registry-bound singletons and subscribe every component to its changes"""
+    global registry, image_catalog, port_allocator, tcp_forwarder, http_proxy
+    registry = new_registry or VPSRegistry(registry_file, legacy_file=database_file)
+    image_catalog = ImageCatalog(runtime, registry)
+    port_allocator = PortAllocator(registry)
+    tcp_forwarder = TCPForwarder(port_allocator)
+    http_proxy = HTTPProxy(registry)
+    for listener in (on_registry_change_usage, supervisor.on_registry_change, port_allocator.on_registry_change,
+                     tcp_forwarder.on_registry_change, http_proxy.on_registry_change, presence.on_registry_change,
+                     expiry_scheduler.on_registry_change, abuse_monitor.on_registry_change,
+                     hibernator.on_registry_change, memory_balancer.on_registry_change):
+        registry.add_listener(listener)
+    return registry
+
+if __name__ == "__main__":
+    init()
+    bot.run(TOKEN)